@@ -0,0 +1,78 @@
+"""
+Deterministic stand-in for Gemini used by the offline benchmarks.
+Returns canned code chosen by keywords in the question, optionally after
+an injected delay to mimic network latency.
+"""
+
+import re
+import time
+
+# (keyword, code) pairs checked in order against the question text
+DEFAULT_RULES = [
+    ("average", """result = dataframe.groupby('workclass')['hours-per-week'].mean().to_dict()
+explanation = 'Average hours per week by workclass.'"""),
+    ("percentage", """subset = dataframe[dataframe['education'] == 'Bachelors']
+result = round(100 * (subset['income'] == '>50K').mean(), 2)
+explanation = 'Share of Bachelors earning more than 50K.'"""),
+    ("how many", """result = int((dataframe['native-country'] == 'United-States').sum())
+explanation = 'Number of individuals from the United States.'"""),
+    ("highest", """result = dataframe[dataframe['income'] == '>50K']['occupation'].value_counts().idxmax()
+explanation = 'Occupation with most individuals earning more than 50K.'"""),
+    ("plot", """import matplotlib.pyplot as plt
+fig, ax = plt.subplots()
+dataframe['age'].hist(ax=ax, bins=30)
+buffer = io.BytesIO()
+plt.savefig(buffer, format='png', bbox_inches='tight', dpi=80)
+buffer.seek(0)
+image_bytes = buffer.getvalue()
+plt.close()
+result = 'Histogram of age'
+explanation = 'Age distribution.'"""),
+    ("table", """result = dataframe.head(500)
+explanation = 'First 500 rows.'"""),
+]
+
+DEFAULT_CODE = """result = dataframe.describe()
+explanation = 'Summary statistics.'"""
+
+
+class FakeLLM:
+    """Callable LLM backend: fake(prompt, model_name) -> response text"""
+
+    def __init__(self, rules=None, default=DEFAULT_CODE, latency_s: float = 0.0):
+        self.rules = rules or DEFAULT_RULES
+        self.default = default
+        self.latency_s = latency_s
+        self.calls = 0
+
+    def __call__(self, prompt: str, model_name: str) -> str:
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if "\nQuestions:\n" in prompt:
+            return self._batch_program(prompt)
+        question = _extract_question(prompt)
+        return "```python\n" + self._code_for(question) + "\n```"
+
+    def _code_for(self, question: str) -> str:
+        lowered = question.lower()
+        for keyword, code in self.rules:
+            if keyword in lowered:
+                return code
+        return self.default
+
+    def _batch_program(self, prompt: str) -> str:
+        block = prompt.split("\nQuestions:\n", 1)[1].split("\n\n", 1)[0]
+        functions = []
+        for line in block.splitlines():
+            m = re.match(r"(\d+)\. (.*)", line)
+            if not m:
+                continue
+            body = "\n".join("    " + l for l in self._code_for(m.group(2)).splitlines())
+            functions.append(f"def answer_{m.group(1)}():\n{body}\n    return result, explanation\n")
+        return "```python\n" + "\n".join(functions) + "```"
+
+
+def _extract_question(prompt: str) -> str:
+    m = re.search(r"^Question: (.*)$", prompt, re.MULTILINE)
+    return m.group(1) if m else ""
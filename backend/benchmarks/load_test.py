@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+In-process load generator for the InsightEngine backend.
+
+Drives the ASGI app directly through httpx's ASGITransport (no sockets, no
+server) with a number of concurrent clients issuing a weighted mix of
+requests. The LLM is the benchmark fake with an injected delay, which is a
+blocking sleep just like the real Gemini client call. For each concurrency
+level it reports throughput and p50/p95/p99 latency per endpoint, the
+event-loop lag observed while the load was running and the process CPU
+utilisation (close to 100% of one core means the GIL is the ceiling).
+Rejections by the query scheduler (429) are counted as errors and also
+reported separately.
+
+Usage (from backend/):
+    python benchmarks/load_test.py --concurrency 1 4 16 --requests 200
+    python benchmarks/load_test.py --mix query=6,fast=2,batch=1,upload=1 --llm-latency-ms 800
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Every question goes through the LLM, not the cache of earlier paraphrases
+os.environ.setdefault('QUESTION_CACHE', '0')
+
+import httpx
+
+from fake_llm import FakeLLM
+from run_benchmarks import QUERY_QUESTIONS, make_adult_like, log, _percentile, git_commit
+
+# Answered by the fast path, never reach the LLM
+FAST_QUESTIONS = [
+    "How many rows are there?",
+    "What are the columns?",
+    "What is the shape of the data?",
+    "How many missing values are in each column?",
+]
+
+DEFAULT_MIX = "query=6,fast=2,batch=1,upload=1"
+LAG_INTERVAL_S = 0.01
+
+
+def parse_mix(spec: str):
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in REQUEST_KINDS:
+            raise SystemExit(f"Unknown request kind '{name}', expected one of {sorted(REQUEST_KINDS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def _query(client, rng, payloads):
+    return await client.post('/api/query', json={'question': rng.choice(QUERY_QUESTIONS),
+                                                 'session_id': f"load-{rng.randrange(8)}"})
+
+
+async def _fast(client, rng, payloads):
+    return await client.post('/api/query', json={'question': rng.choice(FAST_QUESTIONS)})
+
+
+async def _batch(client, rng, payloads):
+    return await client.post('/api/query/batch', json={'questions': rng.sample(QUERY_QUESTIONS, 3)})
+
+
+async def _upload(client, rng, payloads):
+    rows, payload = rng.choice(payloads)
+    return await client.post('/api/upload', files={'file': (f"load_{rows}.csv", payload, 'text/csv')})
+
+
+REQUEST_KINDS = {'query': _query, 'fast': _fast, 'batch': _batch, 'upload': _upload}
+
+
+async def _monitor_loop_lag(samples, stop):
+    """Measure how late the event loop wakes a sleeping task"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL_S)
+        samples.append((time.perf_counter() - start - LAG_INTERVAL_S) * 1000)
+
+
+def _latency_summary(samples_ms):
+    samples = sorted(samples_ms)
+    if not samples:
+        return {}
+    return {
+        'p50_ms': round(_percentile(samples, 50), 3),
+        'p95_ms': round(_percentile(samples, 95), 3),
+        'p99_ms': round(_percentile(samples, 99), 3),
+        'max_ms': round(samples[-1], 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+    }
+
+
+async def run_level(app, concurrency, total_requests, mix, payloads, seed):
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    latencies = {kind: [] for kind in kinds}
+    errors = {kind: 0 for kind in kinds}
+    rejected = {kind: 0 for kind in kinds}
+    remaining = [total_requests]
+    lag_samples = []
+    stop = asyncio.Event()
+
+    async def worker(worker_id, client):
+        rng = random.Random(seed * 1000 + worker_id)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            kind = rng.choices(kinds, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await REQUEST_KINDS[kind](client, rng, payloads)
+                ok = response.status_code == 200
+                if response.status_code == 429:  # scheduler backpressure
+                    rejected[kind] += 1
+            except Exception:
+                ok = False
+            latencies[kind].append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors[kind] += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://loadtest', timeout=None) as client:
+        monitor = asyncio.create_task(_monitor_loop_lag(lag_samples, stop))
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(worker(i, client) for i in range(concurrency)))
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        stop.set()
+        await monitor
+
+    endpoints = {}
+    for kind in kinds:
+        if latencies[kind]:
+            endpoints[kind] = {'requests': len(latencies[kind]), 'errors': errors[kind], 'rejected': rejected[kind],
+                               'throughput_rps': round(len(latencies[kind]) / wall, 2),
+                               **_latency_summary(latencies[kind])}
+    completed = sum(len(samples) for samples in latencies.values())
+    return {
+        'concurrency': concurrency,
+        'requests': completed,
+        'errors': sum(errors.values()),
+        'rejected': sum(rejected.values()),
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(completed / wall, 2),
+        'cpu_utilisation': round(cpu / wall, 3),
+        'latency': _latency_summary([s for samples in latencies.values() for s in samples]),
+        'endpoints': endpoints,
+        'event_loop_lag': {'samples': len(lag_samples), **_latency_summary(lag_samples)},
+    }
+
+
+async def run(app, args, mix, payloads):
+    levels = []
+    for concurrency in args.concurrency:
+        result = await run_level(app, concurrency, args.requests, mix, payloads, args.seed)
+        levels.append(result)
+        log(f"  c={concurrency}: {result['throughput_rps']} req/s, p50 {result['latency'].get('p50_ms')} ms, "
+            f"p99 {result['latency'].get('p99_ms')} ms, loop lag p99 {result['event_loop_lag'].get('p99_ms')} ms, "
+            f"errors {result['errors']} ({result['rejected']} rejected with 429)")
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=200, help='Requests issued per concurrency level')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Weighted request mix (default {DEFAULT_MIX})")
+    parser.add_argument('--rows', type=int, default=20_000, help='Rows in the dataset queried')
+    parser.add_argument('--upload-rows', type=int, nargs='+', default=[5_000, 50_000],
+                        help='Dataset sizes used by upload requests')
+    parser.add_argument('--llm-latency-ms', type=float, default=200.0, help='Delay injected into each fake LLM call')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write results JSON to this file')
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    mix = parse_mix(args.mix)
+    os.chdir(tempfile.mkdtemp(prefix='insightengine-load-'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main as app_main
+        from app.utils.llm_client import set_llm_backend
+    set_llm_backend(FakeLLM(latency_s=args.llm_latency_ms / 1000))
+
+    # Upload requests re-upload the same schema, so queries stay valid throughout
+    payloads = [(rows, make_adult_like(rows, seed=rows).to_csv(index=False).encode()) for rows in args.upload_rows]
+    dataset = make_adult_like(args.rows, seed=args.seed).to_csv(index=False).encode()
+
+    async def setup_and_run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app_main.app), base_url='http://loadtest') as client:
+            response = await client.post('/api/upload', files={'file': ('adult.csv', dataset, 'text/csv')})
+            if response.status_code != 200:
+                raise SystemExit(f"Initial upload failed: {response.text}")
+        return await run(app_main.app, args, mix, payloads)
+
+    log(f"Load test: mix {mix}, {args.requests} requests per level, LLM latency {args.llm_latency_ms:g} ms")
+    # The app prints progress to stdout; keep it out of the JSON report
+    with contextlib.redirect_stdout(io.StringIO()):
+        levels = asyncio.run(setup_and_run())
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'mix': mix,
+            'rows': args.rows,
+            'upload_rows': args.upload_rows,
+            'llm_latency_ms': args.llm_latency_ms,
+            'requests_per_level': args.requests,
+        },
+        'levels': levels,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        log(f"\nResults written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
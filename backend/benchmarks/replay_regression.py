@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Deterministic regression runs of the adult-dataset acceptance questions.
+
+Record once against Gemini (needs GEMINI_API_KEY and network):
+    python benchmarks/replay_regression.py --record
+
+Then replay offline as often as needed; every run appends a summary line
+(latency, attempts, correctness against the recorded answers, cassette
+misses) to the history file so results can be tracked over time:
+    python benchmarks/replay_regression.py --runs 5
+
+The questions come from tests/test_adult_questions.py. The dataset is
+backend/data/adult_dataset.csv when present, otherwise a seeded synthetic
+stand-in (answers are only comparable between runs on the same dataset).
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'src'))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'tests'))
+sys.path.insert(0, BENCH_DIR)
+# Every question goes through the LLM, not the cache of earlier paraphrases
+os.environ.setdefault('QUESTION_CACHE', '0')
+
+from test_adult_questions import ADULT_QUESTIONS
+from run_benchmarks import make_adult_like, log
+
+DEFAULT_CASSETTE = os.path.join(BENCH_DIR, 'cassettes', 'adult_questions.json')
+DEFAULT_DATASET = os.path.join(BACKEND_DIR, 'data', 'adult_dataset.csv')
+
+
+def answer_digest(result) -> str:
+    return hashlib.sha256(json.dumps(result, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def load_dataset_bytes(path: str):
+    if path and os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read(), os.path.basename(path)
+    log(f"Dataset {path} not found, using the synthetic adult-like dataset")
+    return make_adult_like(30_000, seed=42).to_csv(index=False).encode(), 'adult_dataset.csv'
+
+
+def run_once(client, questions):
+    outcomes = []
+    for question in questions:
+        start = time.perf_counter()
+        response = client.post('/api/query', json={'question': question, 'session_id': 'replay'})
+        latency_ms = (time.perf_counter() - start) * 1000
+        data = response.json() if response.content else {}
+        success = response.status_code == 200 and 'result' in data
+        outcomes.append({
+            'question': question,
+            'success': success,
+            'latency_ms': round(latency_ms, 3),
+            'attempts': data.get('attempt'),
+            'digest': answer_digest(data.get('result')) if success else None,
+            'result': data.get('result') if success else None,
+            'error': None if success else (data.get('error') or data.get('detail') or response.text[:300]),
+        })
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cassette', default=DEFAULT_CASSETTE)
+    parser.add_argument('--dataset', default=DEFAULT_DATASET)
+    parser.add_argument('--record', action='store_true', help='Record missing responses from Gemini and save expected answers')
+    parser.add_argument('--fake', action='store_true', help='Record from the benchmark fake LLM instead of Gemini')
+    parser.add_argument('--runs', type=int, default=1)
+    parser.add_argument('--history', default=None, help='JSONL file to append run summaries to (default: <cassette>.history.jsonl)')
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    answers_path = os.path.splitext(args.cassette)[0] + '.answers.json'
+    history_path = args.history or os.path.splitext(args.cassette)[0] + '.history.jsonl'
+    payload, filename = load_dataset_bytes(args.dataset)
+
+    os.chdir(tempfile.mkdtemp(prefix='insightengine-replay-'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main as app_main
+        from app.utils.llm_client import set_llm_backend, gemini_backend
+        from app.utils.llm_cassette import Cassette
+    from fastapi.testclient import TestClient
+
+    if args.record:
+        if args.fake:
+            from fake_llm import FakeLLM
+            inner = FakeLLM()
+        else:
+            inner = gemini_backend()
+        cassette = Cassette(args.cassette, 'auto', inner)
+    else:
+        if not os.path.exists(args.cassette):
+            sys.exit(f"Cassette {args.cassette} does not exist; run with --record first")
+        cassette = Cassette(args.cassette, 'replay')
+    set_llm_backend(cassette)
+
+    client = TestClient(app_main.app)
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = client.post('/api/upload', files={'file': (filename, payload, 'text/csv')})
+    if response.status_code != 200:
+        sys.exit(f"Upload failed: {response.text}")
+
+    expected = {}
+    if os.path.exists(answers_path) and not args.record:
+        with open(answers_path) as f:
+            expected = json.load(f)
+
+    runs = []
+    for run in range(args.runs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            outcomes = run_once(client, ADULT_QUESTIONS)
+        runs.append(outcomes)
+        for outcome in outcomes:
+            want = expected.get(outcome['question'])
+            outcome['matches_expected'] = None if want is None else outcome['digest'] == want['digest']
+        log(f"Run {run + 1}: " + ", ".join(
+            f"{'ok' if o['success'] else 'FAIL'}{'' if o['matches_expected'] in (None, True) else ' (changed)'}"
+            f" {o['latency_ms']:.0f}ms" for o in outcomes))
+
+    if args.record:
+        os.makedirs(os.path.dirname(os.path.abspath(answers_path)), exist_ok=True)
+        with open(answers_path, 'w') as f:
+            json.dump({o['question']: {'digest': o['digest'], 'result': o['result']}
+                       for o in runs[-1] if o['success']}, f, indent=1, default=str)
+        log(f"Expected answers written to {answers_path}")
+
+    per_question = []
+    for index, question in enumerate(ADULT_QUESTIONS):
+        samples = [run[index] for run in runs]
+        latencies = sorted(o['latency_ms'] for o in samples)
+        per_question.append({
+            'question': question,
+            'success_rate': sum(o['success'] for o in samples) / len(samples),
+            'latency_p50_ms': round(statistics.median(latencies), 3),
+            'latency_max_ms': latencies[-1],
+            'attempts': [o['attempts'] for o in samples],
+            'retries': sum(max((o['attempts'] or 1) - 1, 0) for o in samples),
+            'correct': [o['matches_expected'] for o in samples],
+            'errors': sorted({o['error'] for o in samples if o['error']}),
+        })
+
+    summary = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'mode': 'record' if args.record else 'replay',
+        'runs': args.runs,
+        'cassette': cassette.stats(),
+        'success_rate': sum(q['success_rate'] for q in per_question) / len(per_question),
+        'total_retries': sum(q['retries'] for q in per_question),
+        'incorrect': sum(1 for q in per_question for c in q['correct'] if c is False),
+        'questions': per_question,
+    }
+    with open(history_path, 'a') as f:
+        f.write(json.dumps(summary, default=str) + '\n')
+    print(json.dumps(summary, indent=2, default=str))
+
+    if summary['incorrect'] or summary['cassette']['misses']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the InsightEngine backend.
+
+Runs in-process against the FastAPI app with a fake LLM returning canned
+code, so no server, network or Gemini key is needed. Covers upload
+throughput (CSV/JSON/Excel, including sizes around the engine planner's
+pandas limit, and re-uploads served from the ingest cache), query latency (with and without the cache of earlier
+paraphrases), refreshing pinned analyses after an append, make_json_serializable cost, response
+bytes on the wire and encoding CPU per format and compression, memory store saves and SQLite history writes.
+
+Usage (from backend/):
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json   # diff against a previous run
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from fake_llm import FakeLLM
+
+QUERY_QUESTIONS = [
+    "What is the average hours per week by workclass?",
+    "What percentage of Bachelors have an income greater than 50K?",
+    "How many individuals are from the United-States?",
+    "Which occupation has the highest number of individuals with income greater than 50K?",
+    "Show me a table of the first rows",
+    "Describe the data",
+]
+
+
+def make_adult_like(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic dataset shaped like the UCI adult dataset"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "age": rng.integers(17, 90, rows),
+        "workclass": rng.choice(["Private", "Self-emp-not-inc", "Local-gov", "State-gov", "Federal-gov"], rows),
+        "fnlwgt": rng.integers(10_000, 1_500_000, rows),
+        "education": rng.choice(["Bachelors", "HS-grad", "Masters", "Some-college", "Doctorate"], rows),
+        "education-num": rng.integers(1, 16, rows),
+        "marital-status": rng.choice(["Married-civ-spouse", "Never-married", "Divorced", "Widowed"], rows),
+        "occupation": rng.choice(["Tech-support", "Craft-repair", "Sales", "Exec-managerial", "Prof-specialty"], rows),
+        "sex": rng.choice(["Male", "Female"], rows),
+        "capital-gain": rng.integers(0, 100_000, rows) * (rng.random(rows) < 0.1),
+        "hours-per-week": rng.integers(1, 99, rows),
+        "native-country": rng.choice(["United-States", "Mexico", "India", "Germany", "Canada"], rows, p=[0.8, 0.08, 0.05, 0.04, 0.03]),
+        "income": rng.choice(["<=50K", ">50K"], rows, p=[0.76, 0.24]),
+    })
+
+
+def log(message: str):
+    print(message, file=sys.stderr)
+
+
+def summarize(samples_ms, **extra):
+    samples = sorted(samples_ms)
+    result = {
+        "unit": "ms",
+        "n": len(samples),
+        "mean": round(statistics.fmean(samples), 3),
+        "p50": round(_percentile(samples, 50), 3),
+        "p95": round(_percentile(samples, 95), 3),
+        "min": round(samples[0], 3),
+        "max": round(samples[-1], 3),
+    }
+    result.update(extra)
+    return result
+
+
+def _percentile(sorted_samples, pct):
+    if len(sorted_samples) == 1:
+        return sorted_samples[0]
+    k = (len(sorted_samples) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (k - lower)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def encode(df: pd.DataFrame, fmt: str) -> bytes:
+    if fmt == "csv":
+        return df.to_csv(index=False).encode()
+    if fmt == "json":
+        return df.to_json(orient="records").encode()
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def rows_for_size(size_mb: float, fmt: str) -> int:
+    probe = make_adult_like(2_000)
+    bytes_per_row = len(encode(probe, fmt)) / len(probe)
+    return max(int(size_mb * 1024 * 1024 / bytes_per_row), 10)
+
+
+def bench_uploads(client, data_handler, engine_planner, args, results):
+    production_threshold = engine_planner.MAX_PANDAS_MB
+    engine_planner.MAX_PANDAS_MB = threshold = args.threshold_mb
+    # Repeats upload the same bytes: measure parsing, not ingest cache hits
+    data_handler.ingest_cache.enabled = False
+    try:
+        _bench_uploads(client, threshold, args, results)
+    finally:
+        data_handler.ingest_cache.enabled = True
+    try:
+        _bench_cached_uploads(client, args, results)
+    finally:
+        engine_planner.MAX_PANDAS_MB = production_threshold
+
+
+def _bench_uploads(client, threshold, args, results):
+    cases = []
+    for fmt in ("csv", "json"):
+        for size_mb in args.sizes_mb:
+            cases.append((fmt, size_mb))
+        # Around the pandas limit, which applies to the estimated in-memory size
+        cases.append((fmt, threshold * 0.9))
+        cases.append((fmt, threshold * 1.1))
+    for size_mb in args.excel_sizes_mb:
+        cases.append(("xlsx", size_mb))
+
+    for fmt, size_mb in cases:
+        df = make_adult_like(rows_for_size(size_mb, fmt))
+        payload = encode(df, fmt)
+        actual_mb = len(payload) / 1024 / 1024
+        mime = {"csv": "text/csv", "json": "application/json"}.get(fmt, "application/octet-stream")
+
+        plans = []
+
+        def upload():
+            response = client.post("/api/upload", files={"file": (f"bench.{fmt}", payload, mime)})
+            assert response.status_code == 200, response.text
+            plans.append(response.json()["engine_plan"])
+
+        samples = timed(upload, args.repeat)
+        engine = plans[-1]["strategy"]
+        name = f"upload.{fmt}.{size_mb:g}mb"
+        results[name] = summarize(samples, rows=len(df), size_mb=round(actual_mb, 2), engine=engine,
+                                  throughput_mb_s=round(actual_mb / (statistics.median(samples) / 1000), 2))
+        log(f"  {name}: p50 {results[name]['p50']} ms ({engine}, {results[name]['throughput_mb_s']} MB/s)")
+
+
+def _bench_cached_uploads(client, args, results):
+    for fmt in ("csv", "json"):
+        size_mb = max(args.sizes_mb)
+        df = make_adult_like(rows_for_size(size_mb, fmt))
+        payload = encode(df, fmt)
+        mime = "text/csv" if fmt == "csv" else "application/json"
+
+        def upload():
+            response = client.post("/api/upload", files={"file": (f"bench.{fmt}", payload, mime)})
+            assert response.status_code == 200 and response.json().get("ingest_cache") == "hit", response.text
+
+        # The first upload converts and stores the file; the timed ones map it
+        client.post("/api/upload", files={"file": (f"bench.{fmt}", payload, mime)})
+        samples = timed(upload, args.repeat)
+        name = f"upload.{fmt}.{size_mb:g}mb.cached"
+        results[name] = summarize(samples, rows=len(df), size_mb=round(len(payload) / 1024 / 1024, 2))
+        log(f"  {name}: p50 {results[name]['p50']} ms")
+
+
+def bench_queries(client, args, results):
+    df = make_adult_like(args.query_rows)
+    response = client.post("/api/upload", files={"file": ("adult.csv", df.to_csv(index=False).encode(), "text/csv")})
+    assert response.status_code == 200, response.text
+
+    for question in QUERY_QUESTIONS:
+        def ask():
+            response = client.post("/api/query", json={"question": question})
+            assert response.status_code == 200 and "result" in response.json(), response.text
+
+        samples = timed(ask, args.repeat)
+        name = "query." + "_".join(question.lower().split()[:4]).strip("?")
+        results[name] = summarize(samples, rows=args.query_rows)
+        log(f"  {name}: p50 {results[name]['p50']} ms")
+
+    def ask_batch():
+        response = client.post("/api/query/batch", json={"questions": QUERY_QUESTIONS})
+        assert response.status_code == 200, response.text
+
+    results["query.batch"] = summarize(timed(ask_batch, args.repeat), questions=len(QUERY_QUESTIONS))
+    log(f"  query.batch: p50 {results['query.batch']['p50']} ms")
+
+
+PARAPHRASES = [
+    ("What is the average hours per week by workclass?", "what's the mean hours-per-week for each work class"),
+    ("How many individuals are from the United-States?", "number of people from United States"),
+]
+
+
+def bench_paraphrases(client, llm_agent, args, results):
+    """A paraphrase of an answered question, served from the question cache instead of the LLM"""
+    llm_agent.question_cache.enabled = True
+    try:
+        for question, paraphrase in PARAPHRASES:
+            llm_agent.question_cache.clear()
+            response = client.post("/api/query", json={"question": question})
+            assert response.status_code == 200, response.text
+
+            def ask():
+                response = client.post("/api/query", json={"question": paraphrase})
+                assert response.status_code == 200 and response.json().get("question_cache"), response.text
+
+            name = "query.paraphrase." + "_".join(paraphrase.lower().split()[:3]).strip("?")
+            results[name] = summarize(timed(ask, args.repeat), rows=args.query_rows)
+            log(f"  {name}: p50 {results[name]['p50']} ms")
+    finally:
+        llm_agent.question_cache.enabled = False
+
+
+def bench_materialized(client, args, results):
+    """Pinned aggregates after an append: merged from the new rows vs their programs re-run on all rows"""
+    from app.utils.materialized import analysis_store, plan_program
+
+    df = make_adult_like(args.query_rows)
+    response = client.post("/api/upload", files={"file": ("adult.csv", df.to_csv(index=False).encode(), "text/csv")})
+    assert response.status_code == 200, response.text
+    for question in QUERY_QUESTIONS[:4]:
+        response = client.post("/api/analyses", json={"question": question})
+        assert response.status_code == 200 and response.json()["incremental"], response.text
+    analyses = analysis_store.all()
+    delta = make_adult_like(max(args.query_rows // 100, 1), seed=1)
+
+    def merge_delta():
+        for analysis in analyses:
+            plan = plan_program(analysis["code"])
+            plan.merge(analysis["state"], plan.partial(delta))
+
+    def rerun_all():
+        for analysis in analyses:
+            namespace = {"dataframe": df, "pd": pd, "np": np}
+            exec(analysis["code"], namespace, namespace)
+
+    results["materialized.incremental"] = summarize(timed(merge_delta, args.repeat), analyses=len(analyses),
+                                                    appended_rows=len(delta))
+    results["materialized.full_rerun"] = summarize(timed(rerun_all, args.repeat), analyses=len(analyses),
+                                                   rows=len(df))
+    for name in ("materialized.incremental", "materialized.full_rerun"):
+        log(f"  {name}: p50 {results[name]['p50']} ms")
+
+    csv = delta.to_csv(index=False).encode()
+
+    def append():
+        response = client.post("/api/upload", files={"file": ("more.csv", csv, "text/csv")}, data={"mode": "append"})
+        assert response.status_code == 200 and response.json()["analyses"]["incremental"] == len(analyses), \
+            response.text
+
+    results["upload.append"] = summarize(timed(append, args.repeat), appended_rows=len(delta))
+    log(f"  upload.append: p50 {results['upload.append']['p50']} ms")
+    for analysis in analyses:
+        analysis_store.delete(analysis["id"])
+
+
+def bench_serialization(llm_agent, args, results):
+    df = make_adult_like(args.serialize_rows)
+    cases = {
+        "serialize.dataframe": df,
+        "serialize.series": df["hours-per-week"],
+        "serialize.groupby_result": df.groupby(["workclass", "sex"])["hours-per-week"].mean(),
+        "serialize.numpy_dict": {f"k{i}": np.float64(i) for i in range(10_000)},
+    }
+    for name, obj in cases.items():
+        results[name] = summarize(timed(lambda: llm_agent.make_json_serializable(obj), args.repeat),
+                                  rows=args.serialize_rows)
+        log(f"  {name}: p50 {results[name]['p50']} ms")
+
+
+WIRE_QUESTIONS = {
+    "table": "Show me a table of the first rows",
+    "plot": "Plot the age distribution",
+    "groupby": "What is the average hours per week by workclass?",
+}
+WIRE_FORMATS = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def bench_wire_formats(client, args, results):
+    """Response bytes on the wire and latency per question, format and compression, plus encoding CPU"""
+    from app.utils import negotiation
+
+    df = make_adult_like(args.query_rows)
+    response = client.post("/api/upload", files={"file": ("adult.csv", df.to_csv(index=False).encode(), "text/csv")})
+    assert response.status_code == 200, response.text
+
+    for label, question in WIRE_QUESTIONS.items():
+        for fmt, accept in WIRE_FORMATS.items():
+            for encoding in ("identity", "gzip", "zstd"):
+                sizes = []
+
+                def ask():
+                    response = client.post("/api/query", json={"question": question},
+                                           headers={"Accept": accept, "Accept-Encoding": encoding})
+                    assert response.status_code == 200, response.text
+                    sizes.append(response.num_bytes_downloaded)
+
+                samples = timed(ask, args.repeat)
+                name = f"wire.{label}.{fmt}.{encoding}"
+                results[name] = summarize(samples, wire_bytes=sizes[-1])
+                log(f"  {name}: {sizes[-1]} bytes, p50 {results[name]['p50']} ms")
+
+        # Encoding CPU alone, on the payload the endpoint returned
+        payload = client.post("/api/query", json={"question": question}).json()
+        json_body = negotiation.JSONResponse(payload).body
+        encoders = {
+            "json": lambda: negotiation.JSONResponse(payload).body,
+            "msgpack": lambda: negotiation.encode_msgpack(payload),
+            "arrow": lambda: negotiation.encode_arrow(payload, "result"),
+            "gzip": lambda: negotiation._Compressor("gzip").compress(json_body, True),
+            "zstd": lambda: negotiation._Compressor("zstd").compress(json_body, True),
+        }
+        for fmt, encode_fn in encoders.items():
+            if fmt == "arrow" and encode_fn() is None:
+                continue  # not tabular: served as JSON
+            results[f"encode.{label}.{fmt}"] = summarize(timed(encode_fn, args.repeat), bytes=len(encode_fn()))
+            log(f"  encode.{label}.{fmt}: p50 {results[f'encode.{label}.{fmt}']['p50']} ms")
+
+
+def bench_persistence(memory, args, results, workdir):
+    from app.memory import PersistentMemoryStore
+
+    persist_file = os.path.join(workdir, "bench", "bench_store.pkl")
+    store = PersistentMemoryStore(persist_file=persist_file)
+    df = make_adult_like(args.persist_rows)
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Persisting a dataset writes it to the shared store (or the pickle when disabled)
+        samples = timed(lambda: store.update({"dataframe": df, "engine": "pandas", "filename": "bench.csv"}),
+                        args.repeat)
+    stored_bytes = sum(os.path.getsize(os.path.join(root, name))
+                       for root, _, names in os.walk(os.path.dirname(persist_file)) for name in names)
+    results["persist.memory_store_save"] = summarize(
+        samples, rows=args.persist_rows, file_mb=round(stored_bytes / 1024 / 1024, 2))
+    log(f"  persist.memory_store_save: p50 {results['persist.memory_store_save']['p50']} ms")
+
+    # A worker starting up (or noticing a new upload) maps the stored dataset
+    with contextlib.redirect_stdout(io.StringIO()):
+        samples = timed(lambda: PersistentMemoryStore(persist_file=persist_file).get("dataframe"), args.repeat)
+    results["persist.memory_store_load"] = summarize(samples, rows=args.persist_rows)
+    log(f"  persist.memory_store_load: p50 {results['persist.memory_store_load']['p50']} ms")
+
+    answer = {"result": {"a": 1.0, "b": 2.0}, "explanation": "x" * 200, "has_image": False}
+    samples = timed(lambda: memory.save_conversation("bench", "What is the answer?", answer), args.sqlite_writes)
+    results["persist.sqlite_history_write"] = summarize(samples)
+    log(f"  persist.sqlite_history_write: p50 {results['persist.sqlite_history_write']['p50']} ms")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    log(f"\nComparison against {baseline_path} ({baseline['meta'].get('commit')}):")
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old:
+            continue
+        delta = (result["p50"] - old["p50"]) / old["p50"] * 100 if old["p50"] else 0.0
+        flag = ""
+        if delta > tolerance * 100:
+            flag = "  <-- regression"
+            regressions.append(name)
+        log(f"  {name:45s} {old['p50']:10.3f} -> {result['p50']:10.3f} ms ({delta:+.1f}%){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="Write results JSON to this file")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[0.5, 2.0])
+    parser.add_argument("--excel-sizes-mb", type=float, nargs="+", default=[0.25])
+    parser.add_argument("--threshold-mb", type=float, default=4.0,
+                        help="Largest estimated pandas size (MB) loaded with pandas for the run; pass 100 for production")
+    parser.add_argument("--query-rows", type=int, default=50_000)
+    parser.add_argument("--serialize-rows", type=int, default=20_000)
+    parser.add_argument("--persist-rows", type=int, default=100_000)
+    parser.add_argument("--sqlite-writes", type=int, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Delay injected into each fake LLM call")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    # Relative to where the benchmark was started, not the scratch directory
+    args.output = args.output and os.path.abspath(args.output)
+    args.compare = args.compare and os.path.abspath(args.compare)
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="insightengine-bench-")
+    os.chdir(workdir)  # the memory store and history db live under ./backend/data
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            import main as app_main
+            from app import memory
+            from app.utils import data_handler, engine_planner, llm_agent
+            from app.utils.llm_client import set_llm_backend
+        from fastapi.testclient import TestClient
+
+        set_llm_backend(FakeLLM(latency_s=args.llm_latency_ms / 1000))
+        # Query timings measure the full pipeline; bench_paraphrases covers the question cache
+        llm_agent.question_cache.enabled = False
+        client = TestClient(app_main.app)
+
+        results = {}
+        sections = [
+            ("Uploads", lambda: bench_uploads(client, data_handler, engine_planner, args, results)),
+            ("Queries", lambda: bench_queries(client, args, results)),
+            ("Paraphrases", lambda: bench_paraphrases(client, llm_agent, args, results)),
+            ("Materialized analyses", lambda: bench_materialized(client, args, results)),
+            ("Serialization", lambda: bench_serialization(llm_agent, args, results)),
+            ("Wire formats", lambda: bench_wire_formats(client, args, results)),
+            ("Persistence", lambda: bench_persistence(memory, args, results, workdir)),
+        ]
+        for title, run in sections:
+            log(f"{title}:")
+            # The app prints progress to stdout; keep it out of the JSON report
+            with contextlib.redirect_stdout(io.StringIO()):
+                run()
+
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "pandas": pd.__version__,
+                "threshold_mb": args.threshold_mb,
+                "repeat": args.repeat,
+            },
+            "results": results,
+        }
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+            log(f"\nResults written to {args.output}")
+        else:
+            print(json.dumps(report, indent=2))
+
+        if args.compare:
+            regressions = compare(report, args.compare, args.tolerance)
+            if regressions:
+                sys.exit(1)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
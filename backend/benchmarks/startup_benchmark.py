@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the InsightEngine backend.
+
+Reports:
+  - an import-time breakdown of `import main` (python -X importtime), by
+    module and by top-level package, plus the cost of the modules the
+    background warm-up loads later;
+  - time from process start until /api/health answers, and until the
+    background warm-up has finished, for a real uvicorn process.
+
+Usage (from backend/):
+    python benchmarks/startup_benchmark.py --repeat 5
+    python benchmarks/startup_benchmark.py --imports-only --top 30
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_benchmarks import git_commit, log
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+DEFERRED_MODULES = ["app.utils.data_handler", "app.utils.llm_agent"]
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([BACKEND_DIR, os.path.join(BACKEND_DIR, "src"), env.get("PYTHONPATH", "")])
+    return env
+
+
+def import_breakdown(statement: str, top: int, workdir: str):
+    """Run statement under -X importtime and summarise where the time goes"""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                               cwd=workdir, env=_env(), capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise SystemExit(f"Import failed:\n{completed.stderr[-2000:]}")
+
+    modules = []
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({"module": name, "depth": len(indent) // 2,
+                            "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+
+    by_package = {}
+    for module in modules:
+        package = module["module"].split(".")[0]
+        by_package[package] = by_package.get(package, 0.0) + module["self_ms"]
+
+    return {
+        "total_ms": round(sum(m["self_ms"] for m in modules), 1),
+        "modules_imported": len(modules),
+        "top_modules": [{"module": m["module"], "cumulative_ms": round(m["cumulative_ms"], 1)}
+                        for m in sorted(modules, key=lambda m: m["cumulative_ms"], reverse=True)[:top]],
+        "by_package": {name: round(ms, 1) for name, ms in
+                       sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]},
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get_json(url):
+    with urllib.request.urlopen(url, timeout=1) as response:
+        return json.loads(response.read())
+
+
+def cold_start(timeout_s: float):
+    """Start uvicorn in a fresh process and time health and warm-up readiness"""
+    port = _free_port()
+    workdir = tempfile.mkdtemp(prefix="insightengine-startup-")
+    url = f"http://127.0.0.1:{port}/api/health"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        health_ms = warm_ms = None
+        health = None
+        while time.perf_counter() - start < timeout_s:
+            try:
+                health = _get_json(url)
+            except OSError:
+                time.sleep(0.01)
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            if health_ms is None:
+                health_ms = elapsed
+            if health.get("warmup", {}).get("done"):
+                warm_ms = elapsed
+                break
+            time.sleep(0.02)
+        return {"health_ms": health_ms, "warm_ms": warm_ms,
+                "warmup_steps_ms": (health or {}).get("warmup", {}).get("steps")}
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def _summary(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {"p50_ms": round(statistics.median(values), 1), "min_ms": round(min(values), 1),
+            "max_ms": round(max(values), 1), "n": len(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Cold starts to measure")
+    parser.add_argument("--top", type=int, default=20, help="Modules/packages listed in the breakdown")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for each start")
+    parser.add_argument("--imports-only", action="store_true", help="Skip the uvicorn cold starts")
+    parser.add_argument("--output", help="Write results JSON to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="insightengine-imports-")
+    log("Import breakdown of main...")
+    report = {
+        "meta": {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                 "python": sys.version.split()[0]},
+        "import_main": import_breakdown("import main", args.top, workdir),
+        # What the background warm-up (or the first request) pays for later
+        "import_deferred": import_breakdown(
+            "import main; " + "; ".join(f"import {name}" for name in DEFERRED_MODULES), args.top, workdir),
+    }
+    log(f"  import main: {report['import_main']['total_ms']} ms, "
+        f"with deferred modules: {report['import_deferred']['total_ms']} ms")
+
+    if not args.imports_only:
+        log(f"Cold starts ({args.repeat})...")
+        runs = [cold_start(args.timeout) for _ in range(args.repeat)]
+        report["cold_start"] = {
+            "health": _summary([run["health_ms"] for run in runs]),
+            "warm": _summary([run["warm_ms"] for run in runs]),
+            "runs": runs,
+        }
+        log(f"  first /api/health: {report['cold_start']['health']}, warm: {report['cold_start']['warm']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        log(f"\nResults written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
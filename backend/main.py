@@ -2,15 +2,29 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import upload, query, self_healing
+from fastapi.responses import PlainTextResponse
+from app.routers import upload, query, self_healing, traces
 from app.memory import memory_store
+from app.utils.metrics import registry as metrics_registry, MetricsMiddleware
+from app.utils.tracing import TracingMiddleware
+from app.utils.negotiation import CompressionMiddleware
+from app.utils.warmup import start_warmup, warmup_status
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy modules and the memory store load in the background, not before the port is bound
+    start_warmup()
+    yield
 
 app = FastAPI(
     title="InsightEngine API",
     description="AI-powered data analysis engine with natural language queries and self-healing capabilities",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Railway/Production handler
@@ -24,10 +38,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Inside the metrics middleware, so response sizes are measured as sent
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 app.include_router(upload.router, prefix="/api", tags=["Data Upload"])
 app.include_router(query.router, prefix="/api", tags=["Query Analysis"])
 app.include_router(self_healing.router, prefix="/api", tags=["Self-Healing System"])
+app.include_router(traces.router, prefix="/api", tags=["Tracing"])
 
 @app.get("/api/health", tags=["Health"])
 async def health():
@@ -38,22 +57,30 @@ async def health():
     except:
         healing_stats = {"total_fixes": 0}
     
+    # Don't block the health check on loading the store while the instance warms up
+    memory_ready = memory_store.loaded
     return {
         "status": "healthy",
         "version": "2.0.0",
         "components": {
             "api": "operational",
             "self_healing": "operational", 
-            "memory": "operational"
+            "memory": "operational" if memory_ready else "loading"
         },
-        "dataset_loaded": memory_store.get('dataframe') is not None,
-        "current_dataset": memory_store.get('filename', 'None'),
+        "dataset_loaded": memory_store.get('dataframe') is not None if memory_ready else None,
+        "current_dataset": memory_store.get('filename', 'None') if memory_ready else None,
+        "warmup": warmup_status,
         "self_healing": {
             "total_fixes": healing_stats.get('total_fixes', 0),
             "status": "active"
         }
     }
 
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, response sizes, cache hits and retries"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/", tags=["Health"])
 async def root():
     """Health check endpoint"""
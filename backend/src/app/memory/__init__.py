@@ -2,17 +2,34 @@
 import sqlite3
 import pickle
 import os
+import threading
+import time
 from typing import Any
-import pandas as pd
+from app.utils.metrics import MEMORY_STORE_SAVE_SECONDS
+from app.utils.tracing import span, traced
+from app.memory.shared_store import DATASET_KEYS, SharedDatasetStore
+
+# Set to 0 to keep the dataset in the pickle file only (single worker)
+SHARED_DATASET_STORE = os.getenv('SHARED_DATASET_STORE', '1') != '0'
+# Pickled next to the store so the dataset version survives a restart
+VERSION_KEY = '__dataset_version__'
 
 # In-memory store with persistence
 class PersistentMemoryStore:
-    def __init__(self, persist_file='backend/data/memory_store.pkl'):
+    def __init__(self, persist_file='backend/data/memory_store.pkl', shared=SHARED_DATASET_STORE):
         self.persist_file = persist_file
         # Ensure data directory exists
         os.makedirs(os.path.dirname(persist_file), exist_ok=True)
         self.store = {}
-        self.load()
+        # Dataset keys live in the cross-process store so every worker sees the same upload
+        self.shared = SharedDatasetStore(os.path.join(os.path.dirname(persist_file), 'shared')) if shared else None
+        self._shared_keys = set(DATASET_KEYS)
+        if self.shared is not None:
+            self.shared.on_change(self._apply_shared)
+        self._local_version = None
+        # Loaded on first access so importing the app does not unpickle the store
+        self.loaded = False
+        self._load_lock = threading.Lock()
     
     def load(self):
         """Load data from disk if it exists"""
@@ -20,44 +37,137 @@ class PersistentMemoryStore:
             try:
                 with open(self.persist_file, 'rb') as f:
                     self.store = pickle.load(f)
+                self._local_version = self.store.pop(VERSION_KEY, None)
                 print(f"📁 Loaded memory store with {len(self.store)} items")
             except Exception as e:
                 print(f"⚠️ Could not load memory store: {e}")
                 self.store = {}
-    
+        if self._local_version is None:
+            # No persisted version (new or older store): start past any version handed out before,
+            # so analyses pinned to an earlier dataset are never taken as fresh
+            self._local_version = time.time_ns()
+        if self.shared is not None:
+            if self.store.get('dataframe') is not None and not self.shared.read_index().get('dataset'):
+                # Store pickled before the shared store existed: migrate its dataset
+                self._publish({key: self.store.get(key) for key in DATASET_KEYS})
+            else:
+                self.shared.refresh()
+        self.loaded = True
+
+    def sync(self):
+        """Load on first use, then pick up a dataset uploaded through another worker"""
+        if not self.loaded:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load()
+        elif self.shared is not None:
+            self.shared.refresh()
+
+    def _apply_shared(self, version, dataset):
+        if dataset is None:
+            for key in self._shared_keys:
+                self.store.pop(key, None)
+            return
+        if 'dataframe' not in dataset:  # metadata-only change, data already loaded
+            dataset['dataframe'] = self.store.get('dataframe')
+        for key in self._shared_keys - set(dataset):
+            self.store.pop(key, None)
+        self._shared_keys = set(DATASET_KEYS) | set(dataset)
+        self.store.update(dataset)
+
+    def _publish(self, items: dict):
+        metadata = {key: items.get(key) for key in DATASET_KEYS}
+        metadata.update(items)
+        for key in ('dataframe', 'engine'):
+            metadata.pop(key)
+        with span('shared_store.publish'):
+            self.shared.publish(items['dataframe'], items.get('engine', 'pandas'), metadata)
+        self._shared_keys = set(DATASET_KEYS) | set(metadata)
+
     def save(self):
         """Save data to disk"""
+        # With the shared store the dataset is persisted there, not in the pickle
+        local = self.store if self.shared is None else \
+            {key: value for key, value in self.store.items() if key not in self._shared_keys}
         try:
-            with open(self.persist_file, 'wb') as f:
-                pickle.dump(self.store, f)
-            print(f"💾 Saved memory store with {len(self.store)} items")
+            with span('memory_store.save', items=len(local)) as save_span, \
+                    MEMORY_STORE_SAVE_SECONDS.time(), open(self.persist_file, 'wb') as f:
+                pickle.dump({**local, VERSION_KEY: self._local_version}, f)
+                if save_span is not None:
+                    save_span.set_attribute('bytes', f.tell())
+            print(f"💾 Saved memory store with {len(local)} items")
         except Exception as e:
             print(f"⚠️ Could not save memory store: {e}")
     
     def get(self, key, default=None):
+        self.sync()
         return self.store.get(key, default)
     
     def set(self, key, value):
-        self.store[key] = value
-        self.save()  # Auto-save on changes
+        self.update({key: value})
+    
+    def update(self, items: dict):
+        """Set several keys and persist once"""
+        self.sync()
+        if self.shared is not None:
+            if items.get('dataframe') is not None:
+                self._publish(items)
+            elif self._shared_keys.intersection(items):
+                self.shared.update_metadata({key: value for key, value in items.items()
+                                             if key in self._shared_keys and key not in ('dataframe', 'engine')})
+        if items.get('dataframe') is not None:
+            self._local_version += 1
+        self.store.update(items)
+        self.save()
+
+    def snapshot(self):
+        """The active (dataframe, engine, version), read together so a concurrent upload can't mix them"""
+        # Version first: if an upload lands in between, the pair is keyed by the older version and never reused
+        version = self.dataset_version
+        store = dict(self.store)
+        return store.get('dataframe'), store.get('engine', 'pandas'), version
+
+    @property
+    def dataset_version(self) -> int:
+        """Changes whenever a new dataset becomes active; for keying per-dataset caches"""
+        self.sync()
+        return self.shared.version if self.shared is not None else self._local_version
     
     def delete(self, key):
+        self.sync()
         if key in self.store:
             del self.store[key]
             self.save()
+
+    def clear(self):
+        """Drop everything, including the dataset shared with other workers"""
+        self.sync()
+        self.store.clear()
+        self._local_version += 1
+        if self.shared is not None:
+            self.shared.clear()
+            self._shared_keys = set(DATASET_KEYS)
+        self.save()
     
     def keys(self):
+        self.sync()
         return self.store.keys()
     
     def __getitem__(self, key):
+        self.sync()
         return self.store[key]
     
     def __setitem__(self, key, value):
         self.set(key, value)
     
     def __contains__(self, key):
+        self.sync()
         return key in self.store
 
+    def __len__(self):
+        self.sync()
+        return len(self.store)
+
 # Create persistent memory store instance
 memory_store = PersistentMemoryStore()
 
@@ -66,6 +176,7 @@ def get_db():
     conn = sqlite3.connect('backend/data/memory.db')
     return conn
 
+@traced('memory.save_conversation')
 def save_conversation(session_id: str, question: str, answer: Any):
     conn = get_db()
     c = conn.cursor()
@@ -0,0 +1,223 @@
+# Dataset state shared between worker processes
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# Keys of the memory store that describe the active dataset and live here
+DATASET_KEYS = ('dataframe', 'engine', 'filename', 'profile', 'scraping_code', 'url_source')
+
+
+def _lock_file(lock_file):
+    """Exclusive lock on an open file, held against other processes"""
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        import msvcrt
+        lock_file.seek(0)
+        while True:
+            try:
+                # Retries for about 10 seconds before raising
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+
+def _unlock_file(lock_file):
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        import msvcrt
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SharedDatasetStore:
+    """
+    Active dataset stored as an uncompressed Arrow IPC file that every worker
+    memory-maps, plus a small index.json holding a version number and the
+    dataset metadata. Writers take an exclusive lock on index.lock and replace
+    files atomically; readers only stat the index to notice changes, so any
+    number of gunicorn workers see the same dataset without each keeping a
+    private copy of the raw bytes.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock_path = os.path.join(directory, 'index.lock')
+        self.version = 0  # dataset version loaded in this process
+        self.loaded_file = None
+        self._index_stamp = None
+        self._callbacks: List[Callable[[int, Optional[Dict]], None]] = []
+        self._refresh_lock = threading.Lock()
+        # Byte-range locks on Windows don't exclude threads of the same process
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock, open(self.lock_path, 'a') as lock_file:
+            _lock_file(lock_file)
+            try:
+                yield
+            finally:
+                _unlock_file(lock_file)
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def read_index(self) -> Dict:
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {'version': 0, 'dataset': None}
+
+    def _write_atomic(self, path: str, write):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _write_index(self, index: Dict):
+        self._write_atomic(self.index_path,
+                           lambda f: f.write(json.dumps(index, default=str).encode()))
+
+    def _write_dataset(self, df, engine: str, path_base: str) -> str:
+        """Write df as Arrow IPC when possible, pickle otherwise; returns the file name"""
+        try:
+            import pyarrow as pa
+            if engine == 'pandas':
+                table = pa.Table.from_pandas(df)
+            else:
+                table = df.to_arrow()
+
+            def write(f):
+                with pa.ipc.new_file(f, table.schema) as writer:
+                    writer.write_table(table)
+            self._write_atomic(path_base + '.arrow', write)
+            return os.path.basename(path_base) + '.arrow'
+        except Exception as e:  # pyarrow missing or mixed-type object columns
+            print(f"⚠️ Storing dataset as pickle instead of Arrow: {e}")
+            self._write_atomic(path_base + '.pkl', lambda f: pickle.dump(df, f))
+            return os.path.basename(path_base) + '.pkl'
+
+    def _remove_stale_files(self, keep: List[str]):
+        # The previous file is kept so a worker that has just read the old
+        # index can still open it; anything older is no longer referenced
+        for name in os.listdir(self.directory):
+            if name.startswith('dataset-') and name not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def publish(self, df, engine: str, metadata: Dict) -> int:
+        """Make df the shared dataset and return its new version"""
+        with self._locked():
+            index = self.read_index()
+            version = index['version'] + 1
+            file_name = self._write_dataset(df, engine, os.path.join(self.directory, f"dataset-{version}"))
+            previous = (index.get('dataset') or {}).get('file')
+            self._write_index({
+                'version': version,
+                'dataset': {
+                    'file': file_name,
+                    'engine': engine,
+                    'metadata': metadata,
+                    'updated_at': time.time(),
+                    'pid': os.getpid(),
+                },
+            })
+            self._remove_stale_files([file_name, previous])
+            self.version = version
+            self.loaded_file = file_name
+            self._index_stamp = self._stamp()
+        return version
+
+    def update_metadata(self, metadata: Dict):
+        """Merge metadata into the current dataset entry without rewriting the data"""
+        with self._locked():
+            index = self.read_index()
+            if not index.get('dataset'):
+                return
+            index['dataset']['metadata'].update(metadata)
+            self._write_index(index)
+            self._index_stamp = self._stamp()
+
+    def clear(self):
+        with self._locked():
+            index = self.read_index()
+            self.version = index['version'] + 1
+            self.loaded_file = None
+            self._write_index({'version': self.version, 'dataset': None})
+            self._remove_stale_files([])
+            self._index_stamp = self._stamp()
+
+    def on_change(self, callback: Callable[[int, Optional[Dict]], None]):
+        """Call callback(version, dataset or None) whenever another process changes the dataset"""
+        self._callbacks.append(callback)
+
+    def _load_file(self, entry: Dict):
+        path = os.path.join(self.directory, entry['file'])
+        if entry['file'].endswith('.pkl'):
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        import pyarrow as pa
+        # Memory-mapped read: fixed-width columns reference the page cache
+        # shared by all workers instead of a private copy
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        if entry['engine'] == 'pandas':
+            from app.utils.snapshots import enable_copy_on_write
+            enable_copy_on_write()
+            return table.to_pandas(split_blocks=True)
+        import polars as pl
+        return pl.from_arrow(table)
+
+    def refresh(self) -> bool:
+        """Reload the dataset if another process changed it; True if anything changed"""
+        stamp = self._stamp()
+        if stamp == self._index_stamp:
+            return False
+        with self._refresh_lock:
+            if stamp == self._index_stamp:
+                return False
+            index = self.read_index()
+            entry = index.get('dataset')
+            dataset = None
+            if entry:
+                dataset = dict(entry['metadata'], engine=entry['engine'])
+                if entry['file'] != self.loaded_file:
+                    try:
+                        dataset['dataframe'] = self._load_file(entry)
+                    except FileNotFoundError:
+                        # Replaced between reading the index and opening it; next call retries
+                        return False
+                    print(f"📥 Loaded shared dataset version {index['version']} ({entry['file']})")
+            self.version = index['version']
+            self.loaded_file = entry['file'] if entry else None
+            self._index_stamp = stamp
+        for callback in self._callbacks:
+            try:
+                callback(self.version, dataset)
+            except Exception as e:
+                print(f"⚠️ Shared store change callback failed: {e}")
+        return True
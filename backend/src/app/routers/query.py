@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Request, HTTPException
-from app.utils.llm_agent import process_query
 from app.memory import memory_store, get_conversation
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from app.utils.tracing import span, set_trace_attribute
+from app.utils.negotiation import negotiated_response
+from app.utils.scheduler import QueueFull, query_scheduler
 
 router = APIRouter()
 
@@ -11,17 +13,40 @@ class QueryRequest(BaseModel):
     question: str
     context: Optional[Dict[str, Any]] = {}
     session_id: Optional[str] = "default"
+    profile: Optional[bool] = False
+    preview: Optional[bool] = False
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    context: Optional[Dict[str, Any]] = {}
+    session_id: Optional[str] = "default"
+
+class PinRequest(BaseModel):
+    question: str
+    session_id: Optional[str] = "default"
+
+# Upper bound on questions accepted by one batch request
+MAX_BATCH_QUESTIONS = 100
 
 @router.post("/query", summary="Ask questions about your dataset")
-async def query_api(query_request: QueryRequest):
+async def query_api(query_request: QueryRequest, request: Request):
     """
     Ask natural language questions about your uploaded dataset.
     
     - **question**: Your question about the data (required)
     - **context**: Additional context or parameters (optional)
     - **session_id**: Session identifier to maintain conversation history (optional)
+    - **profile**: Profile the generated code (CPU per function and per line, peak memory) (optional)
+    - **preview**: For large datasets, answer from a representative sample immediately and finish on
+      the full data in the background; fetch the full answer from /query/jobs/{job_id} (optional)
+    
+    Returns analysis results, explanations, and visualizations when applicable: JSON by default,
+    MessagePack with `Accept: application/msgpack`, or a tabular result as an Arrow IPC stream with
+    `Accept: application/vnd.apache.arrow.stream`.
     
-    Returns analysis results, explanations, and visualizations when applicable.
+    Queries wait for an execution slot, fairly across sessions (cheap and cached ones in a fast
+    lane); `queue_wait_ms` and `lane` report how long and where. A full queue answers 429 with
+    Retry-After.
     """
     if not query_request.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty")
@@ -34,15 +59,29 @@ async def query_api(query_request: QueryRequest):
     try:
         # Add timeout handling for complex queries
         import asyncio
+        # Imported on first use: llm_agent pulls in pandas, polars and the plotting stack
+        from app.utils.llm_agent import process_query, route_query
         
-        result = await asyncio.wait_for(
-            process_query(
-                query_request.question, 
-                query_request.context, 
-                query_request.session_id
-            ),
-            timeout=120  # 2 minutes timeout
-        )
+        set_trace_attribute('session_id', query_request.session_id)
+        # Profile and question cache lookups only, but off the event loop all the same
+        route = await asyncio.to_thread(route_query, query_request.question, query_request.context)
+        lane = route["lane"]
+        with span('router.query', question=query_request.question[:200], lane=lane):
+            result, queue_wait_ms = await query_scheduler.run(
+                query_request.session_id,
+                lambda: asyncio.wait_for(
+                    process_query(
+                        query_request.question, 
+                        query_request.context, 
+                        query_request.session_id,
+                        profile=bool(query_request.profile),
+                        preview=bool(query_request.preview),
+                        route=route
+                    ),
+                    timeout=120  # 2 minutes timeout, not counting the wait for a slot
+                ),
+                lane=lane
+            )
         
         # Handle self-healing error responses
         if isinstance(result, dict) and result.get("success") == False:
@@ -54,13 +93,18 @@ async def query_api(query_request: QueryRequest):
                     "auto_healing_info": {
                         "attempted": True,
                         "successful": result.get("auto_fix_successful", False)
-                    }
+                    },
+                    "queue_wait_ms": queue_wait_ms
                 })
             else:
                 raise HTTPException(status_code=500, detail=result.get("error", "Unknown error"))
         
-        return JSONResponse(result)
+        if isinstance(result, dict):
+            result = {**result, "queue_wait_ms": queue_wait_ms, "lane": lane}
+        return negotiated_response(request, result)
         
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except asyncio.TimeoutError:
         return JSONResponse({
             "success": False,
@@ -75,6 +119,180 @@ async def query_api(query_request: QueryRequest):
             "message": "An unexpected error occurred during query processing"
         })
 
+@router.post("/query/batch", summary="Ask many questions about your dataset at once")
+async def batch_query_api(batch_request: BatchQueryRequest, request: Request):
+    """
+    Answer a list of questions about the uploaded dataset in one request.
+    
+    - **questions**: List of questions (required)
+    - **context**: Additional context or parameters (optional)
+    - **session_id**: Session identifier to maintain conversation history (optional)
+    
+    Questions are grouped into a few LLM calls that generate one program with
+    shared intermediate results. Each question gets its own result or error.
+    The batch is scheduled like a query costing one per question (see /query).
+    """
+    questions = [q for q in batch_request.questions if q and q.strip()]
+    if not questions:
+        raise HTTPException(status_code=400, detail="At least one non-empty question is required")
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUESTIONS} questions per batch")
+    
+    df = memory_store.get('dataframe')
+    if df is None:
+        raise HTTPException(status_code=400, detail="No dataset loaded. Please upload a dataset first using /upload")
+    
+    try:
+        import asyncio
+        from app.utils.llm_agent import process_batch_query
+        
+        set_trace_attribute('session_id', batch_request.session_id)
+        with span('router.query_batch', questions=len(questions)):
+            result, queue_wait_ms = await query_scheduler.run(
+                batch_request.session_id,
+                lambda: asyncio.wait_for(
+                    process_batch_query(questions, batch_request.context, batch_request.session_id),
+                    timeout=300  # 5 minutes for a whole batch
+                ),
+                cost=len(questions)
+            )
+        if isinstance(result, dict) and "error" in result:
+            raise HTTPException(status_code=500, detail=result.get("error", "Unknown error"))
+        
+        return negotiated_response(request, {"success": True, **result, "queue_wait_ms": queue_wait_ms})
+        
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except asyncio.TimeoutError:
+        return JSONResponse({
+            "success": False,
+            "error": "Batch timeout - operation took too long",
+            "message": "Consider splitting the batch into smaller requests.",
+            "timeout": True
+        })
+
+@router.get("/query/scheduler", summary="Query scheduler status")
+async def scheduler_status():
+    """Running and waiting queries per lane"""
+    return query_scheduler.status()
+
+@router.get("/query/jobs/{job_id}", summary="Get the full result of a preview query")
+async def get_query_job(job_id: str):
+    """
+    Status of the full-dataset run started by a query asked with preview=true.
+    
+    - **job_id**: Job id returned with the preview answer
+    
+    status is "running", "done" (with result) or "failed" (with error).
+    """
+    from app.utils.query_jobs import query_jobs
+    
+    job = query_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job id")
+    return JSONResponse(job)
+
+@router.get("/results/{handle}", summary="Page through a large query result")
+async def get_result_page(request: Request, handle: str, offset: int = 0, limit: int = 100,
+                          sort_by: Optional[str] = None, descending: bool = False):
+    """
+    Rows of a result kept server-side (see result_handle in /query responses).
+    
+    - **offset**, **limit**: Page to return (limit at most 5000)
+    - **sort_by**: Column to sort by before paging (optional); **descending** for the reverse order
+    """
+    import asyncio
+    from app.utils.result_store import result_store, json_rows
+    
+    meta = result_store.meta(handle)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result handle")
+    try:
+        page = await asyncio.to_thread(result_store.page, handle, offset, limit, sort_by, descending)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown column '{sort_by}'. Available: {meta['columns']}")
+    return negotiated_response(request, {
+        "handle": handle,
+        "total_rows": meta["rows"],
+        "columns": meta["columns"],
+        "offset": offset,
+        "limit": page.num_rows,
+        "sort_by": sort_by,
+        "descending": descending,
+        "rows": json_rows(page),
+        "expires_at": meta["expires_at"],
+    }, table_key="rows")
+
+@router.get("/results/{handle}/download", summary="Download a large query result")
+async def download_result(handle: str, format: str = "csv"):
+    """
+    The full result, streamed.
+    
+    - **format**: arrow (Arrow IPC file), parquet or csv
+    """
+    from app.utils.result_store import result_store, DOWNLOAD_FORMATS
+    
+    if format not in DOWNLOAD_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {list(DOWNLOAD_FORMATS)}")
+    if result_store.meta(handle) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result handle")
+    filename = f"result-{handle[:8]}.{format}"
+    if format == "arrow":
+        # Stored as an Arrow IPC file already
+        return FileResponse(result_store.arrow_path(handle), media_type=DOWNLOAD_FORMATS[format], filename=filename)
+    return StreamingResponse(result_store.stream(handle, format), media_type=DOWNLOAD_FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@router.post("/analyses", summary="Pin a question as a materialized analysis")
+async def pin_analysis_api(pin_request: PinRequest):
+    """
+    Answer a question and keep its program and answer, refreshed after every upload.
+    
+    - **question**: The question to pin (required)
+    - **session_id**: Session identifier (optional)
+    
+    `incremental` in the response tells whether appended rows update the answer from just those
+    rows (count, sum, mean, min, max, overall or per group); other analyses are re-run on the new data.
+    """
+    if not pin_request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    from app.utils.materialized import pin_analysis
+    
+    try:
+        with span('router.pin_analysis', question=pin_request.question[:200]):
+            analysis, _ = await query_scheduler.run(
+                pin_request.session_id, lambda: pin_analysis(pin_request.question, pin_request.session_id))
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    if "error" in analysis:
+        raise HTTPException(status_code=400, detail=analysis["error"])
+    return JSONResponse(analysis)
+
+@router.get("/analyses", summary="List materialized analyses")
+async def list_analyses_api():
+    """Pinned analyses with their latest answers; `stale` ones are being re-run on a newer dataset"""
+    from app.utils.materialized import list_analyses
+    
+    return JSONResponse({"analyses": list_analyses()})
+
+@router.get("/analyses/{analysis_id}", summary="Get a materialized analysis")
+async def get_analysis_api(request: Request, analysis_id: str):
+    """The analysis' latest answer, re-run first if it is for an older dataset"""
+    from app.utils.materialized import get_analysis
+    
+    analysis = await get_analysis(analysis_id)
+    if analysis is None:
+        raise HTTPException(status_code=404, detail="Unknown analysis id")
+    return negotiated_response(request, analysis)
+
+@router.delete("/analyses/{analysis_id}", summary="Unpin a materialized analysis")
+async def delete_analysis_api(analysis_id: str):
+    from app.utils.materialized import analysis_store
+    
+    if not analysis_store.delete(analysis_id):
+        raise HTTPException(status_code=404, detail="Unknown analysis id")
+    return {"deleted": analysis_id}
+
 @router.get("/history/{session_id}", summary="Get conversation history")
 async def get_history(session_id: str):
     """
@@ -96,6 +314,8 @@ async def query_api_legacy(request: Request):
     query_request = QueryRequest(
         question=body.get("question", ""),
         context=body.get("context", {}),
-        session_id=body.get("session_id", "default")
+        session_id=body.get("session_id", "default"),
+        profile=body.get("profile", False),
+        preview=body.get("preview", False)
     )
-    return await query_api(query_request)
+    return await query_api(query_request, request)
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+from app.utils.tracing import trace_buffer
+
+router = APIRouter()
+
+@router.get("/traces", summary="List recent request traces")
+async def list_traces(limit: int = 50, min_duration_ms: float = 0):
+    """
+    List the most recent traces kept in the in-memory ring buffer, newest first.
+
+    - **limit**: Maximum number of traces to return
+    - **min_duration_ms**: Only return traces at least this slow
+    """
+    traces = [
+        trace.summary() for trace in trace_buffer.recent(trace_buffer.maxlen)
+        if (trace.duration_ms or 0) >= min_duration_ms
+    ]
+    return JSONResponse({"traces": traces[:limit], "buffer_size": trace_buffer.maxlen})
+
+@router.get("/traces/{trace_id}", summary="Get one trace as a span tree")
+async def get_trace(trace_id: str, format: str = "json"):
+    """
+    Get a trace with all of its spans.
+
+    - **trace_id**: Trace id (returned in the X-Trace-Id response header)
+    - **format**: `json` for a flat waterfall plus nested tree, `chrome` for Chrome trace-event format
+    """
+    trace = trace_buffer.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (it may have been evicted)")
+    if format == "chrome":
+        return JSONResponse(trace.to_chrome_trace())
+    return JSONResponse(trace.to_dict())
@@ -1,24 +1,47 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from app.utils.data_handler import handle_upload, handle_url_data
+from fastapi import APIRouter, Request, UploadFile, File, Form, HTTPException
 from app.memory import memory_store
-from fastapi.responses import JSONResponse
 from typing import Optional
+from app.utils.tracing import span
+from app.utils.negotiation import negotiated_response
+from app.utils.code_library import start_precompute
 
 router = APIRouter()
 
 @router.post("/upload", summary="Upload dataset or provide URL for scraping")
 async def upload_dataset(
+    request: Request,
     file: Optional[UploadFile] = File(None),
-    url: Optional[str] = Form(None)
+    url: Optional[str] = Form(None),
+    sheets: Optional[str] = Form(None),
+    pagination: Optional[str] = Form(None),
+    max_pages: Optional[int] = Form(None),
+    mode: Optional[str] = Form(None)
 ):
     """
     Upload a dataset file or provide a URL for data scraping.
-    
+
     - **file**: Upload CSV, JSON, or Excel file (optional)
     - **url**: URL to scrape data from (optional)
-    
-    At least one of file or url must be provided.
+    - **sheets**: Excel only - comma-separated sheet names or indexes to parse, default all (optional).
+      The first one becomes the active dataset and the response describes every sheet
+    - **pagination**: URL only - crawl a table spread over several pages into one dataset (optional):
+      `param=<name>` counts a query parameter up (e.g. `param=page`), `template` fills `{page}` in the URL,
+      `next` follows "next" links
+    - **max_pages**: Most pages to crawl (optional, capped by CRAWL_MAX_PAGES)
+    - **mode**: File only - `replace` the active dataset (default) or `append` the file's rows to it;
+      appended rows must have the same columns (optional)
+
+    At least one of file or url must be provided. `precomputing` in the response counts the stored
+    programs for this schema being run in the background, so their questions are answered instantly.
+    `analyses` counts the pinned analyses updated from just the appended rows (`incremental`) and
+    those being re-run on the new dataset (`rerunning`).
     """
+    # Imported on first use: data_handler pulls in pandas, polars, duckdb and BeautifulSoup
+    from app.utils.data_handler import handle_upload, handle_url_data, handle_crawl
+    from app.utils.materialized import refresh_analyses
+    
+    if mode not in (None, 'replace', 'append'):
+        raise HTTPException(status_code=400, detail="mode must be 'replace' or 'append'")
     if file:
         # Validate file type
         allowed_extensions = ['.csv', '.json', '.xlsx', '.xls', '.txt']
@@ -28,20 +51,65 @@ async def upload_dataset(
                 detail=f"Unsupported file type. Allowed: {', '.join(allowed_extensions)}"
             )
         
-        result = await handle_upload(file)
+        with span('router.upload', filename=file.filename):
+            result = await handle_upload(file, sheets, append=mode == 'append')
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
-        return JSONResponse(result)
+        # Answer the schema's most asked questions ahead of time
+        result["precomputing"] = start_precompute()
+        if "analyses" not in result:  # appends refresh them from the new rows in handle_upload
+            result["analyses"] = refresh_analyses()
+        return negotiated_response(request, result, table_key="preview")
         
     elif url:
+        if mode == 'append':
+            raise HTTPException(status_code=400, detail="mode=append is only supported for file uploads")
         # Basic URL validation
         if not url.startswith(('http://', 'https://')):
             raise HTTPException(status_code=400, detail="URL must start with http:// or https://")
             
-        result = await handle_url_data(url)
+        if pagination:
+            if max_pages is not None and max_pages < 1:
+                raise HTTPException(status_code=400, detail="max_pages must be at least 1")
+            with span('router.upload_crawl', url=url):
+                result = await handle_crawl(url, pagination, max_pages)
+        else:
+            with span('router.upload_url', url=url):
+                result = await handle_url_data(url)
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
-        return JSONResponse(result)
+        # Answer the schema's most asked questions ahead of time
+        result["precomputing"] = start_precompute()
+        result["analyses"] = refresh_analyses()
+        return negotiated_response(request, result, table_key="preview")
         
     else:
         raise HTTPException(status_code=400, detail="Either file or URL must be provided")
+
+@router.get("/upload/sheets", summary="List the sheets of the uploaded Excel workbook")
+async def list_sheets():
+    """Sheets of the active Excel workbook and which one is currently loaded"""
+    from app.utils.data_handler import get_excel_sheets
+
+    sheets = get_excel_sheets()
+    if sheets is None:
+        raise HTTPException(status_code=400, detail="The active dataset is not an Excel workbook")
+    return sheets
+
+@router.post("/upload/sheet", summary="Switch to another sheet of the uploaded Excel workbook")
+async def switch_sheet(request: Request, sheet: str = Form(...)):
+    """
+    Make another sheet of the last uploaded workbook the active dataset, without re-uploading.
+
+    - **sheet**: Sheet name or index
+    """
+    from app.utils.data_handler import select_excel_sheet
+    from app.utils.materialized import refresh_analyses
+
+    with span('router.switch_sheet', sheet=sheet):
+        result = await select_excel_sheet(sheet)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    result["precomputing"] = start_precompute()
+    result["analyses"] = refresh_analyses()
+    return negotiated_response(request, result, table_key="preview")
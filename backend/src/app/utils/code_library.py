@@ -0,0 +1,179 @@
+"""
+Persistent library of generated programs, by dataset schema.
+Every program that answered a question is stored in SQLite under the
+dataset's schema (column names and kinds of dtypes, per engine) and the
+question's intent (see question_cache), so a daily export with the same
+columns reuses yesterday's programs instead of asking the LLM again, across
+restarts and workers. Programs count how often they were used; right after
+an upload, the LIBRARY_PRECOMPUTE_TOP most used ones for the new dataset's
+schema are run in the background, so their answers are ready before the
+questions are asked. The answers are stored alongside, by dataset version,
+so whichever worker gets the question serves them.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+CODE_LIBRARY_DB = os.getenv('CODE_LIBRARY_DB', 'backend/data/code_library.db')
+LIBRARY_PRECOMPUTE_TOP = int(os.getenv('LIBRARY_PRECOMPUTE_TOP', '10'))
+# Programs kept per schema, least used dropped first
+LIBRARY_MAX_PROGRAMS = int(os.getenv('LIBRARY_MAX_PROGRAMS', '500'))
+
+_DTYPE_KINDS = [
+    (re.compile(r'^(u?int|uint)\d*$'), 'int'),
+    (re.compile(r'^float\d*$|^decimal'), 'float'),
+    (re.compile(r'^bool'), 'bool'),
+    (re.compile(r'^(datetime|timestamp|date)'), 'datetime'),
+    (re.compile(r'^(timedelta|duration)'), 'duration'),
+    (re.compile(r'^(object|str|string|category|categorical|enum|large_string)'), 'str'),
+]
+
+
+def dtype_kind(dtype) -> str:
+    """int64 and int16 (or object and category) are the same kind: dtype optimisation differs between exports"""
+    name = str(dtype).lower()
+    for pattern, kind in _DTYPE_KINDS:
+        if pattern.match(name):
+            return kind
+    return name
+
+
+def schema_key(df, engine: str) -> str:
+    """Engine, column names and dtype kinds: a program written for one dataset runs on any with the same key"""
+    schema = [engine] + [(str(col), dtype_kind(dtype)) for col, dtype in zip(df.columns, df.dtypes)]
+    return hashlib.sha1(repr(schema).encode()).hexdigest()
+
+
+class CodeLibrary:
+    """SQLite table of programs by (schema, intent, signature)"""
+
+    def __init__(self, path: str = CODE_LIBRARY_DB, max_programs: int = LIBRARY_MAX_PROGRAMS):
+        self.path = path
+        self.max_programs = max_programs
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''CREATE TABLE IF NOT EXISTS programs (
+                    schema TEXT, intent TEXT, signature TEXT, question TEXT, code TEXT,
+                    uses INTEGER DEFAULT 1, created_at REAL, last_used REAL,
+                    PRIMARY KEY (schema, intent, signature))''')
+                conn.execute('''CREATE TABLE IF NOT EXISTS answers (
+                    dataset_version INTEGER, intent TEXT, signature TEXT, answer TEXT, created_at REAL,
+                    PRIMARY KEY (dataset_version, intent, signature))''')
+                conn.commit()
+                self._initialized = True
+        return conn
+
+    def programs(self, schema: str) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT intent, signature, question, code, uses FROM programs WHERE schema=?',
+                                (schema,)).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    def top(self, schema: str, limit: int) -> List[Dict[str, Any]]:
+        """The schema's most used programs"""
+        conn = self._connect()
+        try:
+            rows = conn.execute('''SELECT intent, signature, question, code, uses FROM programs WHERE schema=?
+                                   ORDER BY uses DESC, last_used DESC LIMIT ?''', (schema, limit)).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    def save(self, schema: str, intent: str, signature: str, question: str, code: str):
+        """Store a program, or count one more use of the program stored for this intent"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('''INSERT INTO programs VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+                            ON CONFLICT (schema, intent, signature) DO UPDATE SET
+                            question=excluded.question, code=excluded.code, uses=uses + 1, last_used=excluded.last_used''',
+                         (schema, intent, signature, question, code, now, now))
+            conn.execute('''DELETE FROM programs WHERE schema=? AND rowid NOT IN (
+                            SELECT rowid FROM programs WHERE schema=? ORDER BY uses DESC, last_used DESC LIMIT ?)''',
+                         (schema, schema, self.max_programs))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_use(self, schema: str, intent: str, signature: str):
+        conn = self._connect()
+        try:
+            conn.execute('UPDATE programs SET uses=uses + 1, last_used=? WHERE schema=? AND intent=? AND signature=?',
+                         (time.time(), schema, intent, signature))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def save_answer(self, dataset_version: int, intent: str, signature: str, answer: Dict[str, Any]):
+        """Keep a program's answer on a dataset version"""
+        conn = self._connect()
+        try:
+            conn.execute('INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)',
+                         (dataset_version, intent, signature, json.dumps(answer, default=str), time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def answer(self, dataset_version: int, intent: str, signature: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT answer FROM answers WHERE dataset_version=? AND intent=? AND signature=?',
+                               (dataset_version, intent, signature)).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row['answer']) if row is not None else None
+
+    def drop_answers(self, keep_version: int):
+        """Forget the answers on every dataset version but keep_version"""
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM answers WHERE dataset_version != ?', (keep_version,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def start_precompute(limit: int = LIBRARY_PRECOMPUTE_TOP) -> int:
+    """Run the active dataset's most used library programs in the background; returns how many"""
+    from app.memory import memory_store
+    from app.utils.question_cache import question_cache
+
+    if limit <= 0 or not question_cache.enabled:
+        return 0
+    df, engine, version = memory_store.snapshot()
+    if df is None:
+        return 0
+    try:
+        entries = question_cache.top(schema_key(df, engine), limit)
+    except sqlite3.Error as e:
+        print(f"⚠️ Code library unavailable: {e}")
+        return 0
+    if not entries:
+        return 0
+
+    def run():
+        from app.utils.llm_agent import precompute_answers
+        precompute_answers(entries, version)
+
+    threading.Thread(target=run, daemon=True, name='precompute').start()
+    return len(entries)
+
+
+code_library = CodeLibrary()
@@ -0,0 +1,162 @@
+"""
+Opt-in profiling of generated code.
+Runs exec under cProfile, a line tracer restricted to the generated code,
+and tracemalloc, and reports the top functions by cumulative time, the
+time spent on each line of the generated program (including the pandas
+calls it makes) and the peak memory allocated.
+tracemalloc is process-wide: it runs while any profiled query does, and the
+memory figures count every allocation in the process during the run, so
+with concurrent profiled queries (reported as concurrent_profiles) they
+include the others' allocations.
+"""
+
+import sys
+import threading
+import time
+import cProfile
+import pstats
+import tracemalloc
+from typing import Any, Dict
+
+# Filename given to compiled generated code, used to recognise its frames
+GENERATED_FILENAME = "<generated>"
+TOP_FUNCTIONS = 20
+
+# Profiles running now; tracemalloc is started by the first and stopped by the last
+_active_profiles = 0
+_tracemalloc_lock = threading.Lock()
+_started_tracemalloc = False
+
+
+def _start_tracing() -> int:
+    """Start tracemalloc for a profile; returns how many other profiles are running"""
+    global _active_profiles, _started_tracemalloc
+    with _tracemalloc_lock:
+        others = _active_profiles
+        _active_profiles += 1
+        if not others:
+            # Leave tracing alone if something else (e.g. a debugger) started it
+            _started_tracemalloc = not tracemalloc.is_tracing()
+            if _started_tracemalloc:
+                tracemalloc.start()
+            # Resetting while others run would lose their peak
+            tracemalloc.reset_peak()
+        return others
+
+
+def _stop_tracing():
+    global _active_profiles
+    with _tracemalloc_lock:
+        _active_profiles -= 1
+        if not _active_profiles and _started_tracemalloc:
+            tracemalloc.stop()
+
+
+class _LineTimer:
+    """sys.settrace hook that attributes wall time to lines of the generated code"""
+
+    def __init__(self):
+        self.times: Dict[int, float] = {}
+        self.hits: Dict[int, int] = {}
+        # frame -> (line number, timestamp) of the line currently executing;
+        # the timestamp is None while a nested generated frame is running
+        self._current: Dict[Any, tuple] = {}
+
+    def _charge(self, frame, now):
+        previous = self._current.get(frame)
+        if previous is not None and previous[1] is not None:
+            line, started = previous
+            self.times[line] = self.times.get(line, 0.0) + (now - started)
+            self._current[frame] = (line, None)
+
+    def __call__(self, frame, event, arg):
+        # Only step through frames of the generated code itself (including functions
+        # it defines); library frames are not traced, so their time lands on the calling line
+        if event == 'call' and frame.f_code.co_filename == GENERATED_FILENAME:
+            # Pause the calling line so nested generated code is not counted twice
+            if frame.f_back is not None:
+                self._charge(frame.f_back, time.perf_counter())
+            return self._trace_line
+        return None
+
+    def _trace_line(self, frame, event, arg):
+        now = time.perf_counter()
+        self._charge(frame, now)
+        if event == 'line':
+            self.hits[frame.f_lineno] = self.hits.get(frame.f_lineno, 0) + 1
+            self._current[frame] = (frame.f_lineno, now)
+        elif event == 'return':
+            self._current.pop(frame, None)
+            caller = frame.f_back
+            if caller in self._current:
+                self._current[caller] = (self._current[caller][0], now)
+        return self._trace_line
+
+
+def _top_functions(profiler: cProfile.Profile, limit: int):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, lineno, name), (cc, nc, tottime, cumtime, _) in stats.stats.items():
+        # Skip the exec wrapper and module body, which always top the list
+        if name == '<built-in method builtins.exec>' or (name == '<module>' and filename == GENERATED_FILENAME):
+            continue
+        rows.append({
+            "function": name,
+            "location": f"{filename}:{lineno}",
+            "calls": nc,
+            "total_ms": round(tottime * 1000, 3),
+            "cumulative_ms": round(cumtime * 1000, 3),
+        })
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:limit]
+
+
+def profile_exec(code: str, namespace: Dict[str, Any], top_n: int = TOP_FUNCTIONS) -> Dict[str, Any]:
+    """
+    Execute code in namespace under the profilers.
+
+    Exceptions from the code propagate unchanged; the profile is only
+    returned when execution succeeds.
+    """
+    compiled = compile(code, GENERATED_FILENAME, 'exec')
+    line_timer = _LineTimer()
+    profiler = cProfile.Profile()
+
+    concurrent = _start_tracing()
+    baseline_memory, _ = tracemalloc.get_traced_memory()
+
+    previous_trace = sys.gettrace()
+    start = time.perf_counter()
+    sys.settrace(line_timer)
+    profiler.enable()
+    try:
+        exec(compiled, namespace, namespace)
+    finally:
+        profiler.disable()
+        sys.settrace(previous_trace)
+        elapsed = time.perf_counter() - start
+        current_memory, peak_memory = tracemalloc.get_traced_memory()
+        concurrent = max(concurrent, _active_profiles - 1)
+        _stop_tracing()
+
+    source_lines = code.splitlines()
+    lines = []
+    for lineno in sorted(set(line_timer.times) | set(line_timer.hits)):
+        line_time = line_timer.times.get(lineno, 0.0)
+        lines.append({
+            "line": lineno,
+            "code": source_lines[lineno - 1].rstrip() if 0 < lineno <= len(source_lines) else "",
+            "hits": line_timer.hits.get(lineno, 0),
+            "time_ms": round(line_time * 1000, 3),
+            "percent": round(100 * line_time / elapsed, 1) if elapsed else 0.0,
+        })
+
+    return {
+        "wall_time_ms": round(elapsed * 1000, 3),
+        "top_functions": _top_functions(profiler, top_n),
+        "lines": lines,
+        "peak_memory_bytes": max(peak_memory - baseline_memory, 0),
+        "retained_memory_bytes": max(current_memory - baseline_memory, 0),
+        # Other profiled queries whose allocations the memory figures may include
+        "concurrent_profiles": concurrent,
+    }
@@ -0,0 +1,222 @@
+"""
+Column pruning for generated code.
+Most generated programs touch two or three columns of the dataset. Before a
+program runs, its AST is checked for how it uses 'dataframe': every use has
+to end in a column selection (string subscripts, .loc[rows, cols], groupby
+keys with selected or explicitly aggregated columns, polars select/pl.col),
+possibly after row-only steps (masks, sorts, head, dropna(subset=...)...). The columns
+it can then see are the string literals in the code that name a column, so
+the program gets a frame with only those. Anything the analysis can't follow
+(the whole frame returned or printed, .columns, describe(), iloc, eval,
+pl.all(), a non-literal subscript...) keeps the full frame, and a pruned run
+that fails on a missing column is re-run on the full frame.
+"""
+
+import ast
+import os
+from typing import Any, Dict, Optional, Set, Tuple
+
+COLUMN_PRUNING = os.getenv('COLUMN_PRUNING', '1') != '0'
+
+# Return the same columns, fewer or reordered rows
+ROW_METHODS = {
+    'sort_values', 'sort', 'sort_index', 'head', 'tail', 'nlargest', 'nsmallest',
+    'reset_index', 'copy', 'clone', 'filter', 'lazy', 'collect', 'limit',
+    'fillna', 'fill_null', 'with_columns', 'assign', 'set_index',
+}
+# Row-only when given subset=: without it they look at every column
+SUBSET_METHODS = {'dropna', 'drop_nulls', 'drop_duplicates', 'unique'}
+# Boolean masks used to select rows
+MASK_METHODS = {
+    'isin', 'is_in', 'between', 'is_between', 'notna', 'notnull', 'isna', 'isnull', 'is_null', 'is_not_null',
+    'duplicated', 'is_duplicated', 'contains', 'startswith', 'endswith', 'starts_with', 'ends_with', 'any', 'all',
+}
+# Attributes that only depend on the rows
+ROW_ATTRIBUTES = {'height', 'empty', 'index'}
+# Names that make column access impossible to follow
+DYNAMIC_NAMES = {'eval', 'exec', 'getattr', 'globals', 'locals', 'vars', '__import__'}
+# Namespace variables read back after the run: frames assigned to them leave with all their columns
+OUTPUT_NAMES = {'result'}
+
+
+class _Unsafe(Exception):
+    """The program uses the frame in a way the analysis can't follow"""
+
+
+def _is_column_literal(node) -> bool:
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, str)
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return all(isinstance(elt, ast.Constant) and isinstance(elt.value, str) for elt in node.elts)
+    return False
+
+
+def _is_mask(node) -> bool:
+    if isinstance(node, (ast.Compare, ast.BoolOp)):
+        return True
+    if isinstance(node, ast.BinOp):
+        return isinstance(node.op, (ast.BitAnd, ast.BitOr, ast.BitXor))
+    if isinstance(node, ast.UnaryOp):
+        return isinstance(node.op, (ast.Invert, ast.Not))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        return node.func.attr in MASK_METHODS
+    return False
+
+
+def _is_polars_expression(node) -> bool:
+    """pl.col('x').sum(), pl.len()...: an expression rooted at pl"""
+    while isinstance(node, (ast.Call, ast.Attribute)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return isinstance(node, ast.Name) and node.id == 'pl'
+
+
+def _is_explicit_aggregation(node) -> bool:
+    if isinstance(node, ast.Dict):
+        return True
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return all(_is_polars_expression(elt) for elt in node.elts)
+    return _is_polars_expression(node)
+
+
+def _is_method_call(parent, grandparent) -> bool:
+    return isinstance(grandparent, ast.Call) and grandparent.func is parent
+
+
+def _has_literal_subset(call) -> bool:
+    """dropna(subset=['a'])-style call: rows judged on the named columns only (collected as literals)"""
+    if call.args:
+        return False
+    keywords = {keyword.arg: keyword.value for keyword in call.keywords}
+    if None in keywords:  # **kwargs
+        return False
+    axis = keywords.get('axis')
+    if axis is not None and not (isinstance(axis, ast.Constant) and axis.value in (0, 'index', 'rows')):
+        return False
+    return 'subset' in keywords and _is_column_literal(keywords['subset'])
+
+
+class _Analyzer:
+    def __init__(self, tree, frame_name: str = 'dataframe'):
+        self.tree = tree
+        self.parents: Dict[ast.AST, ast.AST] = {}
+        for node in ast.walk(tree):
+            for child in ast.iter_child_nodes(node):
+                self.parents[child] = node
+        self.frame_names = {frame_name}
+
+    def check(self):
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Name) and node.id in DYNAMIC_NAMES:
+                raise _Unsafe(node.id)
+            if isinstance(node, ast.Attribute) and node.attr in ('all', 'exclude', 'selectors', 'nth') \
+                    and isinstance(node.value, ast.Name) and node.value.id in ('pl', 'cs'):
+                raise _Unsafe(f"pl.{node.attr}")
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'col' \
+                    and isinstance(node.func.value, ast.Name) and node.func.value.id == 'pl':
+                for arg in node.args:
+                    if not (_is_column_literal(arg) and not str(getattr(arg, 'value', '')).startswith(('^', '*'))):
+                        raise _Unsafe("pl.col selector")
+        # Names assigned a frame are frames too; repeat until no new alias turns up
+        while True:
+            before = len(self.frame_names)
+            for node in ast.walk(self.tree):
+                if isinstance(node, ast.Name) and node.id in self.frame_names and isinstance(node.ctx, ast.Load):
+                    self._follow(node)
+            if len(self.frame_names) == before:
+                break
+
+    def _follow(self, node):
+        """node evaluates to a frame with every column; raise unless all its uses narrow it"""
+        parent = self.parents.get(node)
+        grandparent = self.parents.get(parent)
+        if isinstance(parent, ast.Subscript) and parent.value is node:
+            if _is_column_literal(parent.slice):
+                return
+            if _is_mask(parent.slice) or isinstance(parent.slice, ast.Slice):
+                if isinstance(parent.ctx, ast.Load):
+                    return self._follow(parent)
+                return  # assigning to rows of a frame keeps it local
+            raise _Unsafe("non-literal subscript")
+        if isinstance(parent, ast.Attribute) and parent.value is node:
+            attr = parent.attr
+            if attr in ROW_ATTRIBUTES:
+                return
+            if attr == 'shape' and isinstance(grandparent, ast.Subscript) \
+                    and isinstance(grandparent.slice, ast.Constant) and grandparent.slice.value == 0:
+                return
+            if attr == 'loc' and isinstance(grandparent, ast.Subscript):
+                index = grandparent.slice
+                if isinstance(index, ast.Tuple) and len(index.elts) == 2:
+                    if _is_column_literal(index.elts[1]):
+                        return
+                    raise _Unsafe("loc columns")
+                if _is_mask(index) or isinstance(index, ast.Slice):
+                    return self._follow(grandparent) if isinstance(grandparent.ctx, ast.Load) else None
+                raise _Unsafe("loc rows")
+            if _is_method_call(parent, grandparent):
+                if attr in ROW_METHODS or (attr in SUBSET_METHODS and _has_literal_subset(grandparent)):
+                    return self._follow(grandparent)
+                if attr in ('groupby', 'group_by'):
+                    return self._follow_grouped(grandparent)
+                if attr in ('select', 'get_column'):
+                    return
+            raise _Unsafe(f".{attr}")
+        if isinstance(parent, ast.Call) and node in parent.args and isinstance(parent.func, ast.Name) \
+                and parent.func.id == 'len':
+            return
+        if isinstance(parent, ast.Assign) and parent.value is node:
+            for target in parent.targets:
+                if not isinstance(target, ast.Name) or target.id in OUTPUT_NAMES:
+                    raise _Unsafe("frame assigned to output")
+                self.frame_names.add(target.id)
+            return
+        if isinstance(parent, ast.Expr):  # value discarded, e.g. an inplace call
+            return
+        raise _Unsafe(type(parent).__name__)
+
+    def _follow_grouped(self, node):
+        parent = self.parents.get(node)
+        grandparent = self.parents.get(parent)
+        if isinstance(parent, ast.Subscript) and parent.value is node and _is_column_literal(parent.slice):
+            return
+        if isinstance(parent, ast.Attribute) and parent.value is node and _is_method_call(parent, grandparent):
+            if parent.attr in ('size', 'len'):
+                return
+            if parent.attr in ('agg', 'aggregate'):
+                # {'col': 'mean'}, col=('x', 'sum') or polars expressions; not agg('mean') on every column
+                if all(_is_explicit_aggregation(arg) for arg in grandparent.args):
+                    return
+        raise _Unsafe("grouped frame")
+
+
+def referenced_columns(code: str, columns) -> Optional[Set[str]]:
+    """Columns the code can see, or None when it may need the whole frame"""
+    if not all(isinstance(col, str) for col in columns):
+        return None
+    try:
+        tree = ast.parse(code)
+        _Analyzer(tree).check()
+    except (SyntaxError, _Unsafe):
+        return None
+    names = set(columns)
+    return {node.value for node in ast.walk(tree)
+            if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value in names}
+
+
+def prune_columns(code: str, df, engine: str, profile: Optional[dict] = None) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    """(frame with the columns code needs, report) or (df, None) when nothing can be pruned"""
+    if not COLUMN_PRUNING:
+        return df, None
+    columns = list(df.columns)
+    needed = referenced_columns(code, columns)
+    if needed is None or len(needed) >= len(columns):
+        return df, None
+    # Keep the dataset's column order; at least one column so the row count survives
+    keep = [col for col in columns if col in needed] or columns[:1]
+    memory_bytes = (profile or {}).get('memory_bytes', {})
+    pruned = df[keep] if engine == 'pandas' else df.select(keep)
+    return pruned, {
+        "columns": len(keep),
+        "of": len(columns),
+        "bytes_saved": int(sum(memory_bytes.get(col, 0) for col in columns if col not in keep)),
+    }
@@ -0,0 +1,271 @@
+"""
+Paginated URL crawling.
+Crawls a table spread over several pages into one dataset. Pages come from
+a pagination rule:
+  - "param=<name>": the start URL with the query parameter <name> counting
+    up from its current value (or 1), e.g. ?page=1, ?page=2...;
+  - "template": a start URL containing {page};
+  - "next": follow rel="next" / "Next" links from page to page.
+Numbered pages are fetched concurrently and the crawl stops at the first
+page that is missing or has no table; "next" links are followed one after
+another, with each page's table parsed while the next page downloads.
+Requests to one host are limited to CRAWL_PER_HOST_CONCURRENCY at a time
+and start at least CRAWL_DELAY_MS apart. Each page's table is parsed as
+soon as it arrives and appended, in page order, to a CSV spool file, so
+pages are never held in memory; the spool is typed once, over all rows,
+when it is loaded.
+"""
+
+import asyncio
+import io
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urljoin, urlparse, urlunparse
+
+CRAWL_MAX_PAGES = int(os.getenv('CRAWL_MAX_PAGES', '100'))
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv('CRAWL_PER_HOST_CONCURRENCY', '4'))
+CRAWL_DELAY_MS = float(os.getenv('CRAWL_DELAY_MS', '200'))
+CRAWL_TIMEOUT_SECONDS = 10
+USER_AGENT = 'Mozilla/5.0 (compatible; InsightEngine crawler)'
+
+_NEXT_TEXT = re.compile(r"^\s*(next( page)?|more|older)?\s*[>›»→]*\s*$", re.IGNORECASE)
+# Statuses that mean the pages have run out rather than that a page failed
+_END_STATUSES = (404, 410)
+
+
+class HostLimiter:
+    """Per-host concurrency and politeness: at most `concurrency` requests in flight, started `delay` apart"""
+
+    def __init__(self, concurrency: int = CRAWL_PER_HOST_CONCURRENCY, delay_ms: float = CRAWL_DELAY_MS):
+        self.concurrency = max(concurrency, 1)
+        self.delay = delay_ms / 1000
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    def _host(self, url: str) -> str:
+        return urlparse(url).netloc.lower()
+
+    async def fetch(self, fetch_fn, url: str):
+        host = self._host(url)
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.concurrency))
+        async with semaphore:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.delay
+            if start > now:
+                await asyncio.sleep(start - now)
+            return await asyncio.to_thread(fetch_fn, url)
+
+
+def fetch_page(url: str) -> Optional[str]:
+    """Page HTML, or None past the last page (404/410)"""
+    import requests
+
+    response = requests.get(url, headers={'User-Agent': USER_AGENT}, timeout=CRAWL_TIMEOUT_SECONDS)
+    if response.status_code in _END_STATUSES:
+        return None
+    response.raise_for_status()
+    return response.text
+
+
+def numbered_pages(start_url: str, pagination: str, max_pages: int) -> List[str]:
+    """URLs of pages start..start+max_pages-1 for a "param=<name>" or "template" rule"""
+    if pagination == 'template':
+        if '{page}' not in start_url:
+            raise ValueError("Template pagination needs a URL containing {page}")
+        return [start_url.replace('{page}', str(page)) for page in range(1, max_pages + 1)]
+    name = pagination.split('=', 1)[1].strip()
+    if not name:
+        raise ValueError("Pagination 'param=<name>' needs a parameter name")
+    parsed = urlparse(start_url)
+    query = parse_qs(parsed.query, keep_blank_values=True)
+    try:
+        first = int(query.get(name, ['1'])[0])
+    except ValueError:
+        raise ValueError(f"Query parameter '{name}' of the start URL is not a page number")
+    urls = []
+    for page in range(first, first + max_pages):
+        query[name] = [str(page)]
+        urls.append(urlunparse(parsed._replace(query=urlencode(query, doseq=True))))
+    return urls
+
+
+def find_next_link(html: str, page_url: str) -> Optional[str]:
+    """Absolute URL of the page's "next" link, if any"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup.find_all(['link', 'a'], href=True):
+        if 'next' in [rel.lower() for rel in tag.get('rel', [])]:
+            return urljoin(page_url, tag['href'])
+    for tag in soup.find_all('a', href=True):
+        text = tag.get_text(strip=True)
+        classes = ' '.join(tag.get('class', [])).lower()
+        if (text and _NEXT_TEXT.match(text) and not text.isdigit()) or 'next' in classes:
+            return urljoin(page_url, tag['href'])
+    return None
+
+
+def _flatten_columns(df):
+    df.columns = [' '.join(str(part) for part in col if not str(part).startswith('Unnamed'))
+                  if isinstance(col, tuple) else str(col) for col in df.columns]
+    return df
+
+
+def parse_page_table(html: str, header: Optional[List[str]] = None):
+    """The page's data table: the first substantial one, or the one sharing most columns with header"""
+    import pandas as pd
+
+    try:
+        tables = [_flatten_columns(table) for table in pd.read_html(io.StringIO(html))]
+    except ValueError:  # no <table>
+        return None
+    tables = [table for table in tables if len(table) > 0 and len(table.columns) > 1]
+    if not tables:
+        return None
+    if header is None:
+        substantial = [table for table in tables if len(table) > 1]
+        return (substantial or tables)[0]
+    best = max(tables, key=lambda table: len(set(table.columns) & set(header)))
+    return best if set(best.columns) & set(header) else None
+
+
+class CsvSpool:
+    """Appends page tables, in page order, to one CSV file with the first page's columns"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header: Optional[List[str]] = None
+        self.rows = 0
+        self.pages_written = 0
+        self.dropped_columns = set()
+        self._pending: Dict[int, Any] = {}
+        self._next_index = 0
+        self._end: Optional[int] = None
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+
+    def is_past_end(self, index: int) -> bool:
+        return self._end is not None and index >= self._end
+
+    def end_at(self, index: int) -> bool:
+        """Page `index` is past the last page: drop it and every later one; False if an earlier end is known"""
+        if self.is_past_end(index):
+            return False
+        self._end = index
+        for pending in [i for i in self._pending if i >= index]:
+            del self._pending[pending]
+        return True
+
+    def add(self, index: int, df):
+        """Queue page `index` (None to skip it); writes every page that is now in order"""
+        if self.is_past_end(index):
+            return
+        self._pending[index] = df
+        while self._next_index in self._pending:
+            page = self._pending.pop(self._next_index)
+            self._next_index += 1
+            if page is not None:
+                self._write(page)
+
+    def _write(self, df):
+        if self.header is None:
+            self.header = list(df.columns)
+            df.to_csv(self._file, index=False)
+        else:
+            self.dropped_columns.update(str(col) for col in df.columns if col not in self.header)
+            df.reindex(columns=self.header).to_csv(self._file, index=False, header=False)
+        self.rows += len(df)
+        self.pages_written += 1
+
+    def close(self):
+        self._file.close()
+
+
+async def crawl(start_url: str, pagination: str, max_pages: int, spool: CsvSpool,
+                limiter: Optional[HostLimiter] = None, fetch_fn=fetch_page) -> Dict[str, Any]:
+    """Crawl the pages of start_url into spool; returns crawl statistics"""
+    max_pages = max(1, min(int(max_pages), CRAWL_MAX_PAGES))
+    limiter = limiter or HostLimiter()
+    pagination = (pagination or '').strip()
+    stats = {"pages_fetched": 0, "failed_pages": [], "stopped": "max_pages"}
+    spool_lock = asyncio.Lock()
+
+    async def fetch(index: int, url: str):
+        """(html, ok): html None with ok=True past the last page, ok=False when the fetch failed"""
+        try:
+            html = await limiter.fetch(fetch_fn, url)
+        except Exception as e:
+            if index == 0:
+                raise
+            stats["failed_pages"].append({"url": url, "error": str(e)})
+            return None, False
+        if html is None and index == 0:
+            raise ValueError(f"Start page not found: {url}")
+        if html is not None:
+            stats["pages_fetched"] += 1
+        return html, True
+
+    async def parse(index: int, html: str):
+        df = await asyncio.to_thread(parse_page_table, html, spool.header)
+        if df is None and index == 0:
+            raise ValueError("No table found on the first page")
+        return df
+
+    async def write(index: int, df):
+        async with spool_lock:
+            await asyncio.to_thread(spool.add, index, df)
+
+    async def end_at(index: int, reason: str):
+        async with spool_lock:
+            if spool.end_at(index):
+                stats["stopped"] = reason
+
+    if pagination == 'next':
+        url, visited, parsing = start_url, set(), []
+
+        async def parse_and_write(index: int, html: str):
+            df = await parse(index, html)
+            if df is None:
+                await end_at(index, "empty_page")
+            else:
+                await write(index, df)
+
+        for index in range(max_pages):
+            visited.add(url)
+            html, ok = await fetch(index, url)
+            if html is None:
+                await end_at(index, "not_found" if ok else "fetch_error")
+                break
+            # Parse this page while the next one downloads
+            parsing.append(asyncio.create_task(parse_and_write(index, html)))
+            next_url = await asyncio.to_thread(find_next_link, html, url)
+            if next_url is None or next_url in visited:
+                stats["stopped"] = "last_page"
+                break
+            url = next_url
+        await asyncio.gather(*parsing)
+        return stats
+
+    if pagination != 'template' and not pagination.startswith('param='):
+        raise ValueError("Pagination must be 'next', 'template' or 'param=<name>'")
+    urls = numbered_pages(start_url, pagination, max_pages)
+
+    async def crawl_page(index: int, url: str):
+        if spool.is_past_end(index):
+            return
+        html, ok = await fetch(index, url)
+        if not ok:
+            await write(index, None)  # skip the failed page, keep the ones after it
+        elif html is None:
+            await end_at(index, "not_found")
+        else:
+            df = await parse(index, html)
+            if df is None:
+                await end_at(index, "empty_page")
+            else:
+                await write(index, df)
+
+    await asyncio.gather(*[crawl_page(index, url) for index, url in enumerate(urls)])
+    return stats
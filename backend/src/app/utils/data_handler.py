@@ -1,26 +1,51 @@
 import os
 import io
+import time
+import asyncio
+import datetime
+import hashlib
+from typing import Optional
 import pandas as pd
 import polars as pl
 import duckdb
 import requests
-from tempfile import NamedTemporaryFile
 from fastapi import UploadFile
 from bs4 import BeautifulSoup
-import google.generativeai as genai
 from dotenv import load_dotenv
 import re
 from urllib.parse import urlparse
 import numpy as np
 
 from app.memory import memory_store
+from app.utils.dataset_profile import build_profile
+from app.utils.dtype_optimizer import optimize_dtypes
+from app.utils.crawler import CRAWL_MAX_PAGES, CsvSpool, crawl
+from app.utils.engine_planner import decide, estimate_table, plan_engine
+from app.utils.excel_ingest import EXCEL_CACHE_DIR, ExcelWorkbook, arrow_to_frame, open_workbook, select_sheets
+from app.utils.ingest_cache import cache_key, ingest_cache
+from app.utils.snapshots import enable_copy_on_write
+from app.utils.metrics import UPLOAD_PARSE_SECONDS, LLM_REQUEST_SECONDS, ENGINE_PLANS, record_cache
+from app.utils.tracing import span, set_attribute
+from app.utils.llm_client import generate
 
 load_dotenv()
-MAX_PANDAS_MB = 100
+# Queries get copy-on-write views of the stored dataset (see snapshots)
+enable_copy_on_write()
+# Upload extensions parsed as data files, and their format; Excel has its own path
+UPLOAD_FORMATS = {'csv': 'csv', 'txt': 'csv', 'json': 'json'}
+# Uploads and remote data files are read (and hashed) in chunks of this size
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Rows per chunk when pandas parses CSV or line-delimited JSON
+PANDAS_CHUNK_ROWS = 100_000
+# Files too large to parse in memory are parsed by DuckDB, spilling here
+DUCKDB_SPOOL_DIR = os.getenv('DUCKDB_SPOOL_DIR', 'backend/data/duckdb')
+DUCKDB_MIN_MEMORY_MB = 256
+DUCKDB_BATCH_ROWS = 1_000_000
+# Spool files that could not be removed right away (mapped, on Windows) are cleaned up after this
+DUCKDB_STALE_SECONDS = 3600
 
-# Configure Gemini for web scraping
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-1.5-flash')  # Updated model name
+# Gemini model used for web scraping
+MODEL_NAME = 'gemini-1.5-flash'  # Updated model name
 
 def make_json_serializable(obj):
     """Convert pandas/numpy objects to JSON serializable format"""
@@ -39,6 +64,8 @@ def make_json_serializable(obj):
         return obj.item()
     elif isinstance(obj, np.ndarray):
         return obj.tolist()
+    elif isinstance(obj, (datetime.date, datetime.time)):  # incl. pd.Timestamp and NaT
+        return None if pd.isna(obj) else obj.isoformat()
     elif pd.isna(obj):
         return None
     elif hasattr(obj, 'name'):  # pandas dtype objects
@@ -46,6 +73,38 @@ def make_json_serializable(obj):
     else:
         return obj
 
+def prepare_dataset(df, engine: str):
+    """Optimize dtypes and build the profile of a freshly parsed dataset; returns (df, profile, dtype report)"""
+    with span('dtypes.optimize') as optimize_span:
+        df, dtype_report = optimize_dtypes(df, engine)
+        if optimize_span is not None and 'bytes_after' in dtype_report:
+            optimize_span.set_attribute('bytes_before', dtype_report['bytes_before'])
+            optimize_span.set_attribute('bytes_after', dtype_report['bytes_after'])
+    with span('profile.build'):
+        profile = build_profile(df, engine)
+    return df, profile, dtype_report
+
+def store_dataset(df, engine: str, filename: str, profile: Optional[dict] = None,
+                  dtype_report: Optional[dict] = None, **metadata):
+    """Make df the active dataset, with its profile, in one persisted update; returns the dtype report.
+    Pass profile (and dtype_report) when df was already prepared, e.g. loaded from the ingest cache."""
+    if profile is None:
+        df, profile, dtype_report = prepare_dataset(df, engine)
+    memory_store.update({
+        'dataframe': df,
+        'engine': engine,
+        'filename': filename,
+        'profile': profile,
+        # Source info only applies to the dataset it was scraped for
+        'scraping_code': metadata.pop('scraping_code', None),
+        'url_source': metadata.pop('url_source', None),
+        # Workbook and active sheet, for switching sheets of an Excel upload
+        'excel': metadata.pop('excel', None),
+        'dtype_report': dtype_report,
+        **metadata,
+    })
+    return dtype_report
+
 def create_safe_preview_data(df):
     """Create JSON-safe preview data from DataFrame"""
     try:
@@ -93,60 +152,253 @@ def create_safe_preview_data(df):
             "null_counts": {}
         }
 
-async def handle_upload(file: UploadFile):
-    content = await file.read()
-    size_mb = len(content) / 1024 / 1024
+def _preview_records(df, n: int = 3):
+    try:
+        if hasattr(df, 'to_dicts'):  # polars
+            return make_json_serializable(df.head(n).to_dicts())
+        return make_json_serializable(df.head(n).to_dict('records'))
+    except:
+        return None
+
+def _load_sheet(workbook: ExcelWorkbook, sheet: dict):
+    """(df, engine plan) for a sheet, in the engine its size calls for; df is None when it doesn't fit"""
+    table = workbook.table(sheet)
+    # Already a memory-mapped Arrow file: only pandas or Polars over it
+    plan = decide(estimate_table(table), 'xlsx', strategies=('pandas', 'polars'))
+    ENGINE_PLANS.inc(strategy=plan['strategy'] or 'rejected')
+    if plan['engine'] is None:
+        return None, plan
+    return arrow_to_frame(table, plan['engine']), plan
+
+async def _load_excel(content: bytes, ext: str, sheets: Optional[str]):
+    """Parse the requested sheets of a workbook (cached by content hash); the first one becomes active.
+    Returns (workbook, active sheet, df, engine plan)."""
+    def load():
+        workbook = open_workbook(content, ext)
+        selected = select_sheets(workbook, sheets)
+        with span('excel.parse', sheets=len(selected)):
+            workbook.parse(selected)
+        return (workbook, selected[0], *_load_sheet(workbook, selected[0]))
+    # Sheets are parsed in worker processes; don't hold the event loop while waiting
+    return await asyncio.to_thread(load)
+
+async def _plan_engine(source, fmt: str, size_bytes: int, file_hash: Optional[str] = None):
+    """Engine plan for a data file given as bytes or a path (see engine_planner); returns (plan, df or None)"""
+    with span('engine.plan', format=fmt) as plan_span:
+        plan, df = await asyncio.to_thread(plan_engine, source, fmt, size_bytes, file_hash)
+        if plan_span is not None:
+            plan_span.set_attribute('strategy', plan['strategy'] or 'rejected')
+    ENGINE_PLANS.inc(strategy=plan['strategy'] or 'rejected')
+    return plan, df
+
+def _too_large(plan: dict) -> dict:
+    return {"error": f"The dataset is too large to load. {plan['reason']}"}
+
+async def _ingest_cache_lookup(file_hash: str, ext: str):
+    """(engine, (df, meta)) for content already converted once, in whichever engine it was planned for,
+    or (None, None). Looked up before planning, so a hit costs no sampling."""
+    if not ingest_cache.enabled:
+        return None, None
+    
+    def lookup():
+        for engine in ('pandas', 'polars'):
+            cached = ingest_cache.get(cache_key(file_hash, ext, engine), engine)
+            if cached is not None:
+                return engine, cached
+        return None, None
+    with span('ingest_cache.lookup') as lookup_span:
+        engine, cached = await asyncio.to_thread(lookup)
+        if lookup_span is not None:
+            lookup_span.set_attribute('hit', cached is not None)
+    record_cache('ingest', cached is not None)
+    return engine, cached
+
+async def _prepare_and_cache(df, engine: str, key: Optional[str], filename: str, engine_plan: Optional[dict] = None):
+    """prepare_dataset, then keep the result (and the plan that chose its engine) in the ingest cache under key;
+    returns (df, profile, dtype report)"""
+    df, profile, dtype_report = await asyncio.to_thread(prepare_dataset, df, engine)
+    if key is not None:
+        with span('ingest_cache.store'):
+            await asyncio.to_thread(ingest_cache.put, key, df, engine, extra_dirs=[EXCEL_CACHE_DIR],
+                                    profile=profile, dtype_report=dtype_report, filename=filename,
+                                    engine_plan=engine_plan)
+    return df, profile, dtype_report
+
+async def _read_hashed(file: UploadFile):
+    """Read an upload in chunks, hashing it on the way; returns (content, sha256 hex digest)"""
+    hasher = hashlib.sha256()
+    chunks = []
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        chunks.append(chunk)
+    return b''.join(chunks), hasher.hexdigest()
+
+async def handle_upload(file: UploadFile, sheets: Optional[str] = None, append: bool = False):
+    """Parse an uploaded file into the active dataset; append=True adds its rows to the active dataset instead"""
+    with span('upload.read'):
+        content, file_hash = await _read_hashed(file)
     ext = file.filename.split('.')[-1].lower()
-    if size_mb > MAX_PANDAS_MB:
-        # Use Polars or DuckDB
-        if ext in ['csv', 'txt']:
-            df = pl.read_csv(io.BytesIO(content))
-        elif ext in ['json']:
-            df = pl.read_json(io.BytesIO(content))
-        elif ext in ['xls', 'xlsx']:
-            with NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-                tmp.write(content)
-                tmp.flush()
-                df = pl.read_excel(tmp.name)
-        else:
-            return {"error": "Unsupported file type for large file."}
-        memory_store['dataframe'] = df
-        memory_store['engine'] = 'polars'
-    else:
-        # Use Pandas
-        if ext in ['csv', 'txt']:
-            df = pd.read_csv(io.BytesIO(content))
-        elif ext in ['json']:
-            df = pd.read_json(io.BytesIO(content))
-        elif ext in ['xls', 'xlsx']:
-            df = pd.read_excel(io.BytesIO(content))
-        else:
-            return {"error": "Unsupported file type."}
-        memory_store['dataframe'] = df
-        memory_store['engine'] = 'pandas'
+    fmt = UPLOAD_FORMATS.get(ext)
+    if fmt is None and ext not in ['xls', 'xlsx']:
+        return {"error": "Unsupported file type."}
     
-    memory_store['filename'] = file.filename
+    key = parsed = None
+    if fmt:
+        # Same bytes seen before: map the converted file instead of parsing again
+        # (Excel has its own per-sheet cache in excel_ingest)
+        engine, cached = await _ingest_cache_lookup(file_hash, ext)
+        if cached is not None:
+            df, meta = cached
+            plan = meta.get('engine_plan')
+            set_attribute('rows', len(df))
+            if append and memory_store.get('dataframe') is not None:
+                return await asyncio.to_thread(_append_upload, df, engine, file.filename, content, plan)
+            with span('dataset.store'):
+                dtype_report = await asyncio.to_thread(store_dataset, df, engine, file.filename,
+                                                       profile=meta['profile'], dtype_report=meta.get('dtype_report'))
+            return _upload_response(df, file.filename, content, dtype_report, ingest_cache="hit", engine_plan=plan)
     
-    # Generate preview data
-    preview_data = None
-    try:
-        if hasattr(df, 'head'):  # pandas
-            preview_data = make_json_serializable(df.head(3).to_dict('records'))
-        else:  # polars
-            preview_data = df.head(3).to_dicts()
-    except:
-        preview_data = None
+    plan_start = time.perf_counter()
+    if fmt:
+        # Engine from the estimated in-memory size, not the file size
+        plan, parsed = await _plan_engine(content, fmt, len(content), file_hash)
+        if plan['engine'] is None:
+            return _too_large(plan)
+        engine = plan['engine']
+        key = cache_key(file_hash, ext, engine) if ingest_cache.enabled else None
     
-    return {
+    workbook = sheet = None
+    if fmt is None:
+        parse_start = plan_start
+        try:
+            workbook, sheet, df, plan = await _load_excel(content, ext, sheets)
+        except ValueError as e:
+            return {"error": str(e)}
+        if df is None:
+            return _too_large(plan)
+        engine = plan['engine']
+    elif parsed is not None:
+        # Small enough that sampling parsed all of it
+        parse_start, df = plan_start, parsed
+    else:
+        parse_start = time.perf_counter()
+        with span('upload.parse', format=fmt, strategy=plan['strategy']):
+            df = await asyncio.to_thread(read_data_file, content, fmt, plan)
+    UPLOAD_PARSE_SECONDS.observe(time.perf_counter() - parse_start, format=ext, engine=engine)
+    set_attribute('parse_ms', round((time.perf_counter() - parse_start) * 1000, 3))
+    
+    set_attribute('rows', len(df))
+    if append and memory_store.get('dataframe') is not None:
+        return await asyncio.to_thread(_append_upload, df, engine, file.filename, content, plan)
+    excel = {"file_hash": workbook.file_hash, "sheet": sheet['name']} if workbook else None
+    df, profile, dtype_report = await _prepare_and_cache(df, engine, key, file.filename, plan)
+    with span('dataset.store'):
+        await asyncio.to_thread(store_dataset, df, engine, file.filename, profile=profile,
+                                dtype_report=dtype_report, excel=excel)
+    
+    response = _upload_response(df, file.filename, content, dtype_report,
+                                ingest_cache="miss" if key is not None else None, engine_plan=plan)
+    if workbook:
+        response["active_sheet"] = sheet['name']
+        response["sheets"] = workbook.describe()
+    return response
+
+def _append_upload(df, engine: str, filename: str, content: bytes, engine_plan: Optional[dict] = None) -> dict:
+    """Add df's rows after the active dataset's and refresh pinned analyses from just those rows.
+    Blocking: concatenates, prepares and stores the combined dataset, so call it off the event loop."""
+    from app.utils.materialized import refresh_analyses
+
+    active, active_engine, version = memory_store.snapshot()
+    missing = [str(col) for col in active.columns if col not in df.columns]
+    unexpected = [str(col) for col in df.columns if col not in active.columns]
+    if missing or unexpected:
+        return {"error": f"Appended rows must have the active dataset's columns. "
+                         f"Missing: {missing}, unexpected: {unexpected}"}
+    if engine != active_engine:
+        df = df.to_pandas() if active_engine == 'pandas' else pl.from_pandas(df)
+    with span('dataset.append', rows=len(df)):
+        if active_engine == 'pandas':
+            delta = df[list(active.columns)]
+            combined = pd.concat([active, delta], ignore_index=True)
+        else:
+            delta = df.select(active.columns)
+            combined = pl.concat([active, delta], how='vertical_relaxed')
+    combined, profile, dtype_report = prepare_dataset(combined, active_engine)
+    with span('dataset.store'):
+        store_dataset(combined, active_engine, memory_store.get('filename', filename), profile=profile,
+                      dtype_report=dtype_report, scraping_code=memory_store.get('scraping_code'),
+                      url_source=memory_store.get('url_source'))
+    response = _upload_response(combined, filename, content, dtype_report, engine_plan=engine_plan)
+    response["appended_rows"] = len(delta)
+    response["message"] = (f"Appended {len(delta)} rows; the dataset now has {len(combined)} rows "
+                           f"and {len(combined.columns)} columns")
+    with span('materialized.refresh'):
+        response["analyses"] = refresh_analyses(delta, version)
+    return response
+
+def _upload_response(df, filename: str, content: bytes, dtype_report: dict, ingest_cache: Optional[str] = None,
+                     engine_plan: Optional[dict] = None):
+    response = {
         "status": "success", 
         "rows": len(df),
         "columns": len(df.columns),
-        "filename": file.filename,
+        "filename": filename,
         "size": f"{len(content) / 1024:.1f} KB",
         "type": "file_upload",
-        "preview": preview_data,
+        "preview": _preview_records(df),
+        "dtype_optimization": dtype_report,
         "message": f"Successfully loaded {len(df)} rows and {len(df.columns)} columns"
     }
+    if ingest_cache:
+        response["ingest_cache"] = ingest_cache
+    if engine_plan:
+        response["engine_plan"] = engine_plan
+    return response
+
+async def select_excel_sheet(sheet_name: str):
+    """Make another sheet of the uploaded workbook the active dataset, without re-uploading"""
+    excel = memory_store.get('excel')
+    if not excel:
+        return {"error": "The active dataset is not an Excel workbook. Upload one first."}
+    workbook = ExcelWorkbook(excel['file_hash'])
+    if not workbook.sheets or not os.path.exists(workbook.workbook_path):
+        return {"error": "The workbook is no longer cached. Please upload it again."}
+    sheet = workbook.sheet(sheet_name)
+    if sheet is None:
+        return {"error": f"Sheet '{sheet_name}' not found. Available: {[s['name'] for s in workbook.sheets]}"}
+    
+    with span('excel.load_sheet', sheet=sheet['name']):
+        df, plan = await asyncio.to_thread(_load_sheet, workbook, sheet)
+    if df is None:
+        return _too_large(plan)
+    engine = plan['engine']
+    filename = memory_store.get('filename')
+    with span('dataset.store'):
+        dtype_report = await asyncio.to_thread(store_dataset, df, engine, filename,
+                                               excel={"file_hash": workbook.file_hash, "sheet": sheet['name']})
+    return {
+        "status": "success",
+        "rows": len(df),
+        "columns": len(df.columns),
+        "filename": filename,
+        "type": "sheet_switch",
+        "active_sheet": sheet['name'],
+        "sheets": workbook.describe(),
+        "preview": _preview_records(df),
+        "dtype_optimization": dtype_report,
+        "engine_plan": plan,
+        "message": f"Switched to sheet '{sheet['name']}': {len(df)} rows and {len(df.columns)} columns"
+    }
+
+def get_excel_sheets():
+    """Sheets of the active workbook, or None if the dataset is not from Excel"""
+    excel = memory_store.get('excel')
+    if not excel:
+        return None
+    return {"active_sheet": excel['sheet'], "sheets": ExcelWorkbook(excel['file_hash']).describe()}
 
 async def handle_url_data(url: str):
     """Enhanced URL data handler with Wikipedia specialization"""
@@ -159,6 +411,58 @@ async def handle_url_data(url: str):
     except Exception as e:
         return {"error": f"Failed to process URL: {str(e)}"}
 
+async def handle_crawl(url: str, pagination: str, max_pages: Optional[int] = None):
+    """Crawl a paginated table (see crawler) into one dataset"""
+    import tempfile
+    
+    fd, spool_path = tempfile.mkstemp(suffix='.csv', prefix='crawl-')
+    os.close(fd)
+    spool = CsvSpool(spool_path)
+    try:
+        try:
+            with span('crawl', url=url, pagination=pagination):
+                stats = await crawl(url, pagination, max_pages or CRAWL_MAX_PAGES, spool)
+        finally:
+            spool.close()
+        if not spool.rows:
+            return {"error": "No table rows found on the crawled pages"}
+        
+        plan, df = await _plan_engine(spool_path, 'csv', os.path.getsize(spool_path))
+        if plan['engine'] is None:
+            return _too_large(plan)
+        engine = plan['engine']
+        if df is None:
+            # Types are inferred from every page's rows, not just the first page
+            with span('upload.parse', format='crawl', strategy=plan['strategy']), \
+                    UPLOAD_PARSE_SECONDS.time(format='crawl', engine=engine):
+                df = await asyncio.to_thread(read_data_file, spool_path, 'csv', plan, True)
+    except ValueError as e:
+        return {"error": f"Failed to crawl URL: {e}"}
+    except requests.RequestException as e:
+        return {"error": f"Failed to fetch URL: {e}"}
+    finally:
+        os.remove(spool_path)
+    
+    filename = f"crawled_{urlparse(url).netloc or 'data'}.csv"
+    with span('dataset.store'):
+        dtype_report = await asyncio.to_thread(store_dataset, df, engine, filename, url_source=url)
+    return {
+        "status": "success",
+        "rows": len(df),
+        "columns": len(df.columns),
+        "filename": filename,
+        "type": "crawl",
+        "pages": spool.pages_written,
+        "pages_fetched": stats["pages_fetched"],
+        "failed_pages": stats["failed_pages"],
+        "stopped": stats["stopped"],
+        "dropped_columns": sorted(spool.dropped_columns),
+        "preview": _preview_records(df),
+        "dtype_optimization": dtype_report,
+        "engine_plan": plan,
+        "message": f"Crawled {spool.pages_written} pages into {len(df)} rows and {len(df.columns)} columns"
+    }
+
 def is_wikipedia_url(url: str) -> bool:
     """Check if URL is a Wikipedia page"""
     parsed = urlparse(url.lower())
@@ -171,7 +475,8 @@ async def handle_wikipedia_url(url: str):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
-        response = requests.get(url, headers=headers, timeout=30)
+        with span('url.fetch', url=url):
+            response = requests.get(url, headers=headers, timeout=30)
         response.raise_for_status()
         soup = BeautifulSoup(response.content, 'html.parser')
         
@@ -203,11 +508,9 @@ async def handle_wikipedia_url(url: str):
                             # Use AI to generate web scraping code for this specific Wikipedia page
                             scraping_code = await generate_wikipedia_scraping_code(url, title_text, df.head(3))
                             
-                            memory_store['dataframe'] = df
-                            memory_store['engine'] = 'pandas'
-                            memory_store['filename'] = f"wikipedia_{title_text.replace(' ', '_')}_table_{i+1}.csv"
-                            memory_store['scraping_code'] = scraping_code
-                            memory_store['url_source'] = url
+                            filename = f"wikipedia_{title_text.replace(' ', '_')}_table_{i+1}.csv"
+                            await asyncio.to_thread(store_dataset, df, 'pandas', filename,
+                                                    scraping_code=scraping_code, url_source=url)
                             
                             # Generate preview data
                             preview_data = create_safe_preview_data(df)
@@ -281,11 +584,8 @@ async def extract_wikipedia_lists(soup, url, title_text):
             # Generate scraping code
             scraping_code = await generate_wikipedia_scraping_code(url, title_text, df.head(3))
             
-            memory_store['dataframe'] = df
-            memory_store['engine'] = 'pandas'
-            memory_store['filename'] = f"wikipedia_{title_text.replace(' ', '_')}_lists.csv"
-            memory_store['scraping_code'] = scraping_code
-            memory_store['url_source'] = url
+            await asyncio.to_thread(store_dataset, df, 'pandas', f"wikipedia_{title_text.replace(' ', '_')}_lists.csv",
+                                    scraping_code=scraping_code, url_source=url)
             
             return {
                 "status": "success", 
@@ -326,8 +626,8 @@ Only return the Python code, no explanations.
 """
 
     try:
-        response = model.generate_content(prompt)
-        scraping_code = response.text.strip()
+        with span('llm.call', caller='data_handler'), LLM_REQUEST_SECONDS.time(caller='data_handler'):
+            scraping_code = generate(prompt, MODEL_NAME).strip()
         
         # Clean the code if it has markdown formatting
         if "```python" in scraping_code:
@@ -339,6 +639,170 @@ Only return the Python code, no explanations.
     except Exception as e:
         return f"# Error generating scraping code: {str(e)}\n# Manual scraping required"
 
+def _remote_format(url: str, content_type: str) -> Optional[str]:
+    """'csv', 'json' or 'ndjson' for a direct data file URL, None for a web page"""
+    path = urlparse(url).path.lower()
+    if 'ndjson' in content_type or path.endswith(('.jsonl', '.ndjson')):
+        return 'ndjson'
+    if 'csv' in content_type or path.endswith('.csv'):
+        return 'csv'
+    if 'json' in content_type or path.endswith('.json'):
+        return 'json'
+    return None
+
+def _spool_response(response, path: str) -> str:
+    """Stream a response body to path in chunks, hashing it on the way; returns the sha256 hex digest"""
+    hasher = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for chunk in response.iter_content(UPLOAD_CHUNK_BYTES):
+            hasher.update(chunk)
+            f.write(chunk)
+    return hasher.hexdigest()
+
+def _collect_streaming(lazy_frame):
+    try:
+        return lazy_frame.collect(engine='streaming')
+    except TypeError:  # polars < 1.0
+        return lazy_frame.collect(streaming=True)
+
+def _remove_stale_spool_files():
+    now = time.time()
+    for entry in os.scandir(DUCKDB_SPOOL_DIR):
+        try:
+            # Only our spool files; DuckDB keeps its own spill files here too
+            if entry.name.startswith('spool-') and now - entry.stat().st_mtime > DUCKDB_STALE_SECONDS:
+                os.remove(entry.path)
+        except OSError:  # still mapped by the active dataset, or removed meanwhile
+            pass
+
+def _read_with_duckdb(source, fmt: str, memory_limit_mb: float, infer_all_rows: bool = False):
+    """Parse with DuckDB under a memory limit, spilling to disk, into an Arrow file the frame is mapped from"""
+    import tempfile
+    import pyarrow as pa
+    
+    os.makedirs(DUCKDB_SPOOL_DIR, exist_ok=True)
+    _remove_stale_spool_files()
+    spooled = None
+    if isinstance(source, (bytes, bytearray)):
+        fd, spooled = tempfile.mkstemp(dir=DUCKDB_SPOOL_DIR, prefix='spool-', suffix='.' + fmt)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(source)
+        source = spooled
+    fd, arrow_path = tempfile.mkstemp(dir=DUCKDB_SPOOL_DIR, prefix='spool-', suffix='.arrow')
+    os.close(fd)
+    reader = {
+        'csv': "read_csv_auto(?, sample_size=-1)" if infer_all_rows else "read_csv_auto(?)",
+        'ndjson': "read_json_auto(?, format='newline_delimited')",
+        'json': "read_json_auto(?)",
+    }[fmt]
+    con = duckdb.connect(config={'memory_limit': f"{max(int(memory_limit_mb), DUCKDB_MIN_MEMORY_MB)}MB",
+                                 'temp_directory': DUCKDB_SPOOL_DIR})
+    try:
+        result = con.execute(f"SELECT * FROM {reader}", [source])
+        batches = result.to_arrow_reader(DUCKDB_BATCH_ROWS) if hasattr(result, 'to_arrow_reader') \
+            else result.fetch_record_batch(DUCKDB_BATCH_ROWS)  # duckdb < 1.4
+        with pa.OSFile(arrow_path, 'wb') as sink, pa.ipc.new_file(sink, batches.schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+        table = pa.ipc.open_file(pa.memory_map(arrow_path, 'r')).read_all()
+    finally:
+        con.close()
+        # On POSIX the mapping outlives the file name: its pages stay readable until the
+        # frame is dropped. Windows refuses to remove a mapped file; a later load does.
+        for path in (spooled, arrow_path):
+            if path is None:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    # Not rechunked, which would copy the mapped columns into memory
+    return pl.from_arrow(table, rechunk=False)
+
+def read_data_file(source, fmt: str, plan: dict, infer_all_rows: bool = False):
+    """Parse a data file (bytes or a path) with the strategy of its engine plan, never as one decoded string.
+    infer_all_rows takes column types from every row instead of the first ones."""
+    strategy = plan['strategy']
+    if strategy == 'duckdb':
+        return _read_with_duckdb(source, fmt, plan['inputs']['usable_mb'], infer_all_rows)
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    schema_rows = None if infer_all_rows else 100
+    if strategy == 'polars_lazy':
+        if fmt == 'csv':
+            return _collect_streaming(pl.scan_csv(source, infer_schema_length=schema_rows))
+        return _collect_streaming(pl.scan_ndjson(source))
+    if strategy == 'polars':
+        if fmt == 'csv':
+            return pl.read_csv(source, infer_schema_length=schema_rows)
+        if fmt == 'ndjson':
+            return pl.read_ndjson(source)
+        return pl.read_json(source)
+    if fmt == 'csv':
+        if infer_all_rows:
+            # One pass, so every column gets a single type from all of its rows
+            return pd.read_csv(source, low_memory=False)
+        chunks = pd.read_csv(source, chunksize=PANDAS_CHUNK_ROWS)
+        return pd.concat(chunks, ignore_index=True)
+    if fmt == 'ndjson':
+        chunks = pd.read_json(source, lines=True, chunksize=PANDAS_CHUNK_ROWS)
+        return pd.concat(chunks, ignore_index=True)
+    return pd.read_json(source)
+
+async def _ingest_remote_file(url: str, response, fmt: str):
+    """Stream a remote CSV/JSON file to a spool file and load it like an upload"""
+    import tempfile
+    
+    filename = urlparse(url).path.split('/')[-1] or f"scraped_data.{fmt}"
+    fd, path = tempfile.mkstemp(suffix='.' + fmt, prefix='remote-')
+    os.close(fd)
+    try:
+        with span('url.download', url=url):
+            file_hash = await asyncio.to_thread(_spool_response, response, path)
+        # The streamed size rather than Content-Length, which is the compressed size for gzip responses
+        size_bytes = os.path.getsize(path)
+        set_attribute('bytes', size_bytes)
+        
+        engine, cached = await _ingest_cache_lookup(file_hash, fmt)
+        key = None
+        if cached is not None:
+            df, meta = cached
+            profile, dtype_report, plan = meta['profile'], meta.get('dtype_report'), meta.get('engine_plan')
+        else:
+            plan, parsed = await _plan_engine(path, fmt, size_bytes, file_hash)
+            if plan['engine'] is None:
+                return _too_large(plan)
+            engine = plan['engine']
+            key = cache_key(file_hash, fmt, engine) if ingest_cache.enabled else None
+            if parsed is not None:
+                df = parsed
+            else:
+                with span('upload.parse', format=fmt, strategy=plan['strategy']), \
+                        UPLOAD_PARSE_SECONDS.time(format=fmt, engine=engine):
+                    df = await asyncio.to_thread(read_data_file, path, fmt, plan)
+            df, profile, dtype_report = await _prepare_and_cache(df, engine, key, filename, plan)
+    finally:
+        response.close()
+        os.remove(path)
+    
+    with span('dataset.store'):
+        await asyncio.to_thread(store_dataset, df, engine, filename, profile=profile, dtype_report=dtype_report)
+    response_data = {
+        "status": "success",
+        "rows": len(df),
+        "columns": len(df.columns),
+        "filename": filename,
+        "size": f"{size_bytes / 1024:.1f} KB",
+        "engine": engine,
+        "engine_plan": plan,
+        "type": "direct_csv" if fmt == 'csv' else "direct_json",
+        "preview": create_safe_preview_data(df),
+        "dtype_optimization": dtype_report,
+    }
+    if ingest_cache.enabled:
+        response_data["ingest_cache"] = "hit" if cached is not None else "miss"
+    return response_data
+
 async def handle_generic_url(url: str):
     """Handle URL scraping and data extraction"""
     try:
@@ -346,35 +810,19 @@ async def handle_generic_url(url: str):
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        response = requests.get(url, headers=headers, timeout=10)
+        with span('url.fetch', url=url):
+            # Headers only: data files are streamed to disk, pages read below
+            response = await asyncio.to_thread(requests.get, url, headers=headers, timeout=10, stream=True)
         response.raise_for_status()
         
-        # Parse with BeautifulSoup
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # First, check if it's a direct data file (CSV, JSON, etc.)
+        # Direct data files (CSV, JSON) skip HTML parsing entirely
         content_type = response.headers.get('content-type', '').lower()
-        if 'csv' in content_type or url.endswith('.csv'):
-            df = pd.read_csv(io.StringIO(response.text))
-            memory_store['dataframe'] = df
-            memory_store['engine'] = 'pandas'
-            memory_store['filename'] = url.split('/')[-1] or 'scraped_data.csv'
-            
-            # Generate preview data
-            preview_data = create_safe_preview_data(df)
-            
-            return {"status": "success", "rows": len(df), "type": "direct_csv", "preview": preview_data}
+        fmt = _remote_format(url, content_type)
+        if fmt:
+            return await _ingest_remote_file(url, response, fmt)
         
-        elif 'json' in content_type or url.endswith('.json'):
-            df = pd.read_json(io.StringIO(response.text))
-            memory_store['dataframe'] = df
-            memory_store['engine'] = 'pandas'
-            memory_store['filename'] = url.split('/')[-1] or 'scraped_data.json'
-            
-            # Generate preview data
-            preview_data = create_safe_preview_data(df)
-            
-            return {"status": "success", "rows": len(df), "type": "direct_json", "preview": preview_data}
+        # Parse with BeautifulSoup
+        soup = BeautifulSoup(response.content, 'html.parser')
         
         # For HTML pages, use AI to identify and extract tabular data
         # Look for tables first
@@ -385,9 +833,8 @@ async def handle_generic_url(url: str):
                 try:
                     df = pd.read_html(str(table))[0]
                     if len(df) > 1 and len(df.columns) > 1:  # Must have some data
-                        memory_store['dataframe'] = df
-                        memory_store['engine'] = 'pandas'
-                        memory_store['filename'] = f"scraped_table_{url.split('/')[-1] or 'data'}.csv"
+                        await asyncio.to_thread(store_dataset, df, 'pandas',
+                                                f"scraped_table_{url.split('/')[-1] or 'data'}.csv")
                         
                         # Generate preview data
                         preview_data = create_safe_preview_data(df)
@@ -413,8 +860,8 @@ async def handle_generic_url(url: str):
         """
         
         try:
-            response = model.generate_content(prompt)
-            ai_response = response.text.strip()
+            with span('llm.call', caller='data_handler'), LLM_REQUEST_SECONDS.time(caller='data_handler'):
+                ai_response = generate(prompt, MODEL_NAME).strip()
             
             if ai_response == "NO_STRUCTURED_DATA":
                 return {"error": "No structured data found on the webpage"}
@@ -430,9 +877,7 @@ async def handle_generic_url(url: str):
             
             if 'df' in local_vars:
                 df = local_vars['df']
-                memory_store['dataframe'] = df
-                memory_store['engine'] = 'pandas'
-                memory_store['filename'] = f"ai_extracted_{url.split('/')[-1] or 'data'}.csv"
+                await asyncio.to_thread(store_dataset, df, 'pandas', f"ai_extracted_{url.split('/')[-1] or 'data'}.csv")
                 
                 # Generate preview data
                 preview_data = create_safe_preview_data(df)
@@ -0,0 +1,89 @@
+"""
+Dataset profile computed once at ingest time.
+Cheap facts about the loaded dataset (shape, dtypes, null counts, value counts
+of low-cardinality columns) so common questions can be answered without
+scanning the data again.
+"""
+
+from typing import Any, Dict
+
+# Columns with at most this many distinct values get their value counts stored
+MAX_PROFILE_CATEGORIES = 50
+
+
+def _pandas_profile(df) -> Dict[str, Any]:
+    import pandas as pd
+
+    null_counts = {str(col): int(count) for col, count in df.isnull().sum().items()}
+    memory_bytes = {str(col): int(size) for col, size in df.memory_usage(deep=True, index=False).items()}
+    numeric_columns = [str(col) for col in df.select_dtypes(include='number').columns]
+
+    top_values = {}
+    for col in df.columns:
+        if str(col) in numeric_columns:
+            continue
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            continue
+        try:
+            counts = series.value_counts(dropna=True)
+        except TypeError:  # unhashable values (lists, dicts)
+            continue
+        if len(counts) <= MAX_PROFILE_CATEGORIES:
+            top_values[str(col)] = {str(k): int(v) for k, v in counts.items()}
+
+    return {
+        "rows": int(len(df)),
+        "columns": [str(col) for col in df.columns],
+        "dtypes": {str(col): str(dtype) for col, dtype in df.dtypes.items()},
+        "null_counts": null_counts,
+        "memory_bytes": memory_bytes,
+        "numeric_columns": numeric_columns,
+        "top_values": top_values,
+    }
+
+
+def _polars_profile(df) -> Dict[str, Any]:
+    import polars as pl
+
+    null_row = df.null_count().row(0)
+    null_counts = {col: int(count) for col, count in zip(df.columns, null_row)}
+    memory_bytes = {col: int(df[col].estimated_size()) for col in df.columns}
+    numeric_columns = [col for col, dtype in zip(df.columns, df.dtypes) if dtype.is_numeric()]
+
+    top_values = {}
+    for col, dtype in zip(df.columns, df.dtypes):
+        if col in numeric_columns or dtype.is_temporal():
+            continue
+        try:
+            if df[col].n_unique() > MAX_PROFILE_CATEGORIES + 1:  # +1 for null
+                continue
+            counts = df[col].drop_nulls().value_counts(sort=True)
+        except (pl.exceptions.InvalidOperationError, pl.exceptions.ComputeError):
+            continue
+        top_values[col] = {str(k): int(v) for k, v in counts.iter_rows()}
+
+    return {
+        "rows": int(df.height),
+        "columns": list(df.columns),
+        "dtypes": {col: str(dtype) for col, dtype in zip(df.columns, df.dtypes)},
+        "null_counts": null_counts,
+        "memory_bytes": memory_bytes,
+        "numeric_columns": numeric_columns,
+        "top_values": top_values,
+    }
+
+
+def build_profile(df, engine: str) -> Dict[str, Any]:
+    """Compute the dataset profile stored alongside the dataframe"""
+    try:
+        if engine == 'pandas':
+            return _pandas_profile(df)
+        return _polars_profile(df)
+    except Exception as e:
+        print(f"⚠️ Could not build dataset profile: {e}")
+        # Partial profile: the fast path only answers what is known here
+        return {
+            "rows": int(len(df)),
+            "columns": [str(col) for col in df.columns],
+        }
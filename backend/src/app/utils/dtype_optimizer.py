@@ -0,0 +1,204 @@
+"""
+Dtype optimization at ingest.
+Parsers load every integer as int64 and every string as a Python object.
+This stage shrinks a freshly loaded dataset before it is stored:
+  - integers are downcast to int16/int32 when the column's values, with
+    8 bits of headroom, still fit;
+  - floats are only downcast to float32 when every value round-trips exactly
+    and DTYPE_DOWNCAST_FLOATS=1, since float32 aggregates round differently;
+  - low-cardinality strings become categoricals (pandas 'category', polars
+    Categorical);
+  - text columns that all look like dates are parsed to datetimes once,
+    vectorized, and only kept if no value was lost.
+Values are never changed, only their storage. Narrow integers wrap around in
+products and cumulative sums, and categoricals change groupby output (unobserved
+categories), so generated code does not see the stored dtypes: widen_dtypes
+gives it integers as int64 and categoricals as their values' dtype, only for
+the columns it runs on. Set DTYPE_OPTIMIZATION=0 to disable.
+"""
+
+import os
+import re
+from typing import Any, Dict, Tuple
+
+DTYPE_OPTIMIZATION = os.getenv('DTYPE_OPTIMIZATION', '1') != '0'
+DTYPE_DOWNCAST_FLOATS = os.getenv('DTYPE_DOWNCAST_FLOATS', '0') == '1'
+
+# Strings become categoricals when they have at most this many distinct values
+# and repeat on average at least CATEGORY_MIN_REPEAT times
+CATEGORY_MAX_UNIQUE = 1000
+CATEGORY_MIN_REPEAT = 2
+# Integers keep this many bits free above their largest absolute value
+INT_HEADROOM_BITS = 8
+DATETIME_SAMPLE = 200
+_DATE_LIKE = re.compile(
+    r"^\s*(\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4})([ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?)?"
+    r"\s*(Z|[+-]\d{2}:?\d{2})?\s*$"
+)
+
+_INT_LIMITS = [('int16', 2 ** 15 - 1), ('int32', 2 ** 31 - 1)]
+
+
+def _int_target(min_value, max_value) -> str:
+    needed = max(abs(int(min_value)), abs(int(max_value))) << INT_HEADROOM_BITS
+    for name, limit in _INT_LIMITS:
+        if needed <= limit:
+            return name
+    return 'int64'
+
+
+def _is_category_candidate(n_unique: int, n_values: int) -> bool:
+    return 0 < n_unique <= CATEGORY_MAX_UNIQUE and n_values >= n_unique * CATEGORY_MIN_REPEAT
+
+
+def _looks_like_dates(sample) -> bool:
+    return len(sample) > 0 and all(isinstance(v, str) and _DATE_LIKE.match(v) for v in sample)
+
+
+def _optimize_pandas(df):
+    import numpy as np
+    import pandas as pd
+
+    changes = {}
+    converted = {}
+    for col in df.columns:
+        series = df[col]
+        dtype = series.dtype
+        new = None
+        if isinstance(dtype, pd.CategoricalDtype):
+            continue
+        try:
+            if pd.api.types.is_integer_dtype(dtype):
+                # numpy ints only; nullable Int64 etc. are left alone
+                if isinstance(dtype, np.dtype) and len(series) and dtype.kind == 'i' and dtype.itemsize > 2:
+                    target = _int_target(series.min(), series.max())
+                    if np.dtype(target).itemsize < dtype.itemsize:
+                        new = series.astype(target)
+            elif pd.api.types.is_float_dtype(dtype):
+                if DTYPE_DOWNCAST_FLOATS and dtype.itemsize > 4:
+                    candidate = series.astype('float32')
+                    if candidate.astype(dtype).equals(series):
+                        new = candidate
+            elif pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+                non_null = series.dropna()
+                sample = non_null.head(DATETIME_SAMPLE).tolist()
+                if _looks_like_dates(sample):
+                    parsed = pd.to_datetime(series, errors='coerce')
+                    if parsed.notna().sum() == len(non_null):
+                        new = parsed
+                if new is None:
+                    n_unique = non_null.nunique()
+                    if _is_category_candidate(n_unique, len(non_null)):
+                        new = series.astype('category')
+        except (TypeError, ValueError, OverflowError):  # unhashable or mixed values: leave as is
+            continue
+        if new is not None:
+            converted[col] = new
+            changes[str(col)] = {"from": str(dtype), "to": str(new.dtype)}
+    if not converted:
+        return df, changes
+    optimized = df.copy(deep=False)
+    for col, value in converted.items():
+        optimized[col] = value
+    return optimized, changes
+
+
+def _optimize_polars(df):
+    import polars as pl
+
+    changes = {}
+    expressions = []
+    for col, dtype in zip(df.columns, df.dtypes):
+        series = df[col]
+        new = None
+        try:
+            if dtype in (pl.Int32, pl.Int64):
+                if series.drop_nulls().len():
+                    target = _int_target(series.min(), series.max())
+                    target_dtype = {'int16': pl.Int16, 'int32': pl.Int32, 'int64': pl.Int64}[target]
+                    if target != 'int64' and target_dtype != dtype:
+                        new = series.cast(target_dtype)
+            elif dtype == pl.Float64:
+                if DTYPE_DOWNCAST_FLOATS:
+                    candidate = series.cast(pl.Float32)
+                    if candidate.cast(pl.Float64).equals(series):
+                        new = candidate
+            elif dtype == pl.String:
+                non_null = series.drop_nulls()
+                if _looks_like_dates(non_null.head(DATETIME_SAMPLE).to_list()):
+                    parsed = series.str.to_datetime(strict=False)
+                    if parsed.null_count() == series.null_count():
+                        new = parsed
+                if new is None and _is_category_candidate(non_null.n_unique(), non_null.len()):
+                    new = series.cast(pl.Categorical)
+        except (pl.exceptions.PolarsError, TypeError, ValueError, OverflowError):  # leave the column as is
+            continue
+        if new is not None:
+            expressions.append(new.alias(col))
+            changes[col] = {"from": str(dtype), "to": str(new.dtype)}
+    if not expressions:
+        return df, changes
+    return df.with_columns(expressions), changes
+
+
+def code_dtype(dtype):
+    """The dtype generated code sees for a stored dtype (see widen_dtypes)"""
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        return dtype.categories.dtype
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype):  # nullable Int32 etc. are never downcast
+        return dtype
+    if isinstance(dtype, np.dtype):
+        return np.dtype('int64') if dtype.kind == 'i' and dtype.itemsize < 8 else dtype
+    import polars as pl
+
+    if dtype in (pl.Categorical, pl.Enum):
+        return pl.String
+    if dtype in (pl.Int8, pl.Int16, pl.Int32):
+        return pl.Int64
+    return dtype
+
+
+def widen_dtypes(df):
+    """df with narrow integers as int64 and categoricals decoded, as generated code should see it"""
+    if df is None:
+        return None
+    if hasattr(df, 'with_columns'):  # polars
+        import polars as pl
+
+        casts = [pl.col(col).cast(code_dtype(dtype)) for col, dtype in zip(df.columns, df.dtypes)
+                 if code_dtype(dtype) != dtype]
+        return df.with_columns(casts) if casts else df
+    casts = {col: code_dtype(dtype) for col, dtype in df.dtypes.items() if code_dtype(dtype) != dtype}
+    return df.astype(casts) if casts else df
+
+
+def estimated_bytes(df, engine: str) -> int:
+    if engine == 'pandas':
+        return int(df.memory_usage(deep=True).sum())
+    return int(df.estimated_size())
+
+
+def optimize_dtypes(df, engine: str) -> Tuple[Any, Dict[str, Any]]:
+    """Return (optimized df, report with bytes before/after and per-column changes)"""
+    if not DTYPE_OPTIMIZATION:
+        return df, {"enabled": False}
+    before = estimated_bytes(df, engine)
+    try:
+        if engine == 'pandas':
+            optimized, changes = _optimize_pandas(df)
+        else:
+            optimized, changes = _optimize_polars(df)
+    except Exception as e:
+        print(f"⚠️ Could not optimize dtypes: {e}")
+        return df, {"enabled": True, "error": str(e), "bytes_before": before, "bytes_after": before}
+    after = estimated_bytes(optimized, engine) if changes else before
+    return optimized, {
+        "enabled": True,
+        "bytes_before": before,
+        "bytes_after": after,
+        "reduction": round(before / after, 2) if after else None,
+        "columns": changes,
+    }
@@ -0,0 +1,221 @@
+"""
+Memory-aware choice of the engine that loads a dataset.
+The file size says little about the size of the parsed data: a CSV of long
+strings grows several times over as pandas objects, while numeric data
+shrinks. Before a file is parsed, its first SAMPLE_BYTES are parsed with
+pandas; the sample's deep memory usage per row, and its size as Arrow
+(Polars) columns, are extrapolated to the whole file. The estimate is
+checked against the dataset budget (DATASET_MEMORY_BUDGET_MB) and the memory
+this process may use (ENGINE_MEMORY_FRACTION of what the OS and cgroup
+report as available), allowing for what each strategy holds while parsing:
+  - pandas: estimated pandas size under MAX_PANDAS_MB and fits with its
+    parse overhead;
+  - polars: Polars eager read, when the Arrow size fits with its overhead;
+  - polars_lazy: scan with the streaming engine, which only holds the
+    result plus small chunks (CSV and JSON lines);
+  - duckdb: DuckDB parses under a memory limit, spilling to disk, into an
+    Arrow file the dataset is memory-mapped from.
+Datasets estimated over the budget are rejected. Files smaller than the
+sample are parsed once: the sample is the dataset.
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+# Largest estimated pandas size (not file size) loaded with pandas
+MAX_PANDAS_MB = float(os.getenv('MAX_PANDAS_MB', '100'))
+DATASET_MEMORY_BUDGET_MB = float(os.getenv('DATASET_MEMORY_BUDGET_MB', '4096'))
+# Share of the available memory one dataset may take; the rest is for
+# queries, other workers and the previous dataset while it is replaced
+ENGINE_MEMORY_FRACTION = float(os.getenv('ENGINE_MEMORY_FRACTION', '0.5'))
+SAMPLE_BYTES = int(float(os.getenv('ENGINE_SAMPLE_MB', '1')) * 1024 * 1024)
+# Peak memory while parsing, as a multiple of the parsed size
+PARSE_PEAK = {'pandas': 2.0, 'polars': 2.0, 'polars_lazy': 1.2}
+# Used when the sample can't be parsed (e.g. a JSON document cut short)
+UNSAMPLED_PANDAS_RATIO = 10.0
+UNSAMPLED_ARROW_RATIO = 2.0
+STRATEGIES = ('pandas', 'polars', 'polars_lazy', 'duckdb')
+ESTIMATE_CACHE_SIZE = 256
+
+_estimates: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+_estimates_lock = threading.Lock()
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def available_memory() -> Optional[int]:
+    """Bytes this process can still allocate: MemAvailable, capped by the cgroup limit; None if unknown"""
+    available = None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        try:
+            available = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (ValueError, OSError, AttributeError):
+            pass
+    limit = _read_int('/sys/fs/cgroup/memory.max')  # 'max' when unlimited
+    used = _read_int('/sys/fs/cgroup/memory.current')
+    if limit is not None and used is not None:
+        available = min(available, limit - used) if available is not None else limit - used
+    return available
+
+
+def _head(source, size_bytes: int) -> bytes:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:SAMPLE_BYTES])
+    with open(source, 'rb') as f:
+        return f.read(min(size_bytes, SAMPLE_BYTES))
+
+
+def _parse_sample(head: bytes, fmt: str, complete: bool) -> Tuple[Optional[pd.DataFrame], int]:
+    """(pandas sample, bytes of source it covers); the sample is None if the head doesn't parse"""
+    if not complete:
+        # Cut after the last whole record
+        end = head.rfind(b'},') + 1 if fmt == 'json' else head.rfind(b'\n') + 1
+        if end <= 0:
+            return None, 0
+        head = head[:end] + b']' if fmt == 'json' else head[:end]
+    try:
+        if fmt == 'csv':
+            return pd.read_csv(io.BytesIO(head), low_memory=False), len(head)
+        return pd.read_json(io.BytesIO(head), lines=fmt == 'ndjson'), len(head)
+    except (ValueError, pd.errors.ParserError):
+        return None, 0
+
+
+def _arrow_bytes(sample: pd.DataFrame) -> Optional[int]:
+    try:
+        import polars as pl
+        return pl.from_pandas(sample).estimated_size()
+    except Exception:  # mixed-type object columns
+        return None
+
+
+def estimate_source(source, fmt: str, size_bytes: int) -> Tuple[Dict[str, Any], Optional[pd.DataFrame]]:
+    """(estimate, sample) for a file given as bytes or a path; sample is the whole dataset when the file is small"""
+    complete = size_bytes <= SAMPLE_BYTES
+    sample, covered = _parse_sample(_head(source, size_bytes), fmt, complete)
+    estimate = {"file_bytes": size_bytes, "sampled": sample is not None and len(sample) > 0}
+    if not estimate["sampled"]:
+        estimate.update(sample_rows=0, estimated_rows=None,
+                        pandas_bytes=int(size_bytes * UNSAMPLED_PANDAS_RATIO),
+                        arrow_bytes=int(size_bytes * UNSAMPLED_ARROW_RATIO))
+        return estimate, None
+    scale = 1.0 if complete else size_bytes / covered
+    pandas_bytes = int(sample.memory_usage(deep=True).sum())
+    arrow_bytes = _arrow_bytes(sample)
+    estimate.update(sample_rows=len(sample), estimated_rows=int(len(sample) * scale),
+                    pandas_bytes=int(pandas_bytes * scale),
+                    arrow_bytes=int((arrow_bytes if arrow_bytes is not None else pandas_bytes) * scale))
+    return estimate, sample if complete else None
+
+
+def estimate_table(table, sample_rows: int = 10_000) -> Dict[str, Any]:
+    """Estimate for an Arrow table (a parsed Excel sheet): exact Arrow size, pandas size from its first rows"""
+    rows = table.num_rows
+    sample = table.slice(0, sample_rows).to_pandas()
+    per_row = sample.memory_usage(deep=True).sum() / len(sample) if len(sample) else 0
+    return {"file_bytes": table.nbytes, "sampled": True, "sample_rows": len(sample), "estimated_rows": rows,
+            "pandas_bytes": int(per_row * rows), "arrow_bytes": int(table.nbytes)}
+
+
+def cached_estimate(file_hash: str) -> Optional[Dict[str, Any]]:
+    with _estimates_lock:
+        estimate = _estimates.get(file_hash)
+        if estimate is not None:
+            _estimates.move_to_end(file_hash)
+        return estimate
+
+
+def remember_estimate(file_hash: str, estimate: Dict[str, Any]):
+    with _estimates_lock:
+        _estimates[file_hash] = estimate
+        _estimates.move_to_end(file_hash)
+        while len(_estimates) > ESTIMATE_CACHE_SIZE:
+            _estimates.popitem(last=False)
+
+
+def _mb(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value / 1024 / 1024, 2)
+
+
+def decide(estimate: Dict[str, Any], fmt: str, available: Optional[int] = None,
+           strategies=STRATEGIES) -> Dict[str, Any]:
+    """Engine plan for an estimate: strategy, stored engine, reason and the inputs it was based on"""
+    if available is None:
+        available = available_memory()
+    budget = DATASET_MEMORY_BUDGET_MB * 1024 * 1024
+    usable = budget if available is None else min(available * ENGINE_MEMORY_FRACTION, budget)
+    pandas_bytes, arrow_bytes = estimate['pandas_bytes'], estimate['arrow_bytes']
+    if fmt == 'json':
+        strategies = [name for name in strategies if name != 'polars_lazy']  # no streaming JSON reader
+
+    if arrow_bytes > budget and pandas_bytes > budget:
+        strategy = None
+        reason = (f"Estimated {_mb(min(arrow_bytes, pandas_bytes)):.0f} MB in memory, over the "
+                  f"{DATASET_MEMORY_BUDGET_MB:.0f} MB dataset budget")
+    elif 'pandas' in strategies and pandas_bytes <= MAX_PANDAS_MB * 1024 * 1024 \
+            and pandas_bytes * PARSE_PEAK['pandas'] <= usable:
+        strategy, reason = 'pandas', f"Estimated pandas size fits under {MAX_PANDAS_MB:g} MB and in free memory"
+    elif 'polars' in strategies and arrow_bytes * PARSE_PEAK['polars'] <= usable:
+        strategy, reason = 'polars', "Estimated Arrow size fits in free memory with an eager read"
+    elif 'polars_lazy' in strategies and arrow_bytes * PARSE_PEAK['polars_lazy'] <= usable:
+        strategy, reason = 'polars_lazy', "Only a streaming read fits in free memory"
+    elif 'duckdb' in strategies and arrow_bytes <= budget:
+        strategy, reason = 'duckdb', "Too large to parse in free memory; DuckDB parses it spilling to disk"
+    elif 'polars' in strategies and arrow_bytes <= budget:
+        strategy, reason = 'polars', "Only the Arrow form fits the dataset budget"
+    else:
+        strategy = None
+        reason = (f"Estimated {_mb(arrow_bytes):.0f} MB in memory, but only {_mb(usable):.0f} MB "
+                  f"of memory is free for it")
+
+    plan = {
+        "strategy": strategy,
+        # What the rest of the app works with: all Polars strategies give a Polars frame
+        "engine": None if strategy is None else 'pandas' if strategy == 'pandas' else 'polars',
+        "reason": reason,
+        "inputs": {
+            "file_mb": _mb(estimate['file_bytes']),
+            "sampled": estimate['sampled'],
+            "sample_rows": estimate['sample_rows'],
+            "estimated_rows": estimate['estimated_rows'],
+            "estimated_pandas_mb": _mb(pandas_bytes),
+            "estimated_arrow_mb": _mb(arrow_bytes),
+            "available_mb": _mb(available),
+            "usable_mb": _mb(usable),
+            "budget_mb": DATASET_MEMORY_BUDGET_MB,
+            "max_pandas_mb": MAX_PANDAS_MB,
+        },
+    }
+    return plan
+
+
+def plan_engine(source, fmt: str, size_bytes: int,
+                file_hash: Optional[str] = None) -> Tuple[Dict[str, Any], Optional[pd.DataFrame]]:
+    """(plan, parsed dataset or None) for a 'csv', 'json' or 'ndjson' file given as bytes or a path.
+    The dataset is returned when sampling already parsed all of it with pandas and pandas was chosen."""
+    estimate = cached_estimate(file_hash) if file_hash else None
+    sample = None
+    if estimate is None:
+        estimate, sample = estimate_source(source, fmt, size_bytes)
+        if file_hash:
+            remember_estimate(file_hash, estimate)
+    plan = decide(estimate, fmt)
+    return plan, sample if plan['strategy'] == 'pandas' else None
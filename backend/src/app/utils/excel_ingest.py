@@ -0,0 +1,241 @@
+"""
+Excel workbook ingestion.
+Every sheet of an uploaded workbook is listed; the requested sheets are parsed
+in parallel worker processes (one sheet per process, pandas with the fastest
+available engine) and written as Arrow files to a cache directory keyed by the
+SHA-256 of the workbook. Re-uploading the same workbook, or switching to
+another sheet later, reads the cached Arrow file instead of parsing again.
+The workbook itself is kept next to its sheets so unparsed sheets can be
+loaded on demand; nothing is left behind in the system temp directory.
+Workbooks count towards the ingest cache's size limit and are evicted with it.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+from app.utils.ingest_cache import INGEST_CACHE_DIR, INGEST_CACHE_MAX_MB, evict_lru, touch_entry
+
+EXCEL_CACHE_DIR = os.getenv('EXCEL_CACHE_DIR', 'backend/data/excel_cache')
+# Workbooks smaller than this are parsed in-process; spawning workers costs more
+EXCEL_POOL_MIN_MB = float(os.getenv('EXCEL_POOL_MIN_MB', '1'))
+EXCEL_MAX_WORKERS = int(os.getenv('EXCEL_MAX_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _pandas_reads_calamine() -> bool:
+    """pandas accepts engine='calamine' from 2.2"""
+    import pandas as pd
+
+    try:
+        return tuple(int(part) for part in pd.__version__.split('.')[:2]) >= (2, 2)
+    except ValueError:  # unusual version string
+        return False
+
+
+def excel_engine(ext: str) -> str:
+    """calamine (Rust) when installed and pandas supports it, otherwise pandas' default for the format"""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        if _pandas_reads_calamine():
+            return 'calamine'
+    return 'xlrd' if ext == 'xls' else 'openpyxl'
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the server process has threads (warm-up, thread pool)
+            _pool = ProcessPoolExecutor(max_workers=EXCEL_MAX_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _write_atomic_json(path: str, data: Any):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def parse_sheet(workbook_path: str, sheet: str, engine: str, output_path: str) -> Dict[str, Any]:
+    """Parse one sheet to an Arrow file; runs in a worker process"""
+    import pandas as pd
+    import pyarrow as pa
+
+    df = pd.read_excel(workbook_path, sheet_name=sheet, engine=engine)
+    df.columns = [str(col) for col in df.columns]
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type columns: keep them as text rather than failing the sheet
+        mixed = [col for col in df.columns if df[col].dtype == object]
+        df[mixed] = df[mixed].astype(str).where(df[mixed].notna(), None)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+
+    tmp_path = output_path + '.tmp'
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {"rows": len(df), "columns": len(df.columns), "column_names": list(df.columns)}
+
+
+def arrow_to_frame(table, engine: str):
+    if engine == 'pandas':
+        return table.to_pandas()
+    import polars as pl
+    return pl.from_arrow(table)
+
+
+class ExcelWorkbook:
+    """Cache entry of one workbook: source file, sheet list and parsed sheets"""
+
+    def __init__(self, file_hash: str, cache_dir: str = EXCEL_CACHE_DIR):
+        self.file_hash = file_hash
+        self.directory = os.path.join(cache_dir, file_hash)
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        self.manifest: Dict[str, Any] = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    @property
+    def workbook_path(self) -> str:
+        return os.path.join(self.directory, 'workbook.' + self.manifest.get('ext', 'xlsx'))
+
+    @property
+    def sheets(self) -> List[Dict[str, Any]]:
+        return self.manifest.get('sheets', [])
+
+    def sheet(self, name_or_index) -> Optional[Dict[str, Any]]:
+        for sheet in self.sheets:
+            if sheet['name'] == name_or_index or str(sheet['index']) == str(name_or_index):
+                return sheet
+        return None
+
+    def _sheet_path(self, sheet: Dict[str, Any]) -> str:
+        return os.path.join(self.directory, f"sheet-{sheet['index']}.arrow")
+
+    def save_manifest(self):
+        _write_atomic_json(self.manifest_path, self.manifest)
+
+    def store_source(self, content: bytes, ext: str):
+        """Write the workbook into the cache and list its sheets"""
+        import pandas as pd
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.manifest['ext'] = ext
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, self.workbook_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with pd.ExcelFile(self.workbook_path, engine=excel_engine(ext)) as workbook:
+            names = workbook.sheet_names
+        self.manifest['size_bytes'] = len(content)
+        self.manifest['sheets'] = [{"name": str(name), "index": index, "parsed": False}
+                                   for index, name in enumerate(names)]
+        self.save_manifest()
+
+    def parse(self, sheets: List[Dict[str, Any]]):
+        """Parse the given sheets (in parallel for large workbooks) and record them in the manifest"""
+        pending = [sheet for sheet in sheets if not sheet['parsed'] or not os.path.exists(self._sheet_path(sheet))]
+        if not pending:
+            return
+        engine = excel_engine(self.manifest.get('ext', 'xlsx'))
+        args = [(self.workbook_path, sheet['name'], engine, self._sheet_path(sheet)) for sheet in pending]
+        use_pool = len(pending) > 1 and self.manifest.get('size_bytes', 0) / 1024 / 1024 >= EXCEL_POOL_MIN_MB
+        if use_pool:
+            try:
+                pool = _get_pool()
+                results = [future.result() for future in [pool.submit(parse_sheet, *arg) for arg in args]]
+            except BrokenProcessPool as e:
+                print(f"⚠️ Excel worker pool failed ({e}), parsing in-process")
+                _reset_pool()
+                results = [parse_sheet(*arg) for arg in args]
+        else:
+            results = [parse_sheet(*arg) for arg in args]
+        for sheet, result in zip(pending, results):
+            sheet.update(result, parsed=True)
+        self.save_manifest()
+        self.evict_others()
+
+    def evict_others(self):
+        """Keep the Excel and ingest caches under their shared size limit, sparing this workbook"""
+        cache_dir = os.path.dirname(self.directory)
+        evict_lru([cache_dir, INGEST_CACHE_DIR], INGEST_CACHE_MAX_MB * 1024 * 1024, keep=[self.directory])
+
+    def table(self, sheet: Dict[str, Any]):
+        """Cached sheet as a memory-mapped Arrow table"""
+        import pyarrow as pa
+
+        self.parse([sheet])
+        touch_entry(self.directory)
+        return pa.ipc.open_file(pa.memory_map(self._sheet_path(sheet), 'r')).read_all()
+
+    def load(self, sheet: Dict[str, Any], engine: str):
+        """Cached sheet as a pandas or polars dataframe"""
+        return arrow_to_frame(self.table(sheet), engine)
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """Sheet summaries for API responses"""
+        return [{key: sheet.get(key) for key in ('name', 'index', 'parsed', 'rows', 'columns', 'column_names')}
+                for sheet in self.sheets]
+
+
+def open_workbook(content: bytes, ext: str, cache_dir: str = EXCEL_CACHE_DIR) -> ExcelWorkbook:
+    """Workbook cache entry for content, creating it on first upload"""
+    file_hash = hashlib.sha256(content).hexdigest()
+    workbook = ExcelWorkbook(file_hash, cache_dir)
+    if not workbook.sheets or not os.path.exists(workbook.workbook_path):
+        try:
+            workbook.store_source(content, ext)
+        except Exception:
+            # Don't leave a half-written entry that would look like a cache hit
+            shutil.rmtree(workbook.directory, ignore_errors=True)
+            raise
+        workbook.evict_others()
+    else:
+        touch_entry(workbook.directory)
+    return workbook
+
+
+def select_sheets(workbook: ExcelWorkbook, requested: Optional[str]) -> List[Dict[str, Any]]:
+    """Sheets named (or indexed) in a comma-separated list; all sheets when empty or 'all'"""
+    if not requested or requested.strip().lower() == 'all':
+        return workbook.sheets
+    selected = []
+    for name in requested.split(','):
+        sheet = workbook.sheet(name.strip())
+        if sheet is None:
+            raise ValueError(f"Sheet '{name.strip()}' not found. Available: {[s['name'] for s in workbook.sheets]}")
+        selected.append(sheet)
+    return selected
@@ -0,0 +1,275 @@
+"""
+Deterministic fast path for common questions.
+Rule-based intent matcher that answers simple questions ("how many rows",
+"what columns are there", "null counts per column", "describe the data",
+"value counts of X") from the dataset profile or a single vectorized call,
+without going through Gemini and exec. Anything it is not sure about
+falls through to the LLM.
+"""
+
+import re
+from typing import Any, Dict, Optional
+
+from app.utils.dtype_optimizer import code_dtype
+
+# Value counts above this many distinct values are truncated to the top entries
+MAX_VALUE_COUNTS = 100
+
+_PREFIXES = (
+    r"^(please |hey |ok |okay )?"
+    r"(can you |could you |would you |will you )?"
+    r"(please )?"
+    r"(tell me |show me |give me |list |display |print |get |find |compute |calculate )?"
+)
+_SUFFIXES = (
+    r"( for me)?"
+    r"( (in|of|for|from) (the |this |my |our )?(whole |entire |full )?(dataset|data set|data|table|file|dataframe|csv|sheet))?"
+    r"( please)?$"
+)
+
+_DATA = r"(the |this |my |our )?(dataset|data set|data|table|file|dataframe|csv)"
+
+INTENT_PATTERNS = [
+    ("row_count", [
+        r"(how many|number of|count of|count the|total number of|total) (rows|records|entries|observations|samples|lines)( are there| do we have| does it have| are in it| is there)?",
+        r"(what is |whats )?(the )?(row count|number of rows|length)",
+        r"how (long|big) is " + _DATA,
+    ]),
+    ("column_count", [
+        r"(how many|number of|count of|count the|total number of) (columns|fields|variables|features)( are there| do we have| does it have| is there)?",
+        r"(what is |whats )?(the )?column count",
+    ]),
+    ("columns", [
+        r"(what|which) (are )?(the )?(columns|fields|column names|variables|features)( are there| do we have| does it have| are available| exist)?",
+        r"(all )?(the )?(columns|column names|fields)",
+        r"(what|which) columns (does|do) " + _DATA + r" (have|contain)",
+    ]),
+    ("shape", [
+        r"(what is |whats )?(the )?(shape|dimensions|size)( of " + _DATA + r")?",
+    ]),
+    ("dtypes", [
+        r"(what are )?(the )?(data types|datatypes|dtypes|column types|types of (the |each )?columns?)( of (the |each )?columns?| per column| for each column)?",
+    ]),
+    ("null_counts", [
+        r"(how many )?(the )?(null|missing|nan|na|empty) (values|counts?|entries|cells)( are there)?( per column| in each column| by column| for each column| per field)?",
+        r"(count|number) of (null|missing|nan|na|empty) (values|entries|cells)( per column| in each column| by column| for each column)?",
+        r"(are there|is there) (any )?(null|missing|nan|na) (values|data|entries)",
+        r"(null|missing) (value )?counts?( per column| in each column| by column| for each column)?",
+    ]),
+    ("describe", [
+        r"describe( " + _DATA + r")?",
+        r"(summarize|summarise)( " + _DATA + r")?",
+        r"(a |the )?(summary|descriptive|basic|summary descriptive) (statistics|stats)",
+        r"(a |the )?(statistical )?summary",
+    ]),
+    ("value_counts", [
+        r"(the )?value counts (of|for|in) (the )?(?P<col>.+?)( column)?",
+        r"(the )?(counts|frequencies|frequency|frequency distribution|distribution) (of|for) (each |every )?(?P<col>.+?)( column| values| categories)?",
+        r"how many (rows|records|entries|people|individuals) (are there )?(per|for each|in each|by) (?P<col>.+?)",
+        r"(count|number of (rows|records|entries)) (per|for each|by) (?P<col>.+?)",
+    ]),
+    ("unique_values", [
+        r"(what are )?(the )?(unique|distinct) values (of|in|for) (the )?(?P<col>.+?)( column)?",
+    ]),
+]
+
+_COMPILED = [
+    (intent, [re.compile(pattern) for pattern in patterns])
+    for intent, patterns in INTENT_PATTERNS
+]
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and common filler so templates can match"""
+    text = question.strip().lower()
+    text = text.replace("what's", "whats").replace("’", "'")
+    text = re.sub(r"[?!.;:,]+", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    text = re.sub(_PREFIXES, "", text).strip()
+    text = re.sub(_SUFFIXES, "", text).strip()
+    return text
+
+
+def _compact(text: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(text).lower())
+
+
+def resolve_column(name: str, columns) -> Optional[str]:
+    """Map a column mentioned in a question to an actual column name"""
+    name = name.strip().strip("'\"`")
+    target = _compact(name)
+    if not target:
+        return None
+    matches = [col for col in columns if _compact(col) == target]
+    if len(matches) == 1:
+        return matches[0]
+    # Tolerate a plural ("workclasses", "sexes") but never guess between several columns
+    if target.endswith("es"):
+        matches = [col for col in columns if _compact(col) in (target[:-1], target[:-2])]
+    elif target.endswith("s"):
+        matches = [col for col in columns if _compact(col) == target[:-1]]
+    return matches[0] if len(matches) == 1 else None
+
+
+def match_intent(question: str) -> Optional[Dict[str, Any]]:
+    """Return the matched intent and its parameters, or None when unsure"""
+    text = normalize_question(question)
+    if not text:
+        return None
+    for intent, patterns in _COMPILED:
+        for pattern in patterns:
+            m = pattern.fullmatch(text)
+            if m:
+                params = {k: v for k, v in m.groupdict().items() if v}
+                return {"intent": intent, "params": params}
+    return None
+
+
+def _value_counts(df, engine: str, column: str, profile: Dict[str, Any]):
+    top_values = profile.get("top_values", {})
+    if column in top_values:
+        return top_values[column], len(top_values[column])
+    if engine == 'pandas':
+        counts = df[column].value_counts(dropna=True)
+        distinct = len(counts)
+        return {str(k): int(v) for k, v in counts.head(MAX_VALUE_COUNTS).items()}, distinct
+    counts = df[column].drop_nulls().value_counts(sort=True)
+    return {str(k): int(v) for k, v in counts.head(MAX_VALUE_COUNTS).iter_rows()}, counts.height
+
+
+def plan_fast_path(question: str, engine: str, profile: Dict[str, Any], columns=()) -> Optional[Dict[str, Any]]:
+    """
+    The intent answer_fast_path would answer, with its column resolved, or
+    None to use the LLM. Only looks at the question and the profile, never
+    at the data, so it is cheap enough to classify queries before they run.
+    """
+    if engine not in ('pandas', 'polars') or not profile:
+        return None
+    matched = match_intent(question)
+    if matched is None:
+        return None
+    intent = matched["intent"]
+    if intent == "dtypes" and not profile.get("dtypes"):
+        return None
+    if intent == "null_counts" and profile.get("null_counts") is None:
+        return None
+    if intent in ("value_counts", "unique_values"):
+        columns = profile.get("columns") or [str(col) for col in columns]
+        column = resolve_column(matched["params"].get("col", ""), columns)
+        if column is None:
+            return None
+        # Continuous numeric columns usually want a histogram or binning, leave those to the LLM
+        if column in profile.get("numeric_columns", []) and column not in profile.get("top_values", {}):
+            return None
+        matched = {**matched, "column": column}
+    return matched
+
+
+def answer_fast_path(question: str, df, engine: str, profile: Dict[str, Any],
+                     matched: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Try to answer a question without the LLM.
+
+    Returns a dict with result, explanation, code and intent, or None to fall
+    through to the LLM. matched is plan_fast_path's result when already known.
+    """
+    if matched is None:
+        matched = plan_fast_path(question, engine, profile, df.columns)
+    if matched is None:
+        return None
+
+    intent = matched["intent"]
+    columns = profile.get("columns") or [str(col) for col in df.columns]
+    rows = profile.get("rows", len(df))
+    pandas = engine == 'pandas'
+
+    if intent == "row_count":
+        return {
+            "intent": intent,
+            "result": rows,
+            "explanation": f"The dataset has {rows:,} rows.",
+            "code": "result = len(dataframe)" if pandas else "result = dataframe.height",
+        }
+
+    if intent == "column_count":
+        return {
+            "intent": intent,
+            "result": len(columns),
+            "explanation": f"The dataset has {len(columns)} columns.",
+            "code": "result = len(dataframe.columns)",
+        }
+
+    if intent == "columns":
+        return {
+            "intent": intent,
+            "result": columns,
+            "explanation": f"The dataset has {len(columns)} columns: {', '.join(columns)}.",
+            "code": "result = list(dataframe.columns)",
+        }
+
+    if intent == "shape":
+        return {
+            "intent": intent,
+            "result": [rows, len(columns)],
+            "explanation": f"The dataset has {rows:,} rows and {len(columns)} columns.",
+            "code": "result = dataframe.shape",
+        }
+
+    if intent == "dtypes":
+        return {
+            "intent": intent,
+            # As generated code sees them, not as stored
+            "result": {str(col): str(code_dtype(dtype)) for col, dtype in zip(df.columns, df.dtypes)},
+            "explanation": "Data type of each column.",
+            "code": "result = dataframe.dtypes.astype(str).to_dict()" if pandas
+                    else "result = dict(zip(dataframe.columns, map(str, dataframe.dtypes)))",
+        }
+
+    if intent == "null_counts":
+        null_counts = profile["null_counts"]
+        total = sum(null_counts.values())
+        with_nulls = [col for col, count in null_counts.items() if count]
+        if total:
+            explanation = (f"There are {total:,} missing values across {len(with_nulls)} "
+                           f"column(s): {', '.join(with_nulls)}.")
+        else:
+            explanation = "There are no missing values in the dataset."
+        return {
+            "intent": intent,
+            "result": null_counts,
+            "explanation": explanation,
+            "code": "result = dataframe.isnull().sum().to_dict()" if pandas
+                    else "result = dict(zip(dataframe.columns, dataframe.null_count().row(0)))",
+        }
+
+    if intent == "describe":
+        if pandas:
+            result = df.describe()
+            code = "result = dataframe.describe()"
+        else:
+            result = df.describe().to_dicts()
+            code = "result = dataframe.describe()"
+        return {
+            "intent": intent,
+            "result": result,
+            "explanation": "Summary statistics (count, mean, std, min, quartiles, max) for the numeric columns.",
+            "code": code,
+        }
+
+    if intent in ("value_counts", "unique_values"):
+        column = matched["column"]
+        counts, distinct = _value_counts(df, engine, column, profile)
+        truncated = distinct > len(counts)
+        if intent == "value_counts":
+            explanation = f"Number of rows for each value of '{column}' ({distinct:,} distinct values"
+            explanation += f", showing the top {len(counts)})." if truncated else ")."
+            code = (f"result = dataframe[{column!r}].value_counts()" if pandas
+                    else f"result = dataframe[{column!r}].value_counts(sort=True)")
+            return {"intent": intent, "result": counts, "explanation": explanation, "code": code}
+        explanation = f"'{column}' has {distinct:,} distinct values"
+        explanation += f" (showing the {len(counts)} most frequent)." if truncated else "."
+        code = (f"result = dataframe[{column!r}].dropna().unique().tolist()" if pandas
+                else f"result = dataframe[{column!r}].drop_nulls().unique().to_list()")
+        return {"intent": intent, "result": list(counts.keys()), "explanation": explanation, "code": code}
+
+    return None
@@ -0,0 +1,170 @@
+"""
+Content-addressed ingest cache.
+Uploads are hashed (SHA-256) while they are read. The first time a file is
+seen it is parsed, dtype-optimized and profiled as usual, and the result is
+written as an uncompressed Arrow IPC file next to its profile and dtype
+report. Uploading the same bytes again memory-maps that file instead, so the
+dataset and its profile are back in milliseconds, whatever the source format.
+The cache, together with the Excel workbook cache, is kept under
+INGEST_CACHE_MAX_MB on disk; the least recently used entries are evicted
+first. Set INGEST_CACHE=0 to disable.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.utils import dtype_optimizer
+
+INGEST_CACHE = os.getenv('INGEST_CACHE', '1') != '0'
+INGEST_CACHE_DIR = os.getenv('INGEST_CACHE_DIR', 'backend/data/ingest_cache')
+INGEST_CACHE_MAX_MB = float(os.getenv('INGEST_CACHE_MAX_MB', '2048'))
+# Bump when parsing or profiling changes what a given upload turns into
+CACHE_FORMAT_VERSION = 1
+# Half-written entries older than this belong to a crashed writer
+STALE_TMP_SECONDS = 3600
+
+
+def cache_key(file_hash: str, ext: str, engine: str) -> str:
+    """Entry name for an upload: content, format, engine and the settings that shape the result"""
+    settings = f"o{int(dtype_optimizer.DTYPE_OPTIMIZATION)}f{int(dtype_optimizer.DTYPE_DOWNCAST_FLOATS)}"
+    return f"{file_hash}-{ext}-{engine}-{settings}-v{CACHE_FORMAT_VERSION}"
+
+
+def touch_entry(directory: str):
+    """Mark a cache entry as used; eviction goes by the directory's mtime"""
+    try:
+        os.utime(directory)
+    except OSError:
+        pass
+
+
+def _entry_size(directory: str) -> int:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:  # removed while walking
+                pass
+    return total
+
+
+def evict_lru(directories: Iterable[str], max_bytes: float, keep: Iterable[str] = ()) -> int:
+    """Remove least recently used entries across cache directories until under max_bytes; returns bytes freed"""
+    keep = {os.path.abspath(path) for path in keep}
+    now = time.time()
+    entries = []
+    for directory in directories:
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            continue
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            if not os.path.isdir(path):
+                continue
+            if name.startswith('.'):
+                # In-progress write; only clean up after a crash
+                if now - mtime > STALE_TMP_SECONDS:
+                    shutil.rmtree(path, ignore_errors=True)
+                continue
+            entries.append((mtime, path, _entry_size(path)))
+
+    total = sum(size for _, _, size in entries)
+    freed = 0
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        freed += size
+    if freed:
+        print(f"🧹 Ingest cache evicted {freed / 1024 / 1024:.1f} MB")
+    return freed
+
+
+def _to_arrow(df, engine: str):
+    import pyarrow as pa
+
+    if engine == 'pandas':
+        return pa.Table.from_pandas(df, preserve_index=False)
+    return df.to_arrow()
+
+
+def _from_arrow(table, engine: str):
+    if engine == 'pandas':
+        return table.to_pandas(split_blocks=True)
+    import polars as pl
+    return pl.from_arrow(table)
+
+
+class IngestCache:
+    """Arrow files of previously ingested uploads, keyed by content hash"""
+
+    def __init__(self, directory: str = INGEST_CACHE_DIR, max_mb: float = INGEST_CACHE_MAX_MB,
+                 enabled: bool = INGEST_CACHE):
+        self.directory = directory
+        self.enabled = enabled
+        self.max_bytes = max_mb * 1024 * 1024
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str, engine: str) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """(dataframe, metadata) for a cached upload, or None"""
+        import pyarrow as pa
+
+        directory = self._entry_dir(key)
+        try:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                meta = json.load(f)
+            table = pa.ipc.open_file(pa.memory_map(os.path.join(directory, 'data.arrow'), 'r')).read_all()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, pa.ArrowInvalid) as e:
+            print(f"⚠️ Ignoring unreadable ingest cache entry {key}: {e}")
+            shutil.rmtree(directory, ignore_errors=True)
+            return None
+        touch_entry(directory)
+        return _from_arrow(table, engine), meta
+
+    def put(self, key: str, df, engine: str, extra_dirs: Iterable[str] = (), **meta) -> bool:
+        """Store an ingested dataframe with its metadata (profile, dtype report); False if it can't be cached"""
+        import pyarrow as pa
+
+        try:
+            table = _to_arrow(df, engine)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            # Mixed-type object columns: parse again next time rather than alter the data
+            print(f"⚠️ Not caching upload: {e}")
+            return False
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.directory, prefix='.')
+        try:
+            with pa.OSFile(os.path.join(tmp_dir, 'data.arrow'), 'wb') as sink, \
+                    pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+                json.dump({**meta, "engine": engine, "created_at": time.time()}, f, default=str)
+            try:
+                os.rename(tmp_dir, self._entry_dir(key))
+            except OSError:  # another worker stored the same upload first
+                pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        evict_lru([self.directory, *extra_dirs], self.max_bytes, keep=[self._entry_dir(key)])
+        return True
+
+
+ingest_cache = IngestCache()
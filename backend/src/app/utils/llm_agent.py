@@ -1,4 +1,6 @@
 import os
+import time
+import asyncio
 import traceback
 import base64
 import io
@@ -11,17 +13,32 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.io as pio
 import plotly.graph_objects as go
-import google.generativeai as genai
 from app.memory import memory_store
 from dotenv import load_dotenv
 from app.utils.self_healing import auto_healer, self_healing_decorator
+from app.utils.dataset_profile import build_profile
+from app.utils.fast_path import answer_fast_path, plan_fast_path
+from app.utils.metrics import (
+    PROMPT_BUILD_SECONDS, LLM_REQUEST_SECONDS, EXEC_SECONDS, SERIALIZATION_SECONDS,
+    IMAGE_ENCODE_SECONDS, QUERY_ATTEMPTS, RETRIES, SAMPLE_VALIDATIONS, COLUMN_PRUNING, COLUMN_PRUNING_BYTES,
+    QUESTION_CACHE_REUSE, record_cache
+)
+from app.utils.tracing import span, set_attribute, set_trace_attribute
+from app.utils.code_profiler import profile_exec
+from app.utils.llm_client import generate
+from app.utils.sample_validation import needs_validation, get_sample, is_schema_error
+from app.utils.query_jobs import query_jobs
+from app.utils.scheduler import QueueFull, query_scheduler, to_thread
+from app.utils.snapshots import enable_copy_on_write, isolated_view
+from app.utils.column_pruning import prune_columns
+from app.utils.result_store import RESULT_HANDLE_MIN_ROWS, RESULT_PAGE_ROWS, is_tabular, result_store
+from app.utils.question_cache import question_cache
+from app.utils.code_library import schema_key
+from app.utils.dtype_optimizer import code_dtype, widen_dtypes
 
 load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# Configure Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.5-flash')  # Using standard model name
+enable_copy_on_write()
+MODEL_NAME = 'gemini-2.5-flash'  # Using standard model name
 
 def make_json_serializable(obj):
     """Convert numpy/pandas objects to JSON-serializable format"""
@@ -80,8 +97,9 @@ def make_json_serializable(obj):
 
 def call_gemini(prompt: str) -> str:
     try:
-        response = model.generate_content(prompt)
-        return response.text
+        with span('llm.call', caller='llm_agent', prompt_chars=len(prompt)), \
+                LLM_REQUEST_SECONDS.time(caller='llm_agent'):
+            return generate(prompt, MODEL_NAME)
     except Exception as e:
         print(f"Error calling Gemini API: {e}")
         return """# Fallback code
@@ -89,33 +107,176 @@ result = dataframe.describe()
 explanation = 'Basic dataset summary generated due to API error.'
 """
 
+def get_profile(df, engine: str) -> dict:
+    """Dataset profile of the active dataset, built on demand for older stores"""
+    profile = memory_store.get('profile')
+    if profile is None:  # dataset stored before profiles existed
+        profile = build_profile(df, engine)
+        memory_store['profile'] = profile
+    return profile
+
+def get_dataset_info(df, engine: str) -> dict:
+    """Shape, columns, dtypes and a small sample used to build prompts"""
+    if engine == 'pandas':
+        return {
+            "shape": df.shape,
+            "columns": list(df.columns),
+            "dtypes": {str(col): str(code_dtype(dtype)) for col, dtype in df.dtypes.items()},
+            "sample": df.head(3).to_dict('records') if len(df) > 0 else []
+        }
+    # polars
+    return {
+        "shape": df.shape,
+        "columns": list(df.columns),
+        "dtypes": {str(col): str(code_dtype(dtype)) for col, dtype in zip(df.columns, df.dtypes)},
+        "sample": df.head(3).to_dicts() if len(df) > 0 else []
+    }
+
+def dtype_notes(df_info: dict, engine: str) -> str:
+    """Prompt lines about dtypes chosen at ingest that generated code must respect"""
+    dtypes = df_info['dtypes'].values()
+    notes = []
+    if engine == 'pandas':
+        if any(dtype.startswith('datetime64') for dtype in dtypes):
+            notes.append("- Date columns are already parsed as datetime64: use the .dt accessor, don't call pd.to_datetime again")
+    else:
+        if any(dtype.startswith('Datetime') for dtype in dtypes):
+            notes.append("- Date columns are already parsed as Datetime: use the .dt namespace")
+    return "".join(note + "\n" for note in notes)
+
+def extract_code(text: str) -> str:
+    """Strip markdown fences from an LLM response"""
+    if "```python" in text:
+        return text.split("```python")[1].split("```")[0].strip()
+    elif "```" in text:
+        return text.split("```")[1].strip()
+    return text
+
+def build_exec_namespace(df) -> dict:
+    """Globals available to generated code; 'dataframe' is a view the code may modify freely"""
+    return {
+        'dataframe': isolated_view(widen_dtypes(df)),
+        'pd': pd,
+        'pl': pl,
+        'plt': plt,
+        'sns': sns,
+        'go': go,
+        'pio': pio,
+        'io': io,
+        'np': np
+    }
+
+def exec_pruned(code: str, df, engine: str, profile: dict = None, run=None):
+    """
+    Execute code on only the columns it references and return
+    (namespace, pruning report or None, run's return value). run(namespace)
+    executes the code, plain exec by default. A pruned run that fails on a
+    column the analysis missed is repeated on the full frame.
+    """
+    run = run or (lambda namespace: exec(code, namespace, namespace))
+    frame, pruning = prune_columns(code, df, engine, profile)
+    namespace = build_exec_namespace(frame)
+    if pruning is None:
+        COLUMN_PRUNING.inc(outcome='full')
+        return namespace, None, run(namespace)
+    try:
+        output = run(namespace)
+    except Exception as e:
+        if not is_schema_error(e):
+            raise
+        COLUMN_PRUNING.inc(outcome='fallback')
+        namespace = build_exec_namespace(df)
+        return namespace, None, run(namespace)
+    COLUMN_PRUNING.inc(outcome='pruned')
+    COLUMN_PRUNING_BYTES.inc(pruning['bytes_saved'])
+    set_attribute('pruned_columns', f"{pruning['columns']}/{pruning['of']}")
+    set_attribute('pruned_bytes', pruning['bytes_saved'])
+    return namespace, pruning, output
+
 @self_healing_decorator
-async def process_query(question: str, context: dict, session_id: str):
-    """Process user query and generate analysis"""
-    df = memory_store.get('dataframe')
-    engine = memory_store.get('engine', 'pandas')
+async def process_query(question: str, context: dict, session_id: str, profile: bool = False, preview: bool = False,
+                        route: dict = None):
+    """
+    Process user query and generate analysis; profile=True profiles the generated code.
+    preview=True answers from the validation sample and finishes the full run as a background job.
+    route is route_query's result for the question, when it was routed before being scheduled.
+    """
+    df, engine, dataset_version = memory_store.snapshot()
     filename = memory_store.get('filename', 'unknown')
     
     if df is None:
         return {"error": "No dataset loaded. Please upload a dataset first."}
-    
-    # Get basic info about the dataframe
+    set_attribute('dataset_version', dataset_version)
+    if route is not None and route["dataset_version"] != dataset_version:
+        route = None  # the dataset changed while the query waited
+
     scraping_code = memory_store.get('scraping_code', None)
     url_source = memory_store.get('url_source', None)
-    if engine == 'pandas':
-        df_info = {
-            "shape": df.shape,
-            "columns": list(df.columns),
-            "dtypes": {str(col): str(dtype) for col, dtype in df.dtypes.items()},
-            "sample": df.head(3).to_dict('records') if len(df) > 0 else []
-        }
-    else:  # polars
-        df_info = {
-            "shape": df.shape,
-            "columns": list(df.columns),
-            "dtypes": {str(col): str(dtype) for col, dtype in zip(df.columns, df.dtypes)},
-            "sample": df.head(3).to_dicts() if len(df) > 0 else []
-        }
+
+    # Answer simple questions from the dataset profile without calling Gemini
+    if not (context or {}).get('disable_fast_path'):
+        with span('fast_path') as fast_span:
+            matched = route["fast_path"] if route is not None else \
+                plan_fast_path(question, engine, get_profile(df, engine), df.columns)
+            # describe and value_counts scan the data: keep them off the event loop
+            fast = None if matched is None else await to_thread(
+                answer_fast_path, question, df, engine, get_profile(df, engine), matched)
+            if fast_span is not None:
+                fast_span.set_attribute('hit', fast is not None)
+        record_cache('fast_path', fast is not None)
+        if fast is not None:
+            with span('serialize'):
+                result = make_json_serializable(fast["result"])
+            from app.memory import save_conversation
+            save_conversation(session_id, question, {
+                "result": result,
+                "explanation": fast["explanation"],
+                "has_image": False
+            })
+            response_data = {
+                "result": result,
+                "explanation": fast["explanation"],
+                "image": None,
+                "code_executed": fast["code"],
+                "attempt": 0,
+                "fast_path": fast["intent"]
+            }
+            if scraping_code:
+                response_data["scraping_code"] = scraping_code
+            if url_source:
+                response_data["url_source"] = url_source
+                response_data["data_source_type"] = "web_scraping"
+            return response_data
+
+    # Large datasets: every program runs on a cached representative sample first
+    sample = None
+    if needs_validation(df):
+        with span('sample.build'):
+            sample = await to_thread(get_sample, df, engine, dataset_version, get_profile(df, engine))
+
+    # Reuse the code generated for an earlier paraphrase of the question
+    schema = None
+    if question_cache.enabled and not context:
+        if route is not None and route["schema"] is not None:
+            schema, hit = route["schema"], route["hit"]
+        else:
+            schema = schema_key(df, engine)
+            hit = _lookup_question(question, schema, df, engine)
+        record_cache('question', hit is not None)
+        if hit is not None:
+            # A profiled query runs the code even when its answer was precomputed
+            response_data = None if profile else precomputed_answer(hit, dataset_version, session_id, question)
+            if response_data is None:
+                response_data = await to_thread(answer_from_cache, hit, question, df, engine, sample,
+                                                session_id, profile, scraping_code, url_source)
+            if response_data is not None:
+                if question_cache.add(question, hit["code"], schema, df.columns, get_profile(df, engine)) != hit["key"]:
+                    question_cache.record_use(schema, hit["key"])
+                return response_data
+
+    # Get basic info about the dataframe
+    prompt_start = time.perf_counter()
+    df_info = get_dataset_info(df, engine)
     
     # Prepare prompt for LLM
     prompt = f"""
@@ -126,7 +287,7 @@ Dataset Info:
 - Shape: {df_info['shape']} (rows, columns)
 - Columns: {df_info['columns']}
 - Data types: {df_info['dtypes']}
-- Sample data: {df_info['sample']}
+{dtype_notes(df_info, engine)}- Sample data: {df_info['sample']}
 
 Question: {question}
 Context: {context}
@@ -157,69 +318,43 @@ DO NOT: dataframe = pd.read_csv('file.csv')  # WRONG - DON'T DO THIS
 
 Generate ONLY the Python code, no explanatory text before or after.
 """
+    PROMPT_BUILD_SECONDS.observe(time.perf_counter() - prompt_start)
+    set_attribute('prompt_build_ms', round((time.perf_counter() - prompt_start) * 1000, 3))
 
     # Agentic loop - retry up to 3 times if code fails
     for attempt in range(3):
         try:
-            code = call_gemini(prompt)
+            set_attribute('attempts', attempt + 1)
+            code = await to_thread(call_gemini, prompt)
             
             # Clean up the code (remove markdown formatting if present)
-            if "```python" in code:
-                code = code.split("```python")[1].split("```")[0].strip()
-            elif "```" in code:
-                code = code.split("```")[1].strip()
-            
-            # Execute the code
-            local_vars = {
-                'dataframe': df,
-                'pd': pd,
-                'pl': pl,
-                'plt': plt,
-                'sns': sns,
-                'go': go,
-                'pio': pio,
-                'io': io,
-                'np': np
-            }
-            
-            exec(code, local_vars, local_vars)
-            
-            # Get results
-            result = local_vars.get('result', 'No result returned')
-            explanation = local_vars.get('explanation', 'Analysis completed')
-            image_bytes = local_vars.get('image_bytes')
+            code = extract_code(code)
             
-            # Convert result to JSON-serializable format
-            result = make_json_serializable(result)
+            if sample is not None:
+                sample_vars = await to_thread(run_on_sample, code, sample, engine, attempt)
+                if preview and sample_vars is not None:
+                    return start_full_run(code, df, engine, sample_vars, len(sample), question, session_id,
+                                          attempt, scraping_code, url_source)
             
-            # Encode image if present
-            image_b64 = None
-            if image_bytes:
-                image_b64 = base64.b64encode(image_bytes).decode()
-            
-            # Save to conversation history
-            from app.memory import save_conversation
-            save_conversation(session_id, question, {
-                "result": result,
-                "explanation": explanation,
-                "has_image": image_b64 is not None
-            })
-            
-            response_data = {
-                "result": result,
-                "explanation": explanation,
-                "image": image_b64,
-                "code_executed": code,
-                "attempt": attempt + 1
-            }
-            
-            # Add scraping code and source URL if available
-            if scraping_code:
-                response_data["scraping_code"] = scraping_code
-            if url_source:
-                response_data["url_source"] = url_source
-                response_data["data_source_type"] = "web_scraping"
+            # Execute the code on the columns it uses
+            run = (lambda namespace: profile_exec(code, namespace)) if profile else None
+            with span('exec', attempt=attempt + 1), EXEC_SECONDS.time(kind='query'):
+                local_vars, pruning, exec_profile = await to_thread(
+                    exec_pruned, code, df, engine, get_profile(df, engine), run)
+            if exec_profile is not None:
+                # Keep the profile with the trace so slow queries can be inspected later
+                set_trace_attribute('exec_profile', exec_profile)
             
+            response_data = await to_thread(build_response, local_vars, code, attempt, scraping_code,
+                                            url_source)
+            if pruning is not None:
+                response_data["column_pruning"] = pruning
+            if exec_profile is not None:
+                response_data["profile"] = exec_profile
+            save_answer(session_id, question, response_data)
+            if schema is not None:
+                question_cache.add(question, code, schema, df.columns, get_profile(df, engine))
+            QUERY_ATTEMPTS.observe(attempt + 1)
             return response_data
             
         except Exception as e:
@@ -234,6 +369,404 @@ Generate ONLY the Python code, no explanatory text before or after.
                 }
             
             # Update prompt with error info for retry
+            RETRIES.inc(stage='query')
             prompt += f"\n\nThe previous code failed with this error:\n{error_msg}\n\nTraceback:\n{tb}\n\nPlease fix the code and try again."
             
     return {"error": "Unexpected error in processing loop"}
+
+def _lookup_question(question: str, schema: str, df, engine: str):
+    with span('question_cache') as cache_span:
+        hit = question_cache.lookup(question, schema, df.columns, get_profile(df, engine))
+        if cache_span is not None:
+            cache_span.set_attribute('hit', hit is not None)
+    return hit
+
+def route_query(question: str, context: dict) -> dict:
+    """
+    How a query will be answered, decided before it is scheduled from the
+    question, the profile and the question cache, never the data. Its lane is
+    'fast' when it won't generate code - a fast path intent, a precomputed
+    answer, or a similar question's code on a dataset small enough to skip
+    sample validation - else 'normal'. Pass it to process_query, which then
+    doesn't repeat the work.
+    """
+    df, engine, dataset_version = memory_store.snapshot()
+    route = {"lane": 'normal', "dataset_version": dataset_version, "fast_path": None, "schema": None, "hit": None}
+    if df is None:
+        route["lane"] = 'fast'
+        return route
+    if not (context or {}).get('disable_fast_path'):
+        route["fast_path"] = plan_fast_path(question, engine, get_profile(df, engine), df.columns)
+        if route["fast_path"] is not None:
+            route["lane"] = 'fast'
+            return route
+    if question_cache.enabled and not context:
+        route["schema"] = schema_key(df, engine)
+        route["hit"] = hit = _lookup_question(question, route["schema"], df, engine)
+        if hit is not None:
+            if not needs_validation(df) or question_cache.answer(dataset_version, hit["key"]) is not None:
+                route["lane"] = 'fast'
+    return route
+
+def answer_from_cache(hit: dict, question: str, df, engine: str, sample, session_id: str, profile: bool,
+                      scraping_code=None, url_source=None):
+    """
+    Answer with the code of a similar earlier question, or None when it
+    doesn't run cleanly here: any error, on the validation sample or the
+    data, sends the question to the LLM as usual.
+    """
+    code = hit["code"]
+    run = (lambda namespace: profile_exec(code, namespace)) if profile else None
+    try:
+        if sample is not None:
+            with span('exec.sample', attempt=0, rows=len(sample)), EXEC_SECONDS.time(kind='sample'):
+                exec_pruned(code, sample, engine)
+        with span('exec', attempt=0), EXEC_SECONDS.time(kind='query'):
+            local_vars, pruning, exec_profile = exec_pruned(code, df, engine, get_profile(df, engine), run)
+        if 'result' not in local_vars:
+            raise ValueError("no result")
+    except Exception as e:
+        print(f"⚠️ Code of a similar question failed, asking the LLM: {e}")
+        QUESTION_CACHE_REUSE.inc(outcome='rejected')
+        return None
+    QUESTION_CACHE_REUSE.inc(outcome='reused')
+    set_attribute('question_cache_similarity', round(hit["similarity"], 3))
+    
+    response_data = build_response(local_vars, code, -1, scraping_code, url_source)  # attempt 0: no LLM call
+    response_data["question_cache"] = {"matched_question": hit["question"], "similarity": round(hit["similarity"], 3)}
+    if pruning is not None:
+        response_data["column_pruning"] = pruning
+    if exec_profile is not None:
+        response_data["profile"] = exec_profile
+    save_answer(session_id, question, response_data)
+    return response_data
+
+def precompute_answers(entries: list, dataset_version: int):
+    """
+    Run library programs ({code, key}) on the dataset uploaded as
+    dataset_version, so their questions are answered without running
+    anything. The answers are kept in the code library, where every worker
+    finds them. Stops when a newer dataset replaces it. Plotting programs are
+    skipped: pyplot state is not safe to share with concurrent queries.
+    """
+    df, engine, version = memory_store.snapshot()
+    if df is None or version != dataset_version:
+        return
+    question_cache.drop_answers(dataset_version)
+    scraping_code = memory_store.get('scraping_code', None)
+    url_source = memory_store.get('url_source', None)
+    done = 0
+    for entry in entries:
+        if memory_store.dataset_version != dataset_version:
+            break
+        code = entry["code"]
+        if 'plt.' in code or 'sns.' in code:
+            continue
+        try:
+            with EXEC_SECONDS.time(kind='precompute'):
+                local_vars, pruning, _ = exec_pruned(code, df, engine, get_profile(df, engine))
+            if 'result' not in local_vars:
+                continue
+            response_data = build_response(local_vars, code, -1, scraping_code, url_source)
+        except Exception as e:
+            print(f"⚠️ Library program for '{entry['question']}' failed on the new dataset: {e}")
+            continue
+        if pruning is not None:
+            response_data["column_pruning"] = pruning
+        question_cache.save_answer(dataset_version, entry["key"], response_data)
+        done += 1
+    print(f"⚡ Precomputed {done}/{len(entries)} library answers for dataset version {dataset_version}")
+
+def precomputed_answer(hit: dict, dataset_version: int, session_id: str, question: str):
+    """The answer precomputed for the program of a question cache hit, if any"""
+    precomputed = question_cache.answer(dataset_version, hit["key"])
+    record_cache('precomputed', precomputed is not None)
+    if precomputed is None:
+        return None
+    response_data = {**precomputed, "question_cache": {
+        "matched_question": hit["question"], "similarity": round(hit["similarity"], 3), "precomputed": True}}
+    save_answer(session_id, question, response_data)
+    return response_data
+
+def run_on_sample(code: str, sample, engine: str, attempt: int):
+    """
+    Run code on the validation sample and return its namespace. Errors that
+    would also happen on the full data propagate so the caller retries;
+    anything else only means the sample was not representative, and None is
+    returned so the full run goes ahead.
+    """
+    try:
+        with span('exec.sample', attempt=attempt + 1, rows=len(sample)), EXEC_SECONDS.time(kind='sample'):
+            sample_vars, _, _ = exec_pruned(code, sample, engine)
+    except Exception as e:
+        if is_schema_error(e):
+            SAMPLE_VALIDATIONS.inc(outcome='caught')
+            raise
+        SAMPLE_VALIDATIONS.inc(outcome='inconclusive')
+        return None
+    SAMPLE_VALIDATIONS.inc(outcome='passed')
+    return sample_vars
+
+def build_response(local_vars: dict, code: str, attempt: int, scraping_code=None, url_source=None) -> dict:
+    """API response from the namespace of an executed program"""
+    result = local_vars.get('result', 'No result returned')
+    explanation = local_vars.get('explanation', 'Analysis completed')
+    image_bytes = local_vars.get('image_bytes')
+    
+    # Large tables stay server-side; the response only carries the first page
+    result_handle = None
+    if is_tabular(result) and len(result) > RESULT_HANDLE_MIN_ROWS:
+        try:
+            with span('result.store', rows=len(result)):
+                result_handle = result_store.put(result)
+            result = result.head(RESULT_PAGE_ROWS)
+        except Exception as e:
+            print(f"⚠️ Could not store result server-side, returning it inline: {e}")
+    
+    # Convert result to JSON-serializable format
+    with span('serialize'), SERIALIZATION_SECONDS.time():
+        result = make_json_serializable(result)
+    
+    # Encode image if present
+    image_b64 = None
+    if image_bytes:
+        with span('image.encode', bytes=len(image_bytes)), IMAGE_ENCODE_SECONDS.time():
+            image_b64 = base64.b64encode(image_bytes).decode()
+    
+    response_data = {
+        "result": result,
+        "explanation": explanation,
+        "image": image_b64,
+        "code_executed": code,
+        "attempt": attempt + 1
+    }
+    if result_handle is not None:
+        response_data["result_handle"] = {**result_handle, "page_rows": RESULT_PAGE_ROWS}
+    # Add scraping code and source URL if available
+    if scraping_code:
+        response_data["scraping_code"] = scraping_code
+    if url_source:
+        response_data["url_source"] = url_source
+        response_data["data_source_type"] = "web_scraping"
+    return response_data
+
+def save_answer(session_id: str, question: str, response_data: dict):
+    """Save an answered query to conversation history"""
+    from app.memory import save_conversation
+    handle = response_data.get("result_handle")
+    if handle:
+        # The handle, not the stringified table
+        result = {"result_handle": handle["handle"], "rows": handle["rows"], "columns": handle["columns"]}
+    else:
+        result = response_data["result"]
+    save_conversation(session_id, question, {
+        "result": result,
+        "explanation": response_data["explanation"],
+        "has_image": response_data.get("image") is not None
+    })
+
+# Keeps background full runs referenced until they finish
+_background_tasks = set()
+
+def start_full_run(code: str, df, engine: str, sample_vars: dict, sample_rows: int, question: str, session_id: str,
+                   attempt: int, scraping_code=None, url_source=None) -> dict:
+    """Answer from the sample now and finish on the full dataset as a background job, scheduled like a query"""
+    job_id = query_jobs.create(question, session_id)
+    profile = get_profile(df, engine)
+    
+    def run_full():
+        with EXEC_SECONDS.time(kind='query'):
+            local_vars, pruning, _ = exec_pruned(code, df, engine, profile)
+        response_data = build_response(local_vars, code, attempt, scraping_code, url_source)
+        if pruning is not None:
+            response_data["column_pruning"] = pruning
+        return response_data
+    
+    async def finish():
+        try:
+            response_data, _ = await query_scheduler.run(session_id, lambda: to_thread(run_full))
+        except QueueFull as e:
+            query_jobs.finish(job_id, error=f"{e}; retry in {e.retry_after} s or ask without preview")
+            return
+        except Exception as e:
+            query_jobs.finish(job_id, error=f"Full run failed: {e}")
+            return
+        save_answer(session_id, question, response_data)
+        QUERY_ATTEMPTS.observe(attempt + 1)
+        query_jobs.finish(job_id, result=response_data)
+    
+    task = asyncio.get_running_loop().create_task(finish())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    
+    response_data = build_response(sample_vars, code, attempt, scraping_code, url_source)
+    response_data.update({
+        "preview": True,
+        "sample_rows": sample_rows,
+        "total_rows": len(df),
+        "job_id": job_id,
+        "status": "running",
+    })
+    return response_data
+
+
+# Questions per LLM call in a batch; larger batches make the generated program fragile
+BATCH_CHUNK_SIZE = 15
+
+def _batch_prompt(numbered_questions, df_info, filename, engine, context, shared_names):
+    question_lines = "\n".join(f"{i}. {q}" for i, q in numbered_questions)
+    shared = ""
+    if shared_names:
+        shared = f"\nVariables already computed by earlier batches (reuse them if helpful): {shared_names}\n"
+    return f"""
+You are a data analyst agent. Generate ONE Python program that answers ALL of the user's questions about their dataset.
+
+Dataset Info:
+- Filename: {filename}
+- Shape: {df_info['shape']} (rows, columns)
+- Columns: {df_info['columns']}
+- Data types: {df_info['dtypes']}
+{dtype_notes(df_info, engine)}- Sample data: {df_info['sample']}
+
+Questions:
+{question_lines}
+
+Context: {context}
+{shared}
+CRITICAL INSTRUCTIONS:
+1. DO NOT load any CSV files or use pd.read_csv() or similar functions
+2. The dataset is ALREADY LOADED in the variable 'dataframe' - use it directly
+3. The engine is '{engine}' so use {'pandas' if engine == 'pandas' else 'polars'} methods
+4. Compute intermediate results shared by several questions ONCE at the top level
+   (for example one groupby reused by several answers)
+5. For EACH question number N define a function with no arguments:
+   ```python
+   def answer_N():
+       ...
+       return result, explanation
+   ```
+   - result: the answer (numbers, text, or dict/list)
+   - explanation: clear explanation of what you found
+6. Keep top-level code simple and safe; put anything that may fail inside the answer_N functions
+7. Do not create visualizations
+
+Generate ONLY the Python code, no explanatory text before or after.
+"""
+
+def _shared_variable_names(namespace: dict, baseline: dict) -> list:
+    """Names of intermediate results left in the namespace by earlier programs"""
+    return sorted(
+        name for name, value in namespace.items()
+        if name not in baseline and not name.startswith('_') and not callable(value)
+        and not isinstance(value, type(io))
+    )
+
+def _run_batch_program(numbered_questions, namespace, baseline, df_info, filename, engine, context):
+    """Generate and execute one multi-answer program, returning per-question outcomes"""
+    with PROMPT_BUILD_SECONDS.time():
+        prompt = _batch_prompt(numbered_questions, df_info, filename, engine, context,
+                               _shared_variable_names(namespace, baseline))
+    outcomes = {}
+    code = None
+    llm_calls = 0
+
+    # Retry the whole program only if its shared top-level code fails
+    for attempt in range(3):
+        code = extract_code(call_gemini(prompt))
+        llm_calls += 1
+        try:
+            with span('exec', attempt=attempt + 1), EXEC_SECONDS.time(kind='batch'):
+                exec(code, namespace, namespace)
+            break
+        except Exception as e:
+            if attempt == 2:
+                error = f"Batch program failed after 3 attempts. Last error: {e}"
+                return {i: {"error": error} for i, _ in numbered_questions}, code, llm_calls
+            RETRIES.inc(stage='batch')
+            prompt += f"\n\nThe previous program failed at top level with this error:\n{e}\n\nTraceback:\n{traceback.format_exc()}\n\nPlease fix the program and try again."
+
+    for i, _ in numbered_questions:
+        answer_fn = namespace.pop(f'answer_{i}', None)
+        if not callable(answer_fn):
+            outcomes[i] = {"error": f"No answer_{i}() function was generated"}
+            continue
+        try:
+            with span('exec.answer', index=i), EXEC_SECONDS.time(kind='batch_answer'):
+                answer = answer_fn()
+            if isinstance(answer, tuple) and len(answer) >= 2:
+                result, explanation = answer[0], answer[1]
+            else:
+                result, explanation = answer, 'Analysis completed'
+            with SERIALIZATION_SECONDS.time():
+                result = make_json_serializable(result)
+            outcomes[i] = {"result": result, "explanation": explanation}
+        except Exception as e:
+            outcomes[i] = {"error": f"{type(e).__name__}: {e}"}
+    return outcomes, code, llm_calls
+
+@self_healing_decorator
+async def process_batch_query(questions: list, context: dict, session_id: str):
+    """Answer many questions about the dataset with shared LLM calls and one shared execution"""
+    df, engine, dataset_version = memory_store.snapshot()
+    filename = memory_store.get('filename', 'unknown')
+
+    if df is None:
+        return {"error": "No dataset loaded. Please upload a dataset first."}
+    set_attribute('dataset_version', dataset_version)
+
+    from app.memory import save_conversation
+
+    answers = {}
+    pending = []
+    profile = get_profile(df, engine)
+    for i, question in enumerate(questions, 1):
+        fast = None
+        if not (context or {}).get('disable_fast_path'):
+            fast = await to_thread(answer_fast_path, question, df, engine, profile)
+            record_cache('fast_path', fast is not None)
+        if fast is not None:
+            answers[i] = {
+                "result": make_json_serializable(fast["result"]),
+                "explanation": fast["explanation"],
+                "fast_path": fast["intent"]
+            }
+        else:
+            pending.append((i, question))
+
+    df_info = get_dataset_info(df, engine)
+    namespace = build_exec_namespace(df)
+    baseline = dict(namespace)
+    programs = []
+    llm_calls = 0
+
+    # One program per chunk, all executed in the same namespace so later
+    # chunks can reuse intermediates computed by earlier ones
+    for start in range(0, len(pending), BATCH_CHUNK_SIZE):
+        chunk = pending[start:start + BATCH_CHUNK_SIZE]
+        with span('batch.chunk', questions=len(chunk)):
+            outcomes, code, calls = await to_thread(_run_batch_program, chunk, namespace, baseline, df_info,
+                                                    filename, engine, context)
+        answers.update(outcomes)
+        programs.append(code)
+        llm_calls += calls
+
+    results = []
+    for i, question in enumerate(questions, 1):
+        answer = answers[i]
+        if "error" in answer:
+            results.append({"index": i, "question": question, "success": False, "error": answer["error"]})
+            continue
+        save_conversation(session_id, question, {
+            "result": answer["result"],
+            "explanation": answer["explanation"],
+            "has_image": False
+        })
+        results.append({"index": i, "question": question, "success": True, **answer})
+
+    return {
+        "results": results,
+        "answered": sum(1 for r in results if r["success"]),
+        "failed": sum(1 for r in results if not r["success"]),
+        "llm_calls": llm_calls,
+        "code_executed": programs
+    }
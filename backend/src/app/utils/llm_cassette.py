@@ -0,0 +1,116 @@
+"""
+Record/replay cassettes for LLM calls.
+A cassette wraps the LLM backend: in record mode every prompt/response pair
+is saved to a JSON file keyed by a hash of the model name and the
+normalized prompt; in replay mode responses are served from that file with
+no network access, so the full pipeline can be run repeatedly and
+deterministically.
+
+Enable it with environment variables:
+    LLM_CASSETTE=path/to/cassette.json
+    LLM_CASSETTE_MODE=replay | record | auto   (auto: replay hits, record misses)
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Callable, Optional
+
+MODES = ("replay", "record", "auto")
+
+# Parts of a prompt that change between runs without changing its meaning:
+# traceback file paths/line numbers and object addresses in retry prompts
+_VOLATILE_PATTERNS = [
+    (re.compile(r'File "[^"]*", line \d+'), 'File "<file>", line <n>'),
+    (re.compile(r"0x[0-9a-fA-F]{6,}"), "0x<addr>"),
+]
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when a prompt has no recorded response"""
+
+
+def normalize_prompt(prompt: str) -> str:
+    for pattern, replacement in _VOLATILE_PATTERNS:
+        prompt = pattern.sub(replacement, prompt)
+    return prompt.strip()
+
+
+def prompt_key(prompt: str, model_name: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(model_name.encode())
+    digest.update(b"\0")
+    digest.update(normalize_prompt(prompt).encode())
+    return digest.hexdigest()
+
+
+class Cassette:
+    """LLM backend that records to / replays from a JSON file"""
+
+    def __init__(self, path: str, mode: str = "replay", inner: Optional[Callable[[str, str], str]] = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}', expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self.interactions = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.interactions = json.load(f).get("interactions", {})
+
+    def __call__(self, prompt: str, model_name: str) -> str:
+        key = prompt_key(prompt, model_name)
+        if self.mode != "record":
+            entry = self.interactions.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry["response"]
+            if self.mode == "replay":
+                self.misses += 1
+                raise CassetteMiss(f"No recorded LLM response for prompt {key[:12]} in {self.path}")
+
+        if self.inner is None:
+            raise CassetteMiss("Cassette is recording but has no LLM backend to record from")
+        start = time.perf_counter()
+        response = self.inner(prompt, model_name)
+        latency_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.interactions[key] = {
+                "model": model_name,
+                "prompt": normalize_prompt(prompt),
+                "response": response,
+                "latency_ms": round(latency_ms, 1),
+                "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            }
+            self.recorded += 1
+            self.save()
+        return response
+
+    def save(self):
+        """Write the cassette atomically so a crash never leaves a truncated file"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": 1, "interactions": self.interactions}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def stats(self):
+        return {"mode": self.mode, "interactions": len(self.interactions),
+                "hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+
+def cassette_from_env(inner: Callable[[str, str], str]) -> Optional[Cassette]:
+    """Cassette configured by LLM_CASSETTE / LLM_CASSETTE_MODE, or None"""
+    path = os.getenv("LLM_CASSETTE")
+    if not path:
+        return None
+    return Cassette(path, os.getenv("LLM_CASSETTE_MODE", "replay"), inner)
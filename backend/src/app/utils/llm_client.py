@@ -0,0 +1,73 @@
+"""
+Single entry point for LLM calls.
+llm_agent, data_handler and self_healing all go through generate(), so the
+Gemini client is configured in one place and tests, benchmarks and
+offline runs can swap in a different backend with set_llm_backend().
+Setting LLM_CASSETTE routes calls through a record/replay cassette
+(see llm_cassette).
+"""
+
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# backend(prompt, model_name) -> response text
+LLMBackend = Callable[[str, str], str]
+
+_backend: Optional[LLMBackend] = None
+_env_checked = False
+_models: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def _get_model(model_name: str):
+    model = _models.get(model_name)
+    if model is None:
+        with _lock:
+            model = _models.get(model_name)
+            if model is None:
+                import google.generativeai as genai
+                if not _models:
+                    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                model = _models[model_name] = genai.GenerativeModel(model_name)
+    return model
+
+
+def _gemini_backend(prompt: str, model_name: str) -> str:
+    return _get_model(model_name).generate_content(prompt).text
+
+
+def set_llm_backend(backend: Optional[LLMBackend]):
+    """Route every LLM call to backend; None restores Gemini"""
+    global _backend
+    _backend = backend
+
+
+def get_llm_backend() -> LLMBackend:
+    global _backend, _env_checked
+    if _backend is None and not _env_checked:
+        _env_checked = True
+        from app.utils.llm_cassette import cassette_from_env
+        _backend = cassette_from_env(_gemini_backend)
+    return _backend or _gemini_backend
+
+
+def gemini_backend() -> LLMBackend:
+    """The real Gemini backend, e.g. to record a cassette from"""
+    return _gemini_backend
+
+
+def warm_up(*model_names: str):
+    """Import and configure the Gemini client ahead of the first request"""
+    if get_llm_backend() is _gemini_backend and os.getenv("GEMINI_API_KEY"):
+        for model_name in model_names:
+            _get_model(model_name)
+
+
+def generate(prompt: str, model_name: str) -> str:
+    """Send prompt to model_name and return the response text"""
+    return get_llm_backend()(prompt, model_name)
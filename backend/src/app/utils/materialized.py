@@ -0,0 +1,611 @@
+"""
+Materialized analyses.
+A pinned question keeps its generated program and its latest answer (in
+SQLite, MATERIALIZED_DB), so a dashboard reads the answer without running
+anything. After every upload the answers are brought up to date without the
+LLM:
+  - when rows are appended (POST /api/upload with mode=append), programs
+    that compute decomposable aggregates - count, sum, mean, min or max of a
+    column or of a row-wise expression, over optional row filters, overall
+    or per group (groupby, value_counts) - merge partial state for the
+    appended rows only (per group: rows, non-null count, sum, min, max) and
+    recompute their answer from it;
+  - other programs, and all of them after an upload that replaces the
+    dataset, are re-run on the full dataset in a background thread. Plots
+    are re-run when next read instead: pyplot state is not safe to share
+    with concurrent queries.
+Programs are recognised as decomposable from their AST (pandas only), and
+only trusted to be if, when pinned, the answer rebuilt from their state
+matched the program's own answer.
+"""
+
+import ast
+import copy
+import functools
+import json
+import math
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.utils.dtype_optimizer import widen_dtypes
+from app.utils.metrics import EXEC_SECONDS, MATERIALIZED_REFRESHES
+
+MATERIALIZED_DB = os.getenv('MATERIALIZED_DB', 'backend/data/materialized.db')
+MAX_ANALYSES = int(os.getenv('MAX_ANALYSES', '100'))
+
+AGGREGATES = {'sum', 'mean', 'count', 'min', 'max'}
+# Partial state per aggregate: 'rows' counts rows, 'count' non-null values
+STATE_COLUMNS = {'sum': ('sum',), 'mean': ('sum', 'count'), 'count': ('count',), 'min': ('min',),
+                 'max': ('max',), 'size': ('rows',)}
+MERGE = {'rows': 'sum', 'count': 'sum', 'sum': 'sum', 'min': 'min', 'max': 'max'}
+# Methods and attributes of a column that keep one value per row
+ROW_METHODS = {
+    'isin', 'between', 'notna', 'notnull', 'isna', 'isnull', 'abs', 'round', 'fillna', 'astype', 'clip',
+    'str', 'contains', 'startswith', 'endswith', 'lower', 'upper', 'strip', 'len',
+    'dt', 'year', 'month', 'day', 'hour', 'weekday', 'dayofweek', 'date',
+}
+GROUPBY_KEYWORDS = {'observed', 'sort'}
+# What the code around the aggregates may use
+WRAPPER_NAMES = {'round': round, 'int': int, 'float': float, 'abs': abs, 'str': str, 'bool': bool, 'len': len,
+                 'min': min, 'max': max, 'sum': sum, 'dict': dict, 'list': list, 'sorted': sorted,
+                 'pd': pd, 'np': np}
+
+
+class _NotDecomposable(Exception):
+    pass
+
+
+def _column_name(node) -> Optional[str]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+def _names(node) -> set:
+    return {child.id for child in ast.walk(node) if isinstance(child, ast.Name)}
+
+
+def _compile(node):
+    return compile(ast.fix_missing_locations(ast.Expression(body=node)), '<analysis>', 'eval')
+
+
+def _row_local(node, frames: dict) -> bool:
+    """Whether node computes one value per row of the frames it reads (a mask or a derived column)"""
+    names = _names(node)
+    if not names or not names <= set(frames):
+        return False
+    for child in ast.walk(node):
+        if isinstance(child, ast.Attribute) and child.attr not in ROW_METHODS:
+            return False
+        if isinstance(child, ast.Call) and not isinstance(child.func, ast.Attribute):
+            return False
+        if isinstance(child, ast.Subscript):
+            if isinstance(child.value, ast.Name):
+                if _column_name(child.slice) is None:
+                    return False
+            elif not isinstance(child.slice, ast.Constant):
+                return False
+        if isinstance(child, (ast.Lambda, ast.NamedExpr, ast.Starred, ast.Slice, ast.comprehension, ast.IfExp)):
+            return False
+    return True
+
+
+def _frame_chain(node, frames: dict) -> Optional[list]:
+    """Row masks selecting the frame node evaluates to from the dataset, None if node isn't such a frame"""
+    if isinstance(node, ast.Name):
+        return frames.get(node.id)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'copy' \
+            and not node.args:
+        return _frame_chain(node.func.value, frames)
+    if isinstance(node, ast.Subscript):
+        base = node.value
+        if isinstance(base, ast.Attribute) and base.attr == 'loc':
+            base = base.value
+        chain = _frame_chain(base, frames)
+        if chain is not None and _row_local(node.slice, frames):
+            return chain + [node.slice]
+    return None
+
+
+def _series(node, frames: dict):
+    """(row masks, per-row value expression) of a column-like expression"""
+    if isinstance(node, ast.Subscript) and _column_name(node.slice) is not None:
+        chain = _frame_chain(node.value, frames)
+        if chain is not None:
+            return chain, ast.Subscript(value=ast.Name(id='dataframe', ctx=ast.Load()), slice=node.slice,
+                                        ctx=ast.Load())
+    if _row_local(node, frames):
+        chains = {id(frames[name]): frames[name] for name in _names(node)}
+        if len(chains) == 1:
+            return next(iter(chains.values())), node
+    return None
+
+
+def _groupby(node, frames: dict):
+    """(row masks, keys) of F.groupby(keys)"""
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'groupby'):
+        return None
+    if len(node.args) != 1 or any(keyword.arg not in GROUPBY_KEYWORDS for keyword in node.keywords):
+        return None
+    chain = _frame_chain(node.func.value, frames)
+    key = node.args[0]
+    keys = [_column_name(key)] if _column_name(key) is not None else \
+        [_column_name(item) for item in key.elts] if isinstance(key, (ast.List, ast.Tuple)) else [None]
+    if chain is None or not keys or None in keys:
+        return None
+    return chain, tuple(keys)
+
+
+class _Aggregate:
+    """agg of a per-row value over the rows kept by masks, overall or per group of keys"""
+
+    def __init__(self, agg: str, masks: list, value=None, keys: tuple = (), name=None, counts: bool = False):
+        self.agg = agg
+        self.masks = [_compile(mask) for mask in masks]
+        self.value = _compile(value) if value is not None else None
+        self.keys = keys
+        self.name = name
+        self.counts = counts  # value_counts: most frequent first
+
+    def partial(self, df, names) -> pd.DataFrame:
+        """State of df's rows: one row per group, a column per statistic"""
+        frame = df
+        for mask in self.masks:
+            frame = frame[eval(mask, {'__builtins__': {}}, dict.fromkeys(names, frame))]
+        values = None
+        if self.value is not None:
+            values = eval(self.value, {'__builtins__': {}}, dict.fromkeys(names, frame))
+            if not isinstance(values, pd.Series):
+                raise _NotDecomposable(f"per-row value is a {type(values).__name__}")
+        stats = STATE_COLUMNS[self.agg]
+        if not self.keys:
+            return pd.DataFrame({stat: [len(frame) if stat == 'rows' else getattr(values, stat)()]
+                                 for stat in stats})
+        keys = [frame[key] for key in self.keys]
+        if values is None:
+            return frame.groupby(keys, observed=True, sort=True).size().to_frame('rows')
+        return values.groupby(keys, observed=True, sort=True).agg(list(stats))
+
+    def merge(self, state: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+        if self.keys:
+            index = state.index.union(delta.index)
+            state, delta = state.reindex(index), delta.reindex(index)
+        merged = {}
+        for stat in state.columns:
+            if MERGE[stat] == 'sum':
+                total = state[stat].add(delta[stat], fill_value=0)
+                merged[stat] = total.astype(state[stat].dtype) if state[stat].dtype.kind in 'iu' \
+                    and not total.isna().any() else total
+            else:
+                merged[stat] = (np.fmin if MERGE[stat] == 'min' else np.fmax)(state[stat], delta[stat])
+        return pd.DataFrame(merged, index=state.index)
+
+    def value_of(self, state: pd.DataFrame):
+        """The aggregate, as the pandas expression it replaces would return it"""
+        values = state['sum'] / state['count'] if self.agg == 'mean' else state[STATE_COLUMNS[self.agg][0]]
+        if not self.keys:
+            if len(values) == 0:
+                return {'sum': 0, 'count': 0, 'size': 0}.get(self.agg, np.nan)
+            return values.iloc[0]
+        values = values.copy()
+        values.index = values.index.set_names(list(self.keys))
+        values.name = self.name
+        return values.sort_values(ascending=False, kind='stable') if self.counts else values
+
+
+def _aggregate(node, frames: dict) -> Optional[_Aggregate]:
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'len' \
+            and len(node.args) == 1 and not node.keywords:
+        chain = _frame_chain(node.args[0], frames)
+        series = None if chain is not None else _series(node.args[0], frames)
+        if chain is not None or series is not None:
+            return _Aggregate('size', chain if chain is not None else series[0])
+        return None
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Attribute) and node.value.attr == 'shape' \
+            and isinstance(node.slice, ast.Constant) and node.slice.value == 0:
+        chain = _frame_chain(node.value.value, frames)
+        return _Aggregate('size', chain) if chain is not None else None
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)) or node.args or node.keywords:
+        return None
+    method, receiver = node.func.attr, node.func.value
+    if method == 'size':
+        grouped = _groupby(receiver, frames)
+        return _Aggregate('size', grouped[0], keys=grouped[1]) if grouped else None
+    if method == 'value_counts':
+        series = _series(receiver, frames)
+        if series is None or not isinstance(series[1], ast.Subscript) or _column_name(series[1].slice) is None:
+            return None
+        return _Aggregate('size', series[0], keys=(series[1].slice.value,), name='count', counts=True)
+    if method not in AGGREGATES:
+        return None
+    if isinstance(receiver, ast.Subscript) and _column_name(receiver.slice) is not None:
+        grouped = _groupby(receiver.value, frames)
+        if grouped:
+            value = ast.Subscript(value=ast.Name(id='dataframe', ctx=ast.Load()), slice=receiver.slice,
+                                  ctx=ast.Load())
+            return _Aggregate(method, grouped[0], value, grouped[1], name=receiver.slice.value)
+    series = _series(receiver, frames)
+    return _Aggregate(method, series[0], series[1]) if series else None
+
+
+class _Extract(ast.NodeTransformer):
+    """Replaces every aggregate with a name (_agg0, _agg1...) bound to its value"""
+
+    def __init__(self, frames: dict):
+        self.frames = frames
+        self.aggregates: List[_Aggregate] = []
+
+    def visit(self, node):
+        aggregate = _aggregate(node, self.frames) if isinstance(node, ast.expr) else None
+        if aggregate is None:
+            return self.generic_visit(node)
+        self.aggregates.append(aggregate)
+        return ast.Name(id=f'_agg{len(self.aggregates) - 1}', ctx=ast.Load())
+
+
+class _Inline(ast.NodeTransformer):
+    def __init__(self, values: dict):
+        self.values = values
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and node.id in self.values:
+            return copy.deepcopy(self.values[node.id])
+        return node
+
+
+class IncrementalPlan:
+    """A program rewritten as aggregates with partial state, and the expression combining them into result"""
+
+    def __init__(self, aggregates: List[_Aggregate], expression, frame_names):
+        self.aggregates = aggregates
+        self.expression = _compile(expression)
+        self.frame_names = list(frame_names)
+
+    def partial(self, df) -> List[pd.DataFrame]:
+        df = widen_dtypes(df)  # the dtypes the full run sees
+        return [aggregate.partial(df, self.frame_names) for aggregate in self.aggregates]
+
+    def merge(self, states: List[pd.DataFrame], deltas: List[pd.DataFrame]) -> List[pd.DataFrame]:
+        return [aggregate.merge(state, delta) for aggregate, state, delta in zip(self.aggregates, states, deltas)]
+
+    def result(self, states: List[pd.DataFrame]):
+        values = {f'_agg{i}': aggregate.value_of(state)
+                  for i, (aggregate, state) in enumerate(zip(self.aggregates, states))}
+        return eval(self.expression, {'__builtins__': {}, **WRAPPER_NAMES}, values)
+
+
+def _plan(code: str) -> IncrementalPlan:
+    frames = {'dataframe': []}
+    values = {}
+    result = None
+    for statement in ast.parse(code).body:
+        if isinstance(statement, (ast.Import, ast.ImportFrom)) or \
+                (isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant)):
+            continue
+        if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name)):
+            raise _NotDecomposable(f"line {statement.lineno} is not a plain assignment")
+        name = statement.targets[0].id
+        if name == 'explanation':
+            continue
+        if name in frames or name in values or (name == 'result' and result is not None):
+            raise _NotDecomposable(f"'{name}' is assigned twice")
+        expression = _Inline(values).visit(statement.value)
+        if name == 'result':
+            result = expression
+            continue
+        chain = _frame_chain(expression, frames)
+        if chain is not None:
+            frames[name] = chain
+        else:
+            values[name] = expression
+    if result is None:
+        raise _NotDecomposable("no result")
+    extract = _Extract(frames)
+    expression = extract.visit(result)
+    leftover = _names(expression) - set(WRAPPER_NAMES) - {f'_agg{i}' for i in range(len(extract.aggregates))}
+    if not extract.aggregates or leftover:
+        raise _NotDecomposable(f"result reads {sorted(leftover)} outside a decomposable aggregate"
+                               if leftover else "no aggregate")
+    return IncrementalPlan(extract.aggregates, expression, frames)
+
+
+@functools.lru_cache(maxsize=256)
+def plan_program(code: str) -> Optional[IncrementalPlan]:
+    """The program's incremental plan, None when it isn't a decomposable aggregate"""
+    try:
+        return _plan(code)
+    except (_NotDecomposable, SyntaxError):
+        return None
+
+
+def same_answer(a, b) -> bool:
+    """Serialized answers equal up to float rounding"""
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same_answer(a[key], b[key]) for key in a)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same_answer(x, y) for x, y in zip(a, b))
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) \
+            and not isinstance(a, bool) and not isinstance(b, bool):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12)
+    return a == b
+
+
+class AnalysisStore:
+    """SQLite table of pinned analyses"""
+
+    FIELDS = ('id', 'question', 'session_id', 'code', 'answer', 'state', 'dataset_version', 'refreshed',
+              'created_at', 'updated_at')
+
+    def __init__(self, path: str = MATERIALIZED_DB):
+        self.path = path
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''CREATE TABLE IF NOT EXISTS analyses (
+                    id TEXT PRIMARY KEY, question TEXT, session_id TEXT, code TEXT, answer TEXT, state BLOB,
+                    dataset_version INTEGER, refreshed TEXT, created_at REAL, updated_at REAL)''')
+                conn.commit()
+                self._initialized = True
+        return conn
+
+    @staticmethod
+    def _decode(row) -> Dict[str, Any]:
+        analysis = dict(row)
+        analysis['answer'] = json.loads(analysis['answer'])
+        analysis['state'] = pickle.loads(analysis['state']) if analysis['state'] is not None else None
+        return analysis
+
+    def all(self) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT * FROM analyses ORDER BY created_at').fetchall()
+        finally:
+            conn.close()
+        return [self._decode(row) for row in rows]
+
+    def get(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM analyses WHERE id=?', (analysis_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._decode(row) if row is not None else None
+
+    def count(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM analyses').fetchone()[0]
+        finally:
+            conn.close()
+
+    def add(self, analysis: Dict[str, Any]):
+        conn = self._connect()
+        try:
+            conn.execute(f"INSERT INTO analyses VALUES ({', '.join('?' * len(self.FIELDS))})",
+                         [self._encode(field, analysis.get(field)) for field in self.FIELDS])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def update(self, analysis_id: str, expected_version: int, **fields) -> bool:
+        """Set fields unless another refresh got there first (dataset_version no longer expected_version)"""
+        fields['updated_at'] = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                f"UPDATE analyses SET {', '.join(f'{field}=?' for field in fields)} "
+                f"WHERE id=? AND dataset_version=?",
+                [self._encode(field, value) for field, value in fields.items()] + [analysis_id, expected_version])
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def delete(self, analysis_id: str) -> bool:
+        conn = self._connect()
+        try:
+            cursor = conn.execute('DELETE FROM analyses WHERE id=?', (analysis_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _encode(field: str, value):
+        if field == 'answer':
+            return json.dumps(value, default=str)
+        if field == 'state':
+            return pickle.dumps(value) if value is not None else None
+        return value
+
+
+analysis_store = AnalysisStore()
+
+
+def _answer(response_data: dict) -> dict:
+    """The parts of a query response an analysis keeps"""
+    return {key: response_data.get(key) for key in ('result', 'explanation', 'image', 'result_handle')
+            if response_data.get(key) is not None}
+
+
+def _is_plot(code: str) -> bool:
+    return 'plt.' in code or 'sns.' in code
+
+
+def public(analysis: dict, dataset_version: Optional[int] = None) -> dict:
+    """An analysis as returned by the API"""
+    return {
+        "id": analysis["id"],
+        "question": analysis["question"],
+        "code": analysis["code"],
+        "incremental": analysis["state"] is not None,
+        **analysis["answer"],
+        "dataset_version": analysis["dataset_version"],
+        "stale": dataset_version is not None and analysis["dataset_version"] != dataset_version,
+        "refreshed": analysis["refreshed"],
+        "updated_at": analysis["updated_at"],
+    }
+
+
+def _initial_state(code: str, df, engine: str, result) -> Optional[List[pd.DataFrame]]:
+    """Partial state of the full dataset if the program's plan reproduces its answer, else None"""
+    from app.utils.llm_agent import make_json_serializable
+
+    plan = plan_program(code) if engine == 'pandas' else None
+    if plan is None:
+        return None
+    try:
+        states = plan.partial(df)
+        if same_answer(make_json_serializable(plan.result(states)), result):
+            return states
+        print("⚠️ Incremental plan does not reproduce the pinned answer; it will be re-run on appends")
+    except Exception as e:
+        print(f"⚠️ Incremental plan failed on the dataset ({e}); it will be re-run on appends")
+    return None
+
+
+async def pin_analysis(question: str, session_id: str) -> dict:
+    """Answer question (reusing stored programs where possible) and keep it as a materialized analysis"""
+    from app.memory import memory_store
+    from app.utils.llm_agent import process_query
+    from app.utils.scheduler import to_thread
+
+    if analysis_store.count() >= MAX_ANALYSES:
+        return {"error": f"At most {MAX_ANALYSES} analyses can be pinned; delete one first"}
+    df, engine, version = memory_store.snapshot()
+    if df is None:
+        return {"error": "No dataset loaded. Please upload a dataset first."}
+    response_data = await process_query(question, {}, session_id)
+    if not isinstance(response_data, dict) or response_data.get("error") or response_data.get("success") is False \
+            or not response_data.get("code_executed"):
+        return {"error": (response_data or {}).get("error") or "The question could not be answered"}
+    if response_data.get("result_handle") is not None:
+        return {"error": "Large table results can't be pinned; ask for an aggregate instead"}
+    code = response_data["code_executed"]
+    state = await to_thread(_initial_state, code, df, engine, response_data.get("result"))
+    now = time.time()
+    analysis = {"id": uuid.uuid4().hex[:12], "question": question, "session_id": session_id, "code": code,
+                "answer": _answer(response_data), "state": state, "dataset_version": version,
+                "refreshed": "pinned", "created_at": now, "updated_at": now}
+    analysis_store.add(analysis)
+    return public(analysis, memory_store.dataset_version)
+
+
+def rerun(analysis: dict, df, engine: str, dataset_version: int) -> Optional[dict]:
+    """Run the analysis' program on the full dataset; returns the updated analysis (None if it failed)"""
+    from app.utils.llm_agent import build_response, exec_pruned, get_profile
+
+    code = analysis["code"]
+    try:
+        with EXEC_SECONDS.time(kind='materialized'):
+            local_vars, _, _ = exec_pruned(code, df, engine, get_profile(df, engine))
+        answer = _answer(build_response(local_vars, code, -1))
+    except Exception as e:
+        MATERIALIZED_REFRESHES.inc(mode='failed')
+        print(f"⚠️ Pinned analysis '{analysis['question']}' failed on the dataset: {e}")
+        return None
+    plan = plan_program(code) if analysis["state"] is not None and engine == 'pandas' else None
+    state = plan.partial(df) if plan is not None else None
+    if not analysis_store.update(analysis["id"], analysis["dataset_version"], answer=answer, state=state,
+                                 dataset_version=dataset_version, refreshed='full'):
+        return None
+    MATERIALIZED_REFRESHES.inc(mode='full')
+    return {**analysis, "answer": answer, "state": state, "dataset_version": dataset_version, "refreshed": 'full'}
+
+
+def _rerun_all(analyses: List[dict], dataset_version: int):
+    from app.memory import memory_store
+
+    df, engine, version = memory_store.snapshot()
+    if df is None or version != dataset_version:
+        return
+    done = 0
+    for analysis in analyses:
+        if memory_store.dataset_version != dataset_version:
+            break
+        done += rerun(analysis, df, engine, dataset_version) is not None
+    print(f"📌 Re-ran {done}/{len(analyses)} pinned analyses for dataset version {dataset_version}")
+
+
+def refresh_analyses(delta=None, previous_version: Optional[int] = None) -> Dict[str, int]:
+    """
+    Bring pinned analyses up to date with the active dataset. delta is the
+    frame of rows just appended to the dataset that was previous_version:
+    decomposable analyses then only aggregate those rows. Everything else
+    is re-run in the background. Returns how many of each.
+    """
+    from app.memory import memory_store
+    from app.utils.llm_agent import make_json_serializable
+
+    df, engine, version = memory_store.snapshot()
+    try:
+        analyses = analysis_store.all()
+    except sqlite3.Error as e:
+        print(f"⚠️ Materialized analyses unavailable: {e}")
+        return {"incremental": 0, "rerunning": 0}
+    if df is None or not analyses:
+        return {"incremental": 0, "rerunning": 0}
+    if delta is not None and engine != 'pandas':
+        delta = None
+    incremental, stale = 0, []
+    for analysis in analyses:
+        if analysis["dataset_version"] == version:
+            continue
+        plan = plan_program(analysis["code"]) if analysis["state"] is not None else None
+        if delta is not None and plan is not None and analysis["dataset_version"] == previous_version:
+            try:
+                state = plan.merge(analysis["state"], plan.partial(delta))
+                answer = {**analysis["answer"], "result": make_json_serializable(plan.result(state))}
+            except Exception as e:
+                print(f"⚠️ Incremental refresh of '{analysis['question']}' failed, re-running it: {e}")
+            else:
+                if analysis_store.update(analysis["id"], previous_version, answer=answer, state=state,
+                                         dataset_version=version, refreshed='incremental'):
+                    MATERIALIZED_REFRESHES.inc(mode='incremental')
+                    incremental += 1
+                continue
+        stale.append(analysis)
+    # Plots are re-run when next read
+    background = [analysis for analysis in stale if not _is_plot(analysis["code"])]
+    if background:
+        threading.Thread(target=_rerun_all, args=(background, version), daemon=True,
+                         name='materialized').start()
+    return {"incremental": incremental, "rerunning": len(stale)}
+
+
+async def get_analysis(analysis_id: str) -> Optional[dict]:
+    """The analysis, re-run first if its answer is for an older dataset"""
+    import asyncio
+    from app.memory import memory_store
+
+    analysis = analysis_store.get(analysis_id)
+    if analysis is None:
+        return None
+    df, engine, version = memory_store.snapshot()
+    if df is not None and analysis["dataset_version"] != version:
+        analysis = await asyncio.to_thread(rerun, analysis, df, engine, version) \
+            or analysis_store.get(analysis_id) or analysis
+    return public(analysis, version)
+
+
+def list_analyses() -> List[dict]:
+    from app.memory import memory_store
+
+    version = memory_store.dataset_version
+    return [public(analysis, version) for analysis in analysis_store.all()]
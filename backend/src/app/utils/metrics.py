@@ -0,0 +1,253 @@
+"""
+In-process metrics with Prometheus text exposition.
+Histograms and counters are plain Python objects guarded by a lock; an
+observation is a bisect plus two additions, so instrumenting the hot path
+costs microseconds against queries that take hundreds of milliseconds.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Tuple
+
+# Seconds: sub-millisecond fast paths up to multi-minute LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Bytes: 1 KB up to 256 MB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+# Attempts per query
+ATTEMPT_BUCKETS = (0, 1, 2, 3, 4, 5)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._samples()
+
+    def _samples(self):
+        return iter(())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            cumulative += series[len(self.buckets)]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+
+class MetricsRegistry:
+    """Holds every metric and renders the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.extend(_cache_hit_ratio_lines())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+RESPONSE_BYTES = registry.histogram(
+    "http_response_bytes", "HTTP response body size", ("route",), SIZE_BUCKETS)
+UPLOAD_PARSE_SECONDS = registry.histogram(
+    "upload_parse_seconds", "Time to parse an uploaded dataset", ("format", "engine"))
+PROMPT_BUILD_SECONDS = registry.histogram(
+    "prompt_build_seconds", "Time to build the LLM prompt for a query")
+LLM_REQUEST_SECONDS = registry.histogram(
+    "llm_request_seconds", "Latency of LLM calls", ("caller",))
+EXEC_SECONDS = registry.histogram(
+    "exec_seconds", "Time spent executing generated code", ("kind",))
+SERIALIZATION_SECONDS = registry.histogram(
+    "serialization_seconds", "Time to convert results to JSON-serializable form")
+IMAGE_ENCODE_SECONDS = registry.histogram(
+    "image_encode_seconds", "Time to base64-encode generated images")
+MEMORY_STORE_SAVE_SECONDS = registry.histogram(
+    "memory_store_save_seconds", "Time to persist the memory store to disk")
+QUERY_ATTEMPTS = registry.histogram(
+    "query_attempts", "LLM generate/exec attempts per answered query", (), ATTEMPT_BUCKETS)
+RETRIES = registry.counter(
+    "retries_total", "Retries after a failed attempt", ("stage",))
+CACHE_REQUESTS = registry.counter(
+    "cache_requests_total", "Cache lookups by outcome", ("cache", "result"))
+SAMPLE_VALIDATIONS = registry.counter(
+    "sample_validations_total", "Generated programs run on the validation sample, by outcome", ("outcome",))
+COLUMN_PRUNING = registry.counter(
+    "column_pruning_total", "Generated program runs by column pruning outcome (pruned, full, fallback)", ("outcome",))
+COLUMN_PRUNING_BYTES = registry.counter(
+    "column_pruning_bytes_saved_total", "Dataset bytes left out of pruned runs")
+QUESTION_CACHE_REUSE = registry.counter(
+    "question_cache_reuse_total", "Code reused from a similar past question, by outcome (reused, rejected)",
+    ("outcome",))
+RESPONSE_ENCODE_SECONDS = registry.histogram(
+    "response_encode_seconds", "Time to encode query and upload responses", ("format",))
+RESPONSE_COMPRESSION_BYTES = registry.counter(
+    "response_compression_bytes_total", "Compressed response bytes before and after compression",
+    ("encoding", "stage"))
+QUERY_QUEUE_WAIT_SECONDS = registry.histogram(
+    "query_queue_wait_seconds", "Time queries waited for an execution slot", ("lane",))
+QUERY_REJECTIONS = registry.counter(
+    "query_rejections_total", "Queries rejected with 429 because the queue was full", ("reason",))
+MATERIALIZED_REFRESHES = registry.counter(
+    "materialized_refreshes_total", "Pinned analyses brought up to date after an upload (incremental, full, failed)",
+    ("mode",))
+ENGINE_PLANS = registry.counter(
+    "engine_plans_total", "Engine planner decisions by strategy (pandas, polars, polars_lazy, duckdb, rejected)",
+    ("strategy",))
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _cache_hit_ratio_lines():
+    totals: Dict[str, list] = {}
+    for (cache, result), value in list(CACHE_REQUESTS._values.items()):
+        entry = totals.setdefault(cache, [0, 0])
+        entry[0 if result == "hit" else 1] += value
+    if not totals:
+        return []
+    lines = ["# HELP cache_hit_ratio Share of cache lookups that were hits",
+             "# TYPE cache_hit_ratio gauge"]
+    for cache, (hits, misses) in totals.items():
+        lines.append(f'cache_hit_ratio{{cache="{_escape(cache)}"}} {hits / max(hits + misses, 1)}')
+    return lines
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request latency and response size"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        state = {"status": 500, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = _route_name(scope)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"],
+                                         route=route, status=state["status"])
+            RESPONSE_BYTES.observe(state["bytes"], route=route)
+
+
+def _route_name(scope) -> str:
+    """Route template rather than raw path, to keep label cardinality bounded"""
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    endpoint = scope.get("endpoint")
+    if endpoint is not None:
+        return getattr(endpoint, "__name__", "unknown")
+    return "unmatched"
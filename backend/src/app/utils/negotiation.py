@@ -0,0 +1,248 @@
+"""
+Response content negotiation.
+Query and upload responses are JSON unless the Accept header asks for:
+  - application/msgpack: the same payload as MessagePack, with a generated
+    image as raw PNG bytes instead of base64 (needs the msgpack package);
+  - application/vnd.apache.arrow.stream: the tabular part of the payload
+    (the query result or the upload preview) as an Arrow IPC stream, with
+    the rest of the payload as JSON under the "response" schema metadata key.
+A payload that can't be encoded as asked, e.g. a scalar result requested as
+Arrow, falls back to JSON.
+Compression is separate: CompressionMiddleware compresses every response of
+at least COMPRESS_MIN_BYTES with zstd (needs the zstandard package) or gzip,
+as Accept-Encoding allows. Each body chunk is compressed and flushed as it
+is sent, so streamed downloads are never buffered whole, and responses below
+the threshold go out untouched.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse, Response
+
+from app.utils.metrics import RESPONSE_COMPRESSION_BYTES, RESPONSE_ENCODE_SECONDS
+
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+ZSTD_LEVEL = int(os.getenv('ZSTD_LEVEL', '3'))
+# Chunks larger than this are compressed off the event loop
+COMPRESS_THREAD_MIN_BYTES = 256 * 1024
+
+MSGPACK = 'application/msgpack'
+MSGPACK_ALIASES = (MSGPACK, 'application/x-msgpack', 'application/vnd.msgpack')
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+JSON_TYPES = ('application/json', 'application/*', '*/*')
+# Already compressed: not worth compressing again
+INCOMPRESSIBLE_TYPES = ('image/', 'application/vnd.apache.parquet', 'application/zip', 'application/gzip',
+                        'application/zstd')
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def parse_accept(header: Optional[str]) -> List[Tuple[str, float]]:
+    """(value, q) pairs of an Accept / Accept-Encoding header, most preferred first"""
+    items = []
+    for position, part in enumerate((header or '').split(',')):
+        value, *params = [piece.strip() for piece in part.split(';')]
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        items.append((value.lower(), q, position))
+    items.sort(key=lambda item: (-item[1], item[2]))
+    return [(value, q) for value, q, _ in items]
+
+
+def _result_records(value) -> Optional[List[Dict[str, Any]]]:
+    """Rows of a serialized table: polars-style records, or a pandas-style {column: {index: value}} dict"""
+    if isinstance(value, list):
+        return value if value and all(isinstance(row, dict) for row in value) else None
+    if not isinstance(value, dict) or not value:
+        return None
+    columns = list(value.values())
+    if not all(isinstance(column, dict) for column in columns):
+        return None
+    index = list(columns[0])
+    if any(list(column) != index for column in columns[1:]):
+        return None
+    names = [str(name) for name in value]
+    records = [dict(zip(names, (column[key] for column in columns))) for key in index]
+    if index != list(range(len(index))):
+        # groupby / value_counts results: the index is part of the answer
+        records = [{'index': key, **record} for key, record in zip(index, records)]
+    return records
+
+
+def encode_arrow(payload: dict, table_key: str) -> Optional[bytes]:
+    """Arrow IPC stream of payload[table_key], the rest of the payload in the schema metadata"""
+    import pyarrow as pa
+
+    records = _result_records(payload.get(table_key))
+    if records is None:
+        return None
+    try:
+        table = pa.Table.from_pylist(records)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):  # mixed types within a column
+        return None
+    rest = {key: value for key, value in payload.items() if key != table_key}
+    table = table.replace_schema_metadata({'response': json.dumps(rest, default=str), 'table': table_key})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _string_keys(value):
+    """Map keys as strings, as in JSON: msgpack clients reject integer keys by default"""
+    if isinstance(value, dict):
+        return {key if isinstance(key, str) else str(key): _string_keys(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_string_keys(item) for item in value]
+    return value
+
+
+def encode_msgpack(payload: dict) -> bytes:
+    image = payload.get('image')
+    payload = _string_keys(payload)
+    if isinstance(image, str):
+        payload['image'] = base64.b64decode(image)
+    return msgpack.packb(payload, use_bin_type=True, default=str)
+
+
+def negotiated_response(request, payload: dict, table_key: str = 'result', status_code: int = 200) -> Response:
+    """payload encoded in the format the request's Accept header prefers, JSON by default"""
+    for media_type, q in parse_accept(request.headers.get('accept')):
+        if q <= 0:
+            continue
+        if media_type in JSON_TYPES:
+            break
+        start = time.perf_counter()
+        if media_type in MSGPACK_ALIASES and msgpack is not None:
+            body, fmt = encode_msgpack(payload), 'msgpack'
+            media_type = MSGPACK
+        elif media_type == ARROW_STREAM:
+            body, fmt = encode_arrow(payload, table_key), 'arrow'
+            if body is None:
+                continue
+        else:
+            continue
+        RESPONSE_ENCODE_SECONDS.observe(time.perf_counter() - start, format=fmt)
+        return Response(body, status_code=status_code, media_type=media_type, headers={'Vary': 'Accept'})
+    start = time.perf_counter()
+    response = JSONResponse(payload, status_code=status_code, headers={'Vary': 'Accept'})
+    RESPONSE_ENCODE_SECONDS.observe(time.perf_counter() - start, format='json')
+    return response
+
+
+def choose_encoding(header: Optional[str]) -> Optional[str]:
+    """'zstd', 'gzip' or None (identity) for an Accept-Encoding header"""
+    for encoding, q in parse_accept(header):
+        if q <= 0:
+            continue
+        if encoding == 'zstd' and zstandard is not None:
+            return 'zstd'
+        if encoding in ('gzip', 'x-gzip'):
+            return 'gzip'
+        if encoding == '*':
+            return 'zstd' if zstandard is not None else 'gzip'
+    return None
+
+
+class _Compressor:
+    """Streaming compressor: every compress() call returns bytes the client can decode right away"""
+
+    def __init__(self, encoding: str):
+        if encoding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._sync = lambda: self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        else:
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._sync = lambda: self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        out = self._obj.compress(data)
+        return out + (self._obj.flush() if final else self._sync())
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware compressing response bodies chunk by chunk, per Accept-Encoding"""
+
+    def __init__(self, app, min_bytes: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope["headers"]}
+        encoding = choose_encoding(headers.get('accept-encoding'))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False, "bytes_in": 0, "bytes_out": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response_headers = {key.decode('latin-1').lower(): value.decode('latin-1')
+                                    for key, value in message.get("headers", [])}
+                content_type = response_headers.get('content-type', '')
+                state["passthrough"] = 'content-encoding' in response_headers \
+                    or content_type.startswith(INCOMPRESSIBLE_TYPES) or content_type.startswith('text/event-stream')
+                if state["passthrough"]:
+                    await send(message)
+                else:
+                    state["start"] = message  # held until the first body chunk shows the size
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if state["start"] is not None:
+                start, state["start"] = state["start"], None
+                if not more_body and len(body) < self.min_bytes:
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+                state["compressor"] = _Compressor(encoding)
+                headers_out = [(key, value) for key, value in start.get("headers", [])
+                               if key.lower() != b'content-length']
+                vary = [value for key, value in headers_out if key.lower() == b'vary']
+                headers_out = [(key, value) for key, value in headers_out if key.lower() != b'vary']
+                headers_out.append((b'vary', b', '.join(vary + [b'Accept-Encoding'])))
+                headers_out.append((b'content-encoding', encoding.encode()))
+                await send({**start, "headers": headers_out})
+
+            if len(body) >= COMPRESS_THREAD_MIN_BYTES:
+                compressed = await asyncio.to_thread(state["compressor"].compress, body, not more_body)
+            else:
+                compressed = state["compressor"].compress(body, not more_body)
+            state["bytes_in"] += len(body)
+            state["bytes_out"] += len(compressed)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+        if state["compressor"] is not None:
+            RESPONSE_COMPRESSION_BYTES.inc(state["bytes_in"], encoding=encoding, stage="before")
+            RESPONSE_COMPRESSION_BYTES.inc(state["bytes_out"], encoding=encoding, stage="after")
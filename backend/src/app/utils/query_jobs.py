@@ -0,0 +1,98 @@
+"""
+Background query jobs.
+A query asked with preview=True answers from the validation sample right
+away and finishes on the full dataset in the background; the full answer is
+kept here until fetched from /api/query/jobs/{job_id}. Jobs are stored in
+SQLite (QUERY_JOBS_DB), so any worker can answer the poll whichever one ran
+the job, and expire after QUERY_JOB_TTL_SECONDS.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+QUERY_JOBS_DB = os.getenv('QUERY_JOBS_DB', 'backend/data/query_jobs.db')
+QUERY_JOB_TTL_SECONDS = int(os.getenv('QUERY_JOB_TTL_SECONDS', '900'))
+MAX_QUERY_JOBS = 200
+
+
+class QueryJobStore:
+    """Bounded, expiring SQLite table of background query jobs, shared by all workers"""
+
+    def __init__(self, path: str = QUERY_JOBS_DB, maxlen: int = MAX_QUERY_JOBS,
+                 ttl_seconds: int = QUERY_JOB_TTL_SECONDS):
+        self.path = path
+        self.maxlen = maxlen
+        self.ttl_seconds = ttl_seconds
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY, status TEXT, question TEXT, session_id TEXT, created_at REAL,
+                    finished_at REAL, error TEXT, result TEXT)''')
+                conn.commit()
+                self._initialized = True
+        return conn
+
+    def _expire(self, conn: sqlite3.Connection, now: float):
+        conn.execute('DELETE FROM jobs WHERE created_at <= ?', (now - self.ttl_seconds,))
+        conn.execute('DELETE FROM jobs WHERE job_id NOT IN '
+                     '(SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?)', (self.maxlen,))
+
+    def create(self, question: str, session_id: str) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('INSERT INTO jobs (job_id, status, question, session_id, created_at) VALUES (?, ?, ?, ?, ?)',
+                         (job_id, 'running', question, session_id, now))
+            self._expire(conn, now)
+            conn.commit()
+        finally:
+            conn.close()
+        return job_id
+
+    def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        conn = self._connect()
+        try:
+            # No row when the job expired while running
+            conn.execute('UPDATE jobs SET status=?, finished_at=?, error=?, result=? WHERE job_id=?',
+                         ('failed' if error else 'done', time.time(), error,
+                          None if error else json.dumps(result, default=str), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE job_id=? AND created_at > ?',
+                               (job_id, now - self.ttl_seconds)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = {key: row[key] for key in ('job_id', 'status', 'question', 'session_id', 'created_at')}
+        if row['finished_at'] is not None:
+            job["finished_at"] = row['finished_at']
+            job["duration_ms"] = round((row['finished_at'] - row['created_at']) * 1000, 1)
+            if row['error'] is not None:
+                job["error"] = row['error']
+            else:
+                job["result"] = json.loads(row['result'])
+        return job
+
+
+query_jobs = QueryJobStore()
@@ -0,0 +1,280 @@
+"""
+Paraphrase-tolerant cache of generated code.
+"avg hours per week by workclass" and "what's the mean hours-per-week for
+each work class" need the same program. Every successfully answered
+question is kept with its code, per dataset schema (column names and
+dtypes). A question is reduced to what it asks for: the columns and
+category values it mentions are recognised against the dataset profile and
+replaced by placeholders, synonyms are folded ("avg", "average" -> "mean")
+and filler words dropped. What remains is embedded as a vector of hashed
+character n-grams, so a new question is compared with past ones by cosine
+similarity, without any model or network.
+Code is only reused for a past question that mentions exactly the same
+columns, category values, numbers, quoted strings and operations (mean,
+max, greater, not...), and whose similarity is at least
+QUESTION_CACHE_THRESHOLD; the caller still runs it on the validation sample
+before trusting it.
+The index is backed by the persistent code library: a schema's programs
+are loaded from it on first use (and again every LIBRARY_REFRESH_SECONDS,
+to pick up other workers' programs) and every answered question is saved
+to it.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.code_library import CodeLibrary, code_library
+from app.utils.fast_path import _compact, normalize_question
+
+QUESTION_CACHE = os.getenv('QUESTION_CACHE', '1') != '0'
+QUESTION_CACHE_THRESHOLD = float(os.getenv('QUESTION_CACHE_THRESHOLD', '0.85'))
+# Questions kept per schema, least recently used dropped first
+QUESTION_CACHE_SIZE = int(os.getenv('QUESTION_CACHE_SIZE', '200'))
+MAX_SCHEMAS = 16
+LIBRARY_REFRESH_SECONDS = 60
+VECTOR_DIM = 4096
+NGRAM_SIZES = (3, 4, 5)
+# Longest column name / category value, in words, recognised in a question ("hours per week")
+MAX_MENTION_WORDS = 4
+
+SYNONYMS = {
+    'avg': 'mean', 'average': 'mean', 'averages': 'mean', 'means': 'mean',
+    'per': 'by', 'each': 'by', 'every': 'by', 'across': 'by', 'grouped': 'by', 'group': 'by',
+    'highest': 'max', 'most': 'max', 'maximum': 'max', 'largest': 'max', 'biggest': 'max', 'greatest': 'max',
+    'top': 'max',
+    'lowest': 'min', 'minimum': 'min', 'smallest': 'min', 'least': 'min',
+    'total': 'sum', 'number': 'count', 'many': 'count', 'counts': 'count',
+    'percent': 'percentage', 'share': 'percentage', 'proportion': 'percentage', 'fraction': 'percentage',
+    'ratio': 'percentage', 'rate': 'percentage',
+    'chart': 'plot', 'graph': 'plot', 'visualize': 'plot', 'visualise': 'plot', 'draw': 'plot',
+    'rows': 'records', 'entries': 'records', 'people': 'records', 'individuals': 'records',
+    'persons': 'records',
+    'more': 'greater', 'above': 'greater', 'over': 'greater', 'exceeding': 'greater', '>': 'greater',
+    'fewer': 'less', 'below': 'less', 'under': 'less', '<': 'less',
+    'without': 'not', 'excluding': 'not', 'except': 'not', 'no': 'not', 'non': 'not',
+    'distinct': 'unique', 'missing': 'null', 'nulls': 'null', 'nan': 'null',
+    'deviation': 'std', 'correlated': 'correlation', 'correlate': 'correlation',
+}
+# Words that change the answer: two questions must use the same ones to share code
+OPERATION_WORDS = {
+    'mean', 'median', 'mode', 'max', 'min', 'sum', 'count', 'percentage', 'std', 'variance', 'correlation',
+    'plot', 'histogram', 'greater', 'less', 'between', 'equal', 'not', 'and', 'or', 'unique', 'null',
+    'first', 'last', 'ascending', 'descending', 'sorted', 'trend', 'growth', 'difference',
+}
+STOPWORDS = {
+    'a', 'an', 'the', 'of', 'for', 'in', 'on', 'to', 'is', 'are', 'was', 'were', 'be', 'do', 'does', 'did',
+    'what', 'whats', 'which', 'who', 'how', 'there', 'me', 'us', 'i', 'we', 'you', 'it', 'its', 'this', 'that',
+    'show', 'give', 'tell', 'list', 'get', 'find', 'compute', 'calculate', 'please', 'can', 'could', 'would',
+    'value', 'values', 'column', 'field', 'data', 'dataset', 'table',
+}
+
+_QUOTED = re.compile(r"(?<!\w)['\"`]([^'\"`]+)['\"`](?!\w)")
+_NUMBER = re.compile(r"^\d+(\.\d+)?$")
+
+
+def _value_key(text: str) -> str:
+    """Category values keep their symbols: '>50K' and '<=50K' are different answers"""
+    return re.sub(r"[\s_\-]", "", str(text).lower())
+
+
+def _mention_names(profile: dict, columns) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """(compact column name -> column, value key -> 'column=value') for the dataset"""
+    values = {}
+    for col, counts in (profile or {}).get('top_values', {}).items():
+        for value in counts:
+            key = _value_key(value)
+            if key:
+                values.setdefault(key, f"{col}={value}")
+    columns = {_compact(col): str(col) for col in columns if _compact(col)}
+    return columns, values
+
+
+def _lookup_column(compact: str, columns: Dict[str, str]) -> Optional[str]:
+    if compact in columns:
+        return columns[compact]
+    # Plurals: "workclasses", "occupations"
+    for stem in (compact[:-2] if compact.endswith('es') else None, compact[:-1] if compact.endswith('s') else None):
+        if stem and stem in columns:
+            return columns[stem]
+    return None
+
+
+def analyze(question: str, columns, profile: dict) -> Dict[str, Any]:
+    """Canonical text, literal signature and unit vector of a question"""
+    quoted = sorted(match.strip().lower() for match in _QUOTED.findall(question))
+    words = normalize_question(question).split()
+    column_names, value_names = _mention_names(profile, columns)
+    mentioned_columns, mentioned_values, numbers, operations, canonical = set(), set(), [], set(), []
+    i = 0
+    while i < len(words):
+        for n in range(min(MAX_MENTION_WORDS, len(words) - i), 0, -1):
+            window = words[i:i + n]
+            column = _lookup_column(''.join(_compact(word) for word in window), column_names)
+            value = None if column else value_names.get(''.join(_value_key(word) for word in window))
+            if column or value:
+                (mentioned_columns if column else mentioned_values).add(column or value)
+                canonical.append('@col' if column else '@val')
+                i += n
+                break
+        else:
+            word = re.sub(r"[^a-z0-9.<>=%]", "", words[i])
+            i += 1
+            if _NUMBER.match(word):
+                numbers.append(word)
+                canonical.append('@num')
+            elif word and word not in STOPWORDS:
+                word = SYNONYMS.get(word, word)
+                if word in OPERATION_WORDS:
+                    operations.add(word)
+                canonical.append(word)
+    text = ' '.join(canonical)
+    signature = (frozenset(mentioned_columns), frozenset(mentioned_values), tuple(numbers), tuple(quoted),
+                 frozenset(operations))
+    return {"text": text, "signature": signature, "vector": embed(text)}
+
+
+def embed(text: str) -> np.ndarray:
+    """L2-normalised vector of hashed character n-grams of the words, plus each whole word"""
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    for word in text.split():
+        features = ['w:' + word]
+        if not word.startswith('@'):  # placeholders only count as words
+            padded = f" {word} "
+            features += [padded[i:i + n] for n in NGRAM_SIZES for i in range(len(padded) - n + 1)]
+        for feature in features:
+            vector[zlib.crc32(feature.encode()) % VECTOR_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _encode_signature(signature: tuple) -> str:
+    columns, values, numbers, quoted, operations = signature
+    return json.dumps([sorted(columns), sorted(values), list(numbers), list(quoted), sorted(operations)])
+
+
+def _decode_signature(text: str) -> tuple:
+    columns, values, numbers, quoted, operations = json.loads(text)
+    return frozenset(columns), frozenset(values), tuple(numbers), tuple(quoted), frozenset(operations)
+
+
+class QuestionCache:
+    """In-memory index of answered questions and their code, per dataset schema, backed by a code library"""
+
+    def __init__(self, threshold: float = QUESTION_CACHE_THRESHOLD, size: int = QUESTION_CACHE_SIZE,
+                 enabled: bool = QUESTION_CACHE, library: Optional[CodeLibrary] = None):
+        self.threshold = threshold
+        self.size = size
+        self.enabled = enabled
+        self.library = library
+        self._schemas: "OrderedDict[str, OrderedDict[tuple, Dict[str, Any]]]" = OrderedDict()
+        self._loaded_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _library_call(self, method: str, *args):
+        if self.library is None:
+            return None
+        try:
+            return getattr(self.library, method)(*args)
+        except sqlite3.Error as e:
+            print(f"⚠️ Code library unavailable: {e}")
+            return None
+
+    def _entries(self, schema: str) -> "OrderedDict[tuple, Dict[str, Any]]":
+        """The schema's entries, (re)loading the library's most used programs when stale"""
+        with self._lock:
+            entries = self._schemas.setdefault(schema, OrderedDict())
+            self._schemas.move_to_end(schema)
+            while len(self._schemas) > MAX_SCHEMAS:
+                evicted, _ = self._schemas.popitem(last=False)
+                self._loaded_at.pop(evicted, None)
+            stale = time.time() - self._loaded_at.get(schema, 0) > LIBRARY_REFRESH_SECONDS
+            if stale:
+                self._loaded_at[schema] = time.time()
+        if stale:
+            for row in self._library_call('top', schema, self.size) or []:
+                entry = {"question": row["question"], "code": row["code"], "text": row["intent"],
+                         "signature": _decode_signature(row["signature"]), "vector": embed(row["intent"])}
+                entry["key"] = (entry["text"], entry["signature"])
+                with self._lock:
+                    if entry["key"] not in entries and len(entries) < self.size:
+                        entries[entry["key"]] = entry
+                        entries.move_to_end(entry["key"], last=False)  # behind recently used ones
+        return entries
+
+    def lookup(self, question: str, schema: str, columns, profile: dict) -> Optional[Dict[str, Any]]:
+        """{code, question, similarity, key} of the closest past question, None below the threshold"""
+        if not self.enabled:
+            return None
+        query = analyze(question, columns, profile)
+        entries = self._entries(schema)
+        with self._lock:
+            candidates = [entry for entry in entries.values() if entry["signature"] == query["signature"]]
+        if not candidates:
+            return None
+        similarities = np.stack([entry["vector"] for entry in candidates]) @ query["vector"]
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        entry = candidates[best]
+        with self._lock:
+            if entry["key"] in entries:
+                entries.move_to_end(entry["key"])
+        return {"code": entry["code"], "question": entry["question"], "similarity": float(similarities[best]),
+                "key": entry["key"]}
+
+    def add(self, question: str, code: str, schema: str, columns, profile: dict) -> Optional[tuple]:
+        """Remember the code that answered question on datasets with this schema; returns its key"""
+        if not self.enabled:
+            return None
+        entry = {"question": question, "code": code, **analyze(question, columns, profile)}
+        entry["key"] = (entry["text"], entry["signature"])
+        entries = self._entries(schema)
+        with self._lock:
+            entries[entry["key"]] = entry
+            entries.move_to_end(entry["key"])
+            while len(entries) > self.size:
+                entries.popitem(last=False)
+        self._library_call('save', schema, entry["text"], _encode_signature(entry["signature"]), question, code)
+        return entry["key"]
+
+    def record_use(self, schema: str, key: tuple):
+        """Count a reuse of the program stored under key"""
+        text, signature = key
+        self._library_call('record_use', schema, text, _encode_signature(signature))
+
+    def top(self, schema: str, limit: int) -> List[Dict[str, Any]]:
+        """The schema's most used programs in the library, as {question, code, key}"""
+        return [{"question": row["question"], "code": row["code"],
+                 "key": (row["intent"], _decode_signature(row["signature"]))}
+                for row in self._library_call('top', schema, limit) or []]
+
+    def save_answer(self, dataset_version: int, key: tuple, answer: Dict[str, Any]):
+        """Keep the answer of the program stored under key on a dataset version, for every worker"""
+        text, signature = key
+        self._library_call('save_answer', dataset_version, text, _encode_signature(signature), answer)
+
+    def answer(self, dataset_version: int, key: tuple) -> Optional[Dict[str, Any]]:
+        """The answer saved for the program under key on a dataset version, or None"""
+        text, signature = key
+        return self._library_call('answer', dataset_version, text, _encode_signature(signature))
+
+    def drop_answers(self, keep_version: int):
+        self._library_call('drop_answers', keep_version)
+
+    def clear(self):
+        """Forget the in-memory index (the library keeps its programs)"""
+        with self._lock:
+            self._schemas.clear()
+            self._loaded_at.clear()
+
+
+question_cache = QuestionCache(library=code_library)
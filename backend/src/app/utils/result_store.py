@@ -0,0 +1,254 @@
+"""
+Server-side query results.
+A result with more than RESULT_HANDLE_MIN_ROWS rows is not serialized into
+the query response. It is written once as an Arrow IPC file under a random
+handle, and the response carries the first page plus the handle; further
+pages (optionally sorted), and the full result as Arrow, Parquet or CSV,
+are served from the file by /api/results/{handle}. Files are shared by all
+workers, expire after RESULT_TTL_SECONDS and count towards
+RESULT_STORE_MAX_MB, least recently used first.
+"""
+
+import datetime
+import decimal
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.utils.ingest_cache import evict_lru, touch_entry
+
+RESULT_STORE_DIR = os.getenv('RESULT_STORE_DIR', 'backend/data/results')
+RESULT_HANDLE_MIN_ROWS = int(os.getenv('RESULT_HANDLE_MIN_ROWS', '1000'))
+RESULT_PAGE_ROWS = int(os.getenv('RESULT_PAGE_ROWS', '100'))
+RESULT_MAX_PAGE_ROWS = 5000
+RESULT_TTL_SECONDS = int(os.getenv('RESULT_TTL_SECONDS', '3600'))
+RESULT_STORE_MAX_MB = float(os.getenv('RESULT_STORE_MAX_MB', '1024'))
+# Sort orders kept per worker, so paging through a sorted result sorts once
+SORT_CACHE_SIZE = 8
+DOWNLOAD_FORMATS = {
+    'arrow': 'application/vnd.apache.arrow.file',
+    'parquet': 'application/vnd.apache.parquet',
+    'csv': 'text/csv',
+}
+
+_HANDLE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def is_tabular(value) -> bool:
+    """pandas/polars DataFrame or Series"""
+    return hasattr(value, 'columns') or (hasattr(value, 'dtype') and hasattr(value, 'to_frame'))
+
+
+def _to_arrow(value):
+    import pyarrow as pa
+
+    if hasattr(value, 'to_arrow') and hasattr(value, 'columns'):  # polars DataFrame
+        return value.to_arrow()
+    if hasattr(value, 'to_arrow'):  # polars Series
+        return value.to_frame().to_arrow()
+    import pandas as pd
+
+    df = value.to_frame() if isinstance(value, pd.Series) else value
+    if not isinstance(df.index, pd.RangeIndex):
+        # groupby / value_counts results: the index is part of the answer
+        df = df.reset_index()
+    df = df.set_axis([str(col) for col in df.columns], axis=1)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        mixed = [col for col in df.columns if df[col].dtype == object]
+        df[mixed] = df[mixed].astype(str).where(df[mixed].notna(), None)
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _json_value(value):
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (datetime.timedelta, decimal.Decimal, bytes)):
+        return str(value)
+    return value
+
+
+def json_rows(table) -> List[Dict[str, Any]]:
+    """Rows of an Arrow table as JSON-safe records"""
+    return [{key: _json_value(value) for key, value in row.items()} for row in table.to_pylist()]
+
+
+class ResultStore:
+    """Arrow files of large query results, addressed by handle"""
+
+    def __init__(self, directory: str = RESULT_STORE_DIR, ttl_seconds: int = RESULT_TTL_SECONDS,
+                 max_mb: float = RESULT_STORE_MAX_MB):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_mb * 1024 * 1024
+        self._sorted: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, handle: str, name: str) -> str:
+        return os.path.join(self.directory, handle, name)
+
+    def put(self, value, question: Optional[str] = None) -> Dict[str, Any]:
+        """Store a tabular result; returns its summary (handle, shape, expiry)"""
+        import pyarrow as pa
+
+        table = _to_arrow(value)
+        handle = uuid.uuid4().hex
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.directory, prefix='.')
+        now = time.time()
+        summary = {
+            "handle": handle,
+            "rows": table.num_rows,
+            "columns": table.column_names,
+            "dtypes": {field.name: str(field.type) for field in table.schema},
+            "created_at": now,
+            "expires_at": now + self.ttl_seconds,
+        }
+        try:
+            with pa.OSFile(os.path.join(tmp_dir, 'data.arrow'), 'wb') as sink, \
+                    pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+                json.dump({**summary, "question": question}, f)
+            os.rename(tmp_dir, os.path.join(self.directory, handle))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.cleanup(keep=[os.path.join(self.directory, handle)])
+        return summary
+
+    def meta(self, handle: str) -> Optional[Dict[str, Any]]:
+        """Summary of a live result, None if unknown or expired"""
+        if not _HANDLE.match(handle or ''):
+            return None
+        try:
+            with open(self._path(handle, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() > meta['expires_at']:
+            shutil.rmtree(os.path.join(self.directory, handle), ignore_errors=True)
+            return None
+        touch_entry(os.path.join(self.directory, handle))
+        return meta
+
+    def table(self, handle: str):
+        """Memory-mapped Arrow table of a result (call meta() first)"""
+        import pyarrow as pa
+        return pa.ipc.open_file(pa.memory_map(self._path(handle, 'data.arrow'), 'r')).read_all()
+
+    def arrow_path(self, handle: str) -> str:
+        return self._path(handle, 'data.arrow')
+
+    def _sort_indices(self, handle: str, table, sort_by: str, descending: bool):
+        import pyarrow.compute as pc
+
+        key = (handle, sort_by, descending)
+        with self._lock:
+            if key in self._sorted:
+                self._sorted.move_to_end(key)
+                return self._sorted[key]
+        # Nulls sort last either way
+        indices = pc.sort_indices(table, sort_keys=[(sort_by, 'descending' if descending else 'ascending')])
+        with self._lock:
+            self._sorted[key] = indices
+            while len(self._sorted) > SORT_CACHE_SIZE:
+                self._sorted.popitem(last=False)
+        return indices
+
+    def page(self, handle: str, offset: int = 0, limit: int = RESULT_PAGE_ROWS,
+             sort_by: Optional[str] = None, descending: bool = False):
+        """Rows offset..offset+limit of a result as an Arrow table, optionally sorted by a column"""
+        table = self.table(handle)
+        limit = max(0, min(limit, RESULT_MAX_PAGE_ROWS))
+        offset = max(0, offset)
+        if sort_by is None:
+            return table.slice(offset, limit)
+        if sort_by not in table.column_names:
+            raise KeyError(sort_by)
+        indices = self._sort_indices(handle, table, sort_by, descending)
+        return table.take(indices.slice(offset, limit))
+
+    def stream(self, handle: str, fmt: str, batch_rows: int = 64 * 1024) -> Iterator[bytes]:
+        """The full result encoded as fmt ('parquet' or 'csv'), yielded batch by batch"""
+        table = self.table(handle)
+        sink = _ChunkSink()
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(sink, table.schema)  # one row group per batch
+        elif fmt == 'csv':
+            import pyarrow.csv as pacsv
+            writer = pacsv.CSVWriter(sink, table.schema)
+        else:
+            raise ValueError(f"Unsupported format '{fmt}'")
+        for batch in table.to_batches(max_chunksize=batch_rows):
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+        writer.close()
+        data = sink.drain()
+        if data:
+            yield data
+
+    def cleanup(self, keep=()):
+        """Drop expired results, then the least recently used ones over the size limit"""
+        now = time.time()
+        try:
+            handles = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for handle in handles:
+            if not _HANDLE.match(handle):
+                continue
+            try:
+                expired = now - os.stat(self._path(handle, 'meta.json')).st_mtime > self.ttl_seconds
+            except OSError:
+                continue
+            if expired:
+                shutil.rmtree(os.path.join(self.directory, handle), ignore_errors=True)
+        evict_lru([self.directory], self.max_bytes, keep=keep)
+
+
+class _ChunkSink:
+    """Write-only file object that hands back what was written since the last drain()"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+result_store = ResultStore()
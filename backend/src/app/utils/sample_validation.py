@@ -0,0 +1,101 @@
+"""
+Sample-first validation of generated code.
+Before a generated program scans a large dataset it is run on a small,
+representative sample: a few rows for every value of each low-cardinality
+column (so filters on a category never come back empty), a few rows with
+nulls in each column, and a seeded random fill. Errors that would happen on
+any data (bad column names, wrong methods, type errors) surface there in
+milliseconds and go straight back to the LLM; errors that may only be an
+artefact of the sample (an empty selection, division by zero) do not block
+the full run. Samples are cached per dataset version.
+"""
+
+import os
+import threading
+from typing import Any, Optional
+
+SAMPLE_ROWS = int(os.getenv('SAMPLE_ROWS', '2000'))
+# Smaller datasets run directly: the sample would cost about as much as the real thing
+SAMPLE_VALIDATION_MIN_ROWS = int(os.getenv('SAMPLE_VALIDATION_MIN_ROWS', '50000'))
+# Rows kept per category value / per column with nulls
+ROWS_PER_STRATUM = 3
+MAX_STRATIFY_COLUMNS = 20
+SAMPLE_SEED = 0
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Exceptions that mean the code is wrong, whatever rows it runs on
+SCHEMA_ERRORS = (KeyError, AttributeError, NameError, TypeError, SyntaxError, ImportError)
+_POLARS_SCHEMA_ERRORS = ('ColumnNotFoundError', 'SchemaError', 'SchemaFieldNotFoundError', 'InvalidOperationError')
+
+
+def needs_validation(df) -> bool:
+    return len(df) > SAMPLE_VALIDATION_MIN_ROWS
+
+
+def is_schema_error(error: BaseException) -> bool:
+    """True if error would also happen on the full dataset"""
+    if isinstance(error, SCHEMA_ERRORS):
+        return True
+    return type(error).__name__ in _POLARS_SCHEMA_ERRORS
+
+
+def _stratify_columns(profile: dict):
+    top_values = (profile or {}).get('top_values', {})
+    # Fewest categories first: cheapest to cover and most likely to be filtered on
+    return sorted(top_values, key=lambda col: len(top_values[col]))[:MAX_STRATIFY_COLUMNS]
+
+
+def _pandas_sample(df, profile: dict):
+    import numpy as np
+
+    positions = set()
+    for col in _stratify_columns(profile):
+        if col in df.columns:
+            values = df[col].reset_index(drop=True)
+            # Index is positional after the reset
+            positions.update(values.groupby(values, observed=True, sort=False).head(ROWS_PER_STRATUM).index.tolist())
+    for col in df.columns:
+        null_positions = np.flatnonzero(df[col].isna().to_numpy())[:ROWS_PER_STRATUM]
+        positions.update(null_positions.tolist())
+
+    remaining = max(SAMPLE_ROWS - len(positions), 0)
+    if remaining:
+        rng = np.random.default_rng(SAMPLE_SEED)
+        positions.update(rng.choice(len(df), size=min(remaining, len(df)), replace=False).tolist())
+    return df.iloc[sorted(positions)]
+
+
+def _polars_sample(df, profile: dict):
+    import numpy as np
+    import polars as pl
+
+    indexed = df.with_row_index('__row')
+    positions = set()
+    for col in _stratify_columns(profile):
+        if col in df.columns:
+            positions.update(indexed.group_by(col).head(ROWS_PER_STRATUM)['__row'].to_list())
+    for col in df.columns:
+        positions.update(indexed.filter(pl.col(col).is_null()).head(ROWS_PER_STRATUM)['__row'].to_list())
+
+    remaining = max(SAMPLE_ROWS - len(positions), 0)
+    if remaining:
+        rng = np.random.default_rng(SAMPLE_SEED)
+        positions.update(rng.choice(df.height, size=min(remaining, df.height), replace=False).tolist())
+    return df[sorted(positions)]
+
+
+def get_sample(df, engine: str, dataset_version: int, profile: Optional[dict] = None) -> Any:
+    """Representative sample of df, built once per dataset version"""
+    key = (dataset_version, engine, len(df))
+    with _cache_lock:
+        sample = _cache.get(key)
+    if sample is not None:
+        return sample
+    sample = _pandas_sample(df, profile) if engine == 'pandas' else _polars_sample(df, profile)
+    with _cache_lock:
+        # Only the active dataset's sample is worth keeping
+        _cache.clear()
+        _cache[key] = sample
+    return sample
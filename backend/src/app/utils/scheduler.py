@@ -0,0 +1,234 @@
+"""
+Fair scheduling of query execution.
+Queries run in a bounded number of slots, in two lanes: the fast lane
+(QUERY_FAST_SLOTS) takes queries answered without generating code - fast
+path, precomputed answers, reused code on datasets small enough to skip
+sample validation - so they never wait behind heavy analyses; everything
+else shares QUERY_SLOTS. In the normal lane a session runs at most
+SESSION_MAX_RUNNING queries at once, and waiting queries are ordered by
+weighted fair queuing across sessions (self-clocked: each query gets a
+virtual finish tag of its session's previous tag, or the current virtual
+time if later, plus cost / weight), so a session firing many heavy queries
+gets its share and no more. Weights default to 1 and are set per session
+with SESSION_WEIGHTS ("alice:2,reports:0.5").
+At most QUERY_MAX_QUEUED queries wait overall, and SESSION_MAX_QUEUED per
+session and lane (a session's heavy backlog doesn't block its cheap
+queries); beyond that the request is rejected with 429 and a Retry-After
+estimated from recent run times.
+Blocking work inside a query runs through to_thread() below, so a query that
+times out or is cancelled keeps its slot until its worker threads return:
+Python can't stop a thread, and freeing the slot early would let more work
+run than there are slots.
+"""
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.utils.metrics import QUERY_QUEUE_WAIT_SECONDS, QUERY_REJECTIONS
+
+QUERY_SLOTS = int(os.getenv('QUERY_SLOTS', '4'))
+QUERY_FAST_SLOTS = int(os.getenv('QUERY_FAST_SLOTS', '2'))
+SESSION_MAX_RUNNING = int(os.getenv('SESSION_MAX_RUNNING', '2'))
+QUERY_MAX_QUEUED = int(os.getenv('QUERY_MAX_QUEUED', '64'))
+SESSION_MAX_QUEUED = int(os.getenv('SESSION_MAX_QUEUED', '8'))
+SESSION_WEIGHTS = os.getenv('SESSION_WEIGHTS', '')
+LANES = ('fast', 'normal')
+# Smoothing of the run time estimate behind Retry-After
+RUN_TIME_ALPHA = 0.2
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """{session: weight} from "session:weight,..." """
+    weights = {}
+    for item in spec.split(','):
+        session, _, weight = item.strip().rpartition(':')
+        if session:
+            try:
+                weights[session] = max(float(weight), 0.01)
+            except ValueError:
+                print(f"⚠️ Ignoring SESSION_WEIGHTS entry '{item}'")
+    return weights
+
+
+class QueueFull(Exception):
+    """No room to queue the query; retry_after is in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Job:
+    __slots__ = ('session', 'lane', 'finish', 'seq', 'future', 'state', 'started', 'threads')
+
+    def __init__(self, session: str, lane: str, finish: float, seq: int, future: asyncio.Future):
+        self.session = session
+        self.lane = lane
+        self.finish = finish
+        self.seq = seq
+        self.future = future
+        self.state = 'queued'
+        self.started = 0.0
+        # Worker threads started by to_thread() that haven't returned yet
+        self.threads = 0
+
+
+class FairScheduler:
+    """Slots, per-session quotas and weighted fair ordering for coroutines run on one event loop"""
+
+    def __init__(self, slots: int = QUERY_SLOTS, fast_slots: int = QUERY_FAST_SLOTS,
+                 session_running: int = SESSION_MAX_RUNNING, max_queued: int = QUERY_MAX_QUEUED,
+                 session_queued: int = SESSION_MAX_QUEUED, weights: Dict[str, float] = None):
+        self.slots = {'fast': max(fast_slots, 1), 'normal': max(slots, 1)}
+        self.session_running = max(session_running, 1)
+        self.max_queued = max_queued
+        self.session_queued = session_queued
+        self.weights = parse_weights(SESSION_WEIGHTS) if weights is None else weights
+        self._queues: Dict[str, Dict[str, deque]] = {lane: {} for lane in LANES}
+        self._running = {lane: 0 for lane in LANES}
+        self._session_running: Dict[str, int] = {}
+        self._last_finish: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self._run_seconds = {lane: 0.0 for lane in LANES}
+
+    def queued(self, lane: str = None, session: str = None) -> int:
+        lanes = [lane] if lane else LANES
+        return sum(len(queue) for name in lanes for key, queue in self._queues[name].items()
+                   if session is None or key == session)
+
+    def _retry_after(self, lane: str) -> int:
+        waiting = self.queued(lane) + self._running[lane]
+        return max(1, math.ceil(self._run_seconds[lane] * waiting / self.slots[lane]))
+
+    def _eligible(self, lane: str, session: str) -> bool:
+        return lane == 'fast' or self._session_running.get(session, 0) < self.session_running
+
+    def _dispatch(self):
+        for lane in LANES:
+            queues = self._queues[lane]
+            while self._running[lane] < self.slots[lane]:
+                heads = [queue[0] for session, queue in queues.items() if self._eligible(lane, session)]
+                if not heads:
+                    break
+                job = min(heads, key=lambda head: (head.finish, head.seq))
+                queue = queues[job.session]
+                queue.popleft()
+                if not queue:
+                    del queues[job.session]
+                self._start(job)
+
+    def _start(self, job: _Job):
+        job.state = 'running'
+        self._running[job.lane] += 1
+        if job.lane == 'normal':
+            self._session_running[job.session] = self._session_running.get(job.session, 0) + 1
+            self._virtual_time = max(self._virtual_time, job.finish)
+        job.future.set_result(None)
+
+    def _release(self, job: _Job, seconds: float = None):
+        job.state = 'done'
+        self._running[job.lane] -= 1
+        if job.lane == 'normal':
+            running = self._session_running.get(job.session, 1) - 1
+            if running:
+                self._session_running[job.session] = running
+            else:
+                self._session_running.pop(job.session, None)
+                # An idle session that is not ahead of the others needs no tag
+                if self._last_finish.get(job.session, 0) <= self._virtual_time \
+                        and job.session not in self._queues['normal']:
+                    self._last_finish.pop(job.session, None)
+        if seconds is not None:
+            previous = self._run_seconds[job.lane]
+            self._run_seconds[job.lane] = seconds if not previous else \
+                previous + RUN_TIME_ALPHA * (seconds - previous)
+        self._dispatch()
+
+    def _thread_done(self, job: _Job, future: asyncio.Future):
+        if not future.cancelled():
+            future.exception()  # retrieved: nobody awaits it once the query was cancelled
+        job.threads -= 1
+        if not job.threads and job.state == 'detached':
+            self._release(job, time.perf_counter() - job.started)
+
+    def _enqueue(self, session: str, lane: str, cost: float) -> _Job:
+        if self.queued() >= self.max_queued:
+            QUERY_REJECTIONS.inc(reason='queue_full')
+            raise QueueFull("Too many queries are waiting; try again shortly", self._retry_after(lane))
+        if self.queued(lane, session) >= self.session_queued:
+            QUERY_REJECTIONS.inc(reason='session_queue_full')
+            raise QueueFull(f"Session '{session}' already has {self.session_queued} queries waiting",
+                            self._retry_after(lane))
+        finish = 0.0
+        if lane == 'normal':
+            start = max(self._virtual_time, self._last_finish.get(session, 0.0))
+            finish = self._last_finish[session] = start + cost / self.weights.get(session, 1.0)
+        job = _Job(session, lane, finish, next(self._seq), asyncio.get_running_loop().create_future())
+        self._queues[lane].setdefault(session, deque()).append(job)
+        self._dispatch()
+        return job
+
+    async def run(self, session: str, make_coroutine: Callable[[], Awaitable[Any]], lane: str = 'normal',
+                  cost: float = 1.0) -> Tuple[Any, float]:
+        """(result, queue wait in ms) of make_coroutine() run in a slot; raises QueueFull when it can't wait"""
+        queued_at = time.perf_counter()
+        job = self._enqueue(session, lane, cost)
+        try:
+            await job.future
+        except asyncio.CancelledError:
+            if job.state == 'queued':
+                queue = self._queues[lane].get(session)
+                queue.remove(job)
+                if not queue:
+                    del self._queues[lane][session]
+            else:
+                self._release(job)
+            raise
+        job.started = time.perf_counter()
+        wait = job.started - queued_at
+        QUERY_QUEUE_WAIT_SECONDS.observe(wait, lane=lane)
+        token = _current_slot.set((self, job))
+        try:
+            return await make_coroutine(), round(wait * 1000, 3)
+        finally:
+            _current_slot.reset(token)
+            if job.threads:
+                # Timed out or cancelled while a thread still runs: it keeps the slot until it returns
+                job.state = 'detached'
+            else:
+                self._release(job, time.perf_counter() - job.started)
+
+    def status(self) -> dict:
+        return {lane: {"running": self._running[lane], "slots": self.slots[lane], "queued": self.queued(lane),
+                       "sessions_waiting": len(self._queues[lane])} for lane in LANES}
+
+
+# The scheduler and job whose slot the current coroutine runs in
+_current_slot: contextvars.ContextVar[Optional[Tuple[FairScheduler, _Job]]] = \
+    contextvars.ContextVar('query_slot', default=None)
+
+
+async def to_thread(func: Callable, *args, **kwargs) -> Any:
+    """asyncio.to_thread that holds the calling query's slot until func returns, even past a timeout"""
+    slot = _current_slot.get()
+    if slot is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    scheduler, job = slot
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    future = loop.run_in_executor(None, call)
+    job.threads += 1
+    future.add_done_callback(functools.partial(scheduler._thread_done, job))
+    # Shielded: cancelling the query must not mark the thread done while it still runs
+    return await asyncio.shield(future)
+
+
+query_scheduler = FairScheduler()
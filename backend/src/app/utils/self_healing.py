@@ -8,14 +8,15 @@ import os
 import traceback
 import ast
 import inspect
-import google.generativeai as genai
 from dotenv import load_dotenv
 from typing import Any, Dict, Optional
 import logging
+from app.utils.metrics import LLM_REQUEST_SECONDS, RETRIES
+from app.utils.tracing import span, traced
+from app.utils.llm_client import generate
 
 load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-2.5-flash')
+MODEL_NAME = 'gemini-2.5-flash'
 
 # Configure logging for self-healing
 log_dir = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'logs')
@@ -36,6 +37,7 @@ class SelfHealingAgent:
         self.fix_history = []
         self.success_rate = {}
         
+    @traced('self_healing.auto_fix')
     def auto_fix_function(self, func_name: str, error: Exception, 
                          original_code: str, context: Dict[str, Any]) -> Optional[str]:
         """
@@ -74,6 +76,7 @@ class SelfHealingAgent:
                     
             except Exception as fix_error:
                 logging.warning(f"⚠️ Fix attempt {attempt + 1} failed: {fix_error}")
+                RETRIES.inc(stage='self_healing')
                 continue
                 
         logging.error(f"❌ Could not auto-fix {func_name} after {self.max_fix_attempts} attempts")
@@ -119,8 +122,8 @@ RETURN: Complete corrected function code only.
     def _get_ai_fix(self, prompt: str) -> str:
         """Get fix from AI"""
         try:
-            response = model.generate_content(prompt)
-            code = response.text.strip()
+            with span('llm.call', caller='self_healing'), LLM_REQUEST_SECONDS.time(caller='self_healing'):
+                code = generate(prompt, MODEL_NAME).strip()
             
             # Clean up AI response
             if "```python" in code:
@@ -0,0 +1,36 @@
+"""
+Isolated views of the active dataset for generated code.
+The stored dataframe is shared by every query (and, through the shared store,
+backed by read-only Arrow memory). Generated code gets its own view instead:
+a shallow pandas copy under copy-on-write, or a polars clone, both of which
+share the column buffers and only copy a column when the query writes to it.
+Column assignment, inplace drops and sorts, or setting a cell therefore stay
+local to the query at near-zero cost, where a deep copy per query would
+duplicate the whole dataset.
+"""
+
+_cow_enabled = False
+
+
+def enable_copy_on_write():
+    """Turn on pandas copy-on-write (always on from pandas 3)"""
+    global _cow_enabled
+    if _cow_enabled:
+        return
+    import pandas as pd
+
+    if int(pd.__version__.split('.')[0]) < 3:
+        pd.set_option('mode.copy_on_write', True)
+    _cow_enabled = True
+
+
+def isolated_view(df):
+    """View of df that generated code may modify without touching df"""
+    if df is None:
+        return None
+    if hasattr(df, 'clone'):  # polars: columns are reference counted and copied on write
+        return df.clone()
+    if hasattr(df, 'copy'):
+        enable_copy_on_write()
+        return df.copy(deep=False)
+    return df
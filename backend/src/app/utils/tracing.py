@@ -0,0 +1,270 @@
+"""
+Lightweight in-process request tracing.
+Each HTTP request gets a trace id and a tree of timed spans (router, LLM
+call, exec, serialization, persistence...). Finished traces are kept in a
+bounded ring buffer and can be exported as JSON for a waterfall or flame
+view, or in Chrome trace-event format for Perfetto / chrome://tracing.
+No external collector is needed.
+"""
+
+import os
+import re
+import time
+import uuid
+import threading
+import functools
+import inspect
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# Number of finished traces kept in memory
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+# Trace ids accepted from the x-trace-id request header: hex, optionally with dashes (UUIDs)
+_TRACE_ID = re.compile(r"^[0-9a-fA-F-]{16,64}$")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "start", "end", "attributes", "trace")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+
+class Trace:
+    def __init__(self, name: str, trace_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.wall_start = time.time()
+        self.spans: List[Span] = []
+        self.root = Span(self, name, None, dict(attributes or {}))
+        self.spans.append(self.root)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.root.end is None:
+            return None
+        return (self.root.end - self.root.start) * 1000
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start_time": self.wall_start,
+            "duration_ms": _round(self.duration_ms),
+            "span_count": len(self.spans),
+            "status": self.root.attributes.get("http.status"),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Flat span list (waterfall) plus the nested tree (flame graph)"""
+        origin = self.root.start
+        now = time.perf_counter()
+        flat = []
+        nodes = {}
+        for span in sorted(list(self.spans), key=lambda s: s.start):
+            end = span.end if span.end is not None else now
+            node = {
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "name": span.name,
+                "start_ms": _round((span.start - origin) * 1000),
+                "duration_ms": _round((end - span.start) * 1000),
+                "finished": span.end is not None,
+                "attributes": span.attributes,
+            }
+            flat.append(node)
+            nodes[span.span_id] = dict(node, children=[])
+
+        tree = None
+        for node in nodes.values():
+            parent = nodes.get(node["parent_id"])
+            if parent is not None:
+                parent["children"].append(node)
+            elif node["parent_id"] is None:
+                tree = node
+
+        return {**self.summary(), "spans": flat, "tree": tree}
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Chrome trace-event format, loadable in Perfetto or chrome://tracing"""
+        origin = self.root.start
+        now = time.perf_counter()
+        events = []
+        for span in list(self.spans):
+            end = span.end if span.end is not None else now
+            events.append({
+                "name": span.name,
+                "ph": "X",
+                "ts": (span.start - origin) * 1e6,
+                "dur": (end - span.start) * 1e6,
+                "pid": 1,
+                "tid": 1,
+                "args": {k: str(v) for k, v in span.attributes.items()},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"trace_id": self.trace_id, "name": self.name}}
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 3)
+
+
+class TraceBuffer:
+    """Bounded ring buffer of finished traces, indexed by trace id"""
+
+    def __init__(self, maxlen: int = TRACE_BUFFER_SIZE):
+        self.maxlen = maxlen
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        # Client-supplied ids of traces still in progress
+        self._reserved = set()
+        self._lock = threading.Lock()
+
+    def reserve(self, trace_id: str) -> bool:
+        """Claim a client-supplied id for a new trace; False if a kept or running trace has it"""
+        with self._lock:
+            if trace_id in self._traces or trace_id in self._reserved:
+                return False
+            self._reserved.add(trace_id)
+            return True
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._reserved.discard(trace.trace_id)
+            self._traces[trace.trace_id] = trace
+            self._traces.move_to_end(trace.trace_id)
+            while len(self._traces) > self.maxlen:
+                self._traces.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def recent(self, limit: int = 50) -> List[Trace]:
+        with self._lock:
+            traces = list(self._traces.values())
+        return traces[-limit:][::-1]
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+
+trace_buffer = TraceBuffer()
+
+
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None, **attributes):
+    """Open a new trace; its root span is the current span inside the block"""
+    trace = Trace(name, trace_id, attributes)
+    token = _current_span.set(trace.root)
+    try:
+        yield trace
+    finally:
+        trace.root.end = time.perf_counter()
+        _current_span.reset(token)
+        trace_buffer.add(trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a nested span; a no-op outside of a trace"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    parent.trace.spans.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attributes["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator wrapping a sync or async function in a span"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_trace() -> Optional[Trace]:
+    current = _current_span.get()
+    return current.trace if current is not None else None
+
+
+def set_attribute(key: str, value: Any):
+    """Attach an attribute to the current span, if any"""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+def set_trace_attribute(key: str, value: Any):
+    """Attach an attribute to the root span of the current trace, if any"""
+    current = _current_span.get()
+    if current is not None:
+        current.trace.root.attributes[key] = value
+
+
+# Paths that are not worth tracing (they would flush real requests out of the buffer)
+UNTRACED_PATHS = ("/metrics", "/api/traces", "/docs", "/openapi.json", "/favicon.ico")
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware opening one trace per HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(UNTRACED_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or []).get(b"x-trace-id")
+        trace_id = incoming.decode("latin-1") if incoming else None
+        # Never let a request overwrite another trace: malformed or taken ids get a fresh one
+        if trace_id is not None and not (_TRACE_ID.match(trace_id) and trace_buffer.reserve(trace_id)):
+            trace_id = None
+
+        with start_trace(f"{scope['method']} {scope['path']}", trace_id,
+                         **{"http.method": scope["method"], "http.path": scope["path"]}) as trace:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    trace.root.attributes["http.status"] = message["status"]
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-trace-id", trace.trace_id.encode("latin-1")))
+                    message = dict(message, headers=headers)
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
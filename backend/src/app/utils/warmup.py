@@ -0,0 +1,68 @@
+"""
+Background warm-up after startup.
+Importing main only loads what /api/health needs; the data stack (pandas,
+polars, duckdb, matplotlib, plotly, BeautifulSoup), the memory store and the
+Gemini client are loaded here on a daemon thread so the server can accept
+connections straight away. A request that arrives first simply imports what
+it needs itself. Set WARMUP=0 to disable.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict
+
+WARMUP_ENABLED = os.getenv('WARMUP', '1') != '0'
+
+# Shared with /api/health so callers can see when the instance is fully warm
+warmup_status: Dict[str, Any] = {"started": False, "done": False, "steps": {}, "errors": {}}
+
+
+def _load_memory_store():
+    from app.memory import memory_store
+    memory_store.sync()
+
+
+def _import_data_handler():
+    import app.utils.data_handler  # noqa: F401
+
+
+def _import_llm_agent():
+    import app.utils.llm_agent  # noqa: F401
+
+
+def _warm_llm_client():
+    from app.utils import data_handler, llm_agent
+    from app.utils.llm_client import warm_up
+    warm_up(llm_agent.MODEL_NAME, data_handler.MODEL_NAME)
+
+
+WARMUP_STEPS = [
+    ("memory_store", _load_memory_store),
+    ("data_handler", _import_data_handler),
+    ("llm_agent", _import_llm_agent),
+    ("llm_client", _warm_llm_client),
+]
+
+
+def run_warmup():
+    start = time.perf_counter()
+    for name, step in WARMUP_STEPS:
+        step_start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            warmup_status["errors"][name] = str(e)
+            print(f"⚠️ Warm-up step {name} failed: {e}")
+        warmup_status["steps"][name] = round((time.perf_counter() - step_start) * 1000, 1)
+    warmup_status["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    warmup_status["done"] = True
+    print(f"🔥 Warm-up finished in {warmup_status['total_ms']} ms")
+
+
+def start_warmup():
+    """Run the warm-up on a daemon thread; returns immediately"""
+    if not WARMUP_ENABLED or warmup_status["started"]:
+        return
+    warmup_status["started"] = True
+    threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
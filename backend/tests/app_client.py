@@ -0,0 +1,63 @@
+"""
+In-process API client for the endpoint tests: the FastAPI app behind
+TestClient, with the benchmarks' FakeLLM answering every LLM call.
+The app keeps its data under ./backend/data, so importing this module first
+moves the process into a scratch directory (tests/conftest.py imports it
+before any test module, so every store is created there).
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(BACKEND_DIR, 'benchmarks'), BACKEND_DIR, os.path.join(BACKEND_DIR, 'src')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fake_llm import FakeLLM  # noqa: E402
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix='insightengine-tests-')
+os.chdir(SCRATCH_DIR)
+atexit.register(shutil.rmtree, SCRATCH_DIR, True)
+
+fake_llm = FakeLLM()
+_client = None
+
+
+def client():
+    """TestClient for main.app; built on first use"""
+    global _client
+    if _client is None:
+        from fastapi.testclient import TestClient
+        from app.utils.llm_client import set_llm_backend
+        from main import app
+
+        set_llm_backend(fake_llm)
+        _client = TestClient(app)
+    return _client
+
+
+def adult(rows: int = 2000, seed: int = 0, tag: str = None):
+    """Adult-like dataset; a tag adds a constant column, giving the test a schema (and caches) of its own"""
+    from run_benchmarks import make_adult_like
+
+    df = make_adult_like(rows, seed)
+    if tag:
+        df[tag] = tag
+    return df
+
+
+def upload(df, filename: str = 'adult.csv', **form) -> dict:
+    """Upload df as a CSV file; returns the response JSON"""
+    response = client().post("/api/upload", files={"file": (filename, df.to_csv(index=False).encode(), "text/csv")},
+                             data=form)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def query(question: str, **fields) -> dict:
+    response = client().post("/api/query", json={"question": question, **fields})
+    assert response.status_code == 200, response.text
+    return response.json()
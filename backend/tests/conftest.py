@@ -0,0 +1,2 @@
+# Moves the test run into a scratch directory before any test module imports the app
+import app_client  # noqa: F401
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for batched questions sharing LLM calls (in-process, no server needed).
+Run with pytest, or directly: python tests/test_batch_query.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app_client import adult, client, fake_llm, upload  # noqa: E402
+from app.utils.llm_agent import BATCH_CHUNK_SIZE  # noqa: E402
+
+QUESTIONS = [
+    "What is the average hours per week by workclass?",
+    "What percentage of people with a Bachelors degree earn more than 50K?",
+    "How many people are from the United States?",
+    "Which occupation has the highest number of people earning more than 50K?",
+    "How many rows are there?",
+]
+
+
+def batch(questions) -> dict:
+    response = client().post("/api/query/batch", json={"questions": questions})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_one_llm_call_per_batch():
+    df = adult(3000, tag='batch')
+    upload(df, 'batch.csv')
+    calls = fake_llm.calls
+    data = batch(QUESTIONS)
+    assert fake_llm.calls == calls + 1 and data["llm_calls"] == 1
+    assert data["answered"] == len(QUESTIONS) and data["failed"] == 0
+    results = [r["result"] for r in data["results"]]
+    bachelors = df[df['education'] == 'Bachelors']
+    assert results[0] == df.groupby('workclass')['hours-per-week'].mean().to_dict()
+    assert results[1] == round(100 * (bachelors['income'] == '>50K').mean(), 2)
+    assert results[2] == int((df['native-country'] == 'United-States').sum())
+    assert results[3] == df[df['income'] == '>50K']['occupation'].value_counts().idxmax()
+    # Answered from the profile, outside the LLM program
+    assert data["results"][4]["fast_path"] == 'row_count' and results[4] == len(df)
+
+
+def test_large_batch_is_chunked():
+    upload(adult(3000, tag='batch'), 'batch.csv')
+    questions = [f"How many people are from the United States? ({i})" for i in range(BATCH_CHUNK_SIZE + 1)]
+    calls = fake_llm.calls
+    data = batch(questions)
+    assert data["llm_calls"] == 2 and fake_llm.calls == calls + 2
+    assert data["answered"] == len(questions)
+    assert len({r["result"] for r in data["results"]}) == 1
+
+
+def main():
+    for test in (test_one_llm_call_per_batch, test_large_batch_is_chunked):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
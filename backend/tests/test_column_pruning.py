@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for column pruning of generated code (offline, no server needed).
+Run with pytest, or directly: python tests/test_column_pruning.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import polars as pl  # noqa: E402
+
+from app.utils.column_pruning import prune_columns, referenced_columns  # noqa: E402
+
+DF = pd.DataFrame({
+    'age': [1.0, 2.0, 3.0, 3.0, None],
+    'workclass': ['a', None, 'b', 'b', 'c'],
+    'y': [1, 1, 1, 1, 2],
+    'hours': [10, 20, 30, 30, 40],
+})
+DF_POLARS = pl.from_pandas(DF)
+
+PANDAS_PROGRAMS = [
+    'result = dataframe.dropna()["age"].mean()',
+    'result = dataframe.drop_duplicates()["y"].sum()',
+    'result = dataframe.dropna(subset=["age"])["age"].mean()',
+    'result = dataframe.dropna(subset="workclass")["hours"].sum()',
+    'result = dataframe.drop_duplicates(subset=["age", "workclass"])["y"].sum()',
+    'result = dataframe.drop_duplicates("y")["hours"].sum()',
+    'result = dataframe.dropna(axis=1, subset=[0])["y"].sum()',
+    'result = dataframe.sort_values("hours").head(2)["age"].sum()',
+]
+POLARS_PROGRAMS = [
+    'result = dataframe.drop_nulls()["age"].mean()',
+    'result = dataframe.unique()["y"].sum()',
+    'result = dataframe.drop_nulls(subset=["age"])["age"].mean()',
+    'result = dataframe.unique(subset=["workclass"])["y"].sum()',
+]
+
+
+def run(code, df):
+    namespace = {'dataframe': df, 'pd': pd, 'pl': pl, 'np': np}
+    exec(code, namespace, namespace)
+    return namespace['result']
+
+
+def test_pruned_runs_match_full_runs():
+    for programs, df, engine in ((PANDAS_PROGRAMS, DF, 'pandas'), (POLARS_PROGRAMS, DF_POLARS, 'polars')):
+        for code in programs:
+            pruned, _ = prune_columns(code, df, engine)
+            assert run(code, pruned) == run(code, df), code
+
+
+def test_subset_decides_pruning():
+    columns = list(DF.columns)
+    # Every column takes part in dropping rows
+    assert referenced_columns('result = dataframe.dropna()["age"].mean()', columns) is None
+    assert referenced_columns('result = dataframe.drop_duplicates()["y"].sum()', columns) is None
+    assert referenced_columns('result = dataframe.drop_nulls()["age"].mean()', columns) is None
+    assert referenced_columns('result = dataframe.unique()["y"].sum()', columns) is None
+    assert referenced_columns('result = dataframe.dropna(subset=cols)["age"].mean()', columns) is None
+    # The subset columns are kept with the selected one
+    assert referenced_columns('result = dataframe.dropna(subset=["workclass"])["age"].mean()', columns) \
+        == {'workclass', 'age'}
+    assert referenced_columns('result = dataframe.unique(subset="y")["hours"].sum()', columns) == {'y', 'hours'}
+
+
+def main():
+    for test in (test_pruned_runs_match_full_runs, test_subset_decides_pruning):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
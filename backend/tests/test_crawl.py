@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Tests for paginated URL crawling against a local HTTP server (no network needed).
+Run with pytest, or directly: python tests/test_crawl.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import app_client  # noqa: E402
+from app.utils.crawler import CsvSpool, HostLimiter, crawl  # noqa: E402
+
+PAGES = 5
+ROWS_PER_PAGE = 3
+# Server-side delay so concurrent fetches overlap
+RESPONSE_DELAY = 0.05
+
+
+def page_html(page: int, next_href: str = None, table: bool = True) -> str:
+    rows = ""
+    for i in range(ROWS_PER_PAGE):
+        row_id = (page - 1) * ROWS_PER_PAGE + i + 1
+        # Only the last page has fractional scores: the column must still come out as floats
+        score = f"{row_id}.5" if page == PAGES else str(row_id)
+        rows += f"<tr><td>{row_id}</td><td>item {row_id}</td><td>{score}</td></tr>"
+    body = f"<table><thead><tr><th>id</th><th>name</th><th>score</th></tr></thead><tbody>{rows}</tbody></table>" \
+        if table else "<p>Nothing here</p>"
+    link = f'<a href="{next_href}">Next &raquo;</a>' if next_href else ""
+    return f"<html><body><table><tr><td>nav</td></tr></table>{body}{link}</body></html>"
+
+
+class CrawlServer:
+    """Local HTTP server serving a 5-page table three ways, recording request concurrency"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.request_starts = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server.lock:
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                    server.request_starts.append(time.monotonic())
+                try:
+                    time.sleep(RESPONSE_DELAY)
+                    self.respond()
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+
+            def respond(self):
+                parsed = urlparse(self.path)
+                page = int(parse_qs(parsed.query).get('page', ['1'])[0])
+                if parsed.path == '/chain':
+                    html = page_html(page, f"/chain?page={page + 1}" if page < PAGES else None)
+                elif parsed.path == '/list' and page <= PAGES:
+                    html = page_html(page)
+                elif parsed.path == '/gap':  # page 3 has no table: the crawl ends before it
+                    html = page_html(page, table=page != 3)
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = html.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def reset(self):
+        with self.lock:
+            self.max_in_flight = 0
+            self.request_starts = []
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture(scope='module')
+def server():
+    crawl_server = CrawlServer()
+    yield crawl_server
+    crawl_server.close()
+
+
+def run_crawl(url, pagination, max_pages=20, limiter=None):
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    spool = CsvSpool(path)
+    try:
+        stats = asyncio.run(crawl(url, pagination, max_pages, spool, limiter or HostLimiter(2, 0)))
+        spool.close()
+        import pandas as pd
+        return pd.read_csv(path), stats
+    finally:
+        spool.close()
+        os.remove(path)
+
+
+def test_numbered_pages_concurrent(server):
+    """?page=N pages are fetched concurrently, in page order, and stop at the first 404"""
+    server.reset()
+    df, stats = run_crawl(f"{server.url}/list?page=1", "param=page", limiter=HostLimiter(concurrency=2, delay_ms=0))
+    assert list(df['id']) == list(range(1, PAGES * ROWS_PER_PAGE + 1))
+    assert list(df.columns) == ['id', 'name', 'score']
+    assert df['score'].dtype == float
+    assert stats['pages_fetched'] == PAGES
+    assert stats['stopped'] == 'not_found'
+    assert 1 < server.max_in_flight <= 2
+
+
+def test_next_links(server):
+    """'next' follows Next links from page to page"""
+    df, stats = run_crawl(f"{server.url}/chain?page=1", "next")
+    assert len(df) == PAGES * ROWS_PER_PAGE
+    assert stats['stopped'] == 'last_page'
+
+
+def test_page_limit_and_empty_page(server):
+    df, stats = run_crawl(f"{server.url}/list?page=1", "param=page", max_pages=2)
+    assert len(df) == 2 * ROWS_PER_PAGE
+    df, stats = run_crawl(f"{server.url}/gap?page=1", "param=page", max_pages=10)
+    assert len(df) == 2 * ROWS_PER_PAGE
+    assert stats['stopped'] == 'empty_page'
+
+
+def test_politeness_delay(server):
+    """Requests to one host start at least delay_ms apart"""
+    server.reset()
+    run_crawl(f"{server.url}/list?page=1", "param=page", max_pages=4,
+              limiter=HostLimiter(concurrency=4, delay_ms=100))
+    starts = sorted(server.request_starts)
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert gaps and min(gaps) >= 0.09
+
+
+def test_upload_crawl_endpoint(server):
+    """POST /api/upload with a pagination rule makes the crawled table the active dataset"""
+    client = app_client.client()
+    response = client.post("/api/upload", data={"url": f"{server.url}/list?page=1", "pagination": "param=page"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data['type'] == 'crawl'
+    assert data['rows'] == PAGES * ROWS_PER_PAGE
+    assert data['pages'] == PAGES
+
+    response = client.post("/api/upload", data={"url": f"{server.url}/list", "pagination": "bogus"})
+    assert response.status_code == 400
+
+
+def main():
+    crawl_server = CrawlServer()
+    try:
+        for test in (test_numbered_pages_concurrent, test_next_links, test_page_limit_and_empty_page,
+                     test_politeness_delay):
+            test(crawl_server)
+            print(f"   ✅ {test.__name__}")
+        test_upload_crawl_endpoint(crawl_server)
+        print("   ✅ test_upload_crawl_endpoint")
+    finally:
+        crawl_server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for dtype optimization at ingest (offline, no server needed).
+Run with pytest, or directly: python tests/test_dtype_optimizer.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import polars as pl  # noqa: E402
+
+from app.utils import dtype_optimizer  # noqa: E402
+from app.utils.dtype_optimizer import optimize_dtypes, widen_dtypes  # noqa: E402
+
+rng = np.random.default_rng(0)
+ROWS = 5000
+ADULT = pd.DataFrame({
+    'age': rng.integers(17, 90, ROWS),
+    'workclass': rng.choice(['Private', 'Self-emp-not-inc', 'Local-gov', 'State-gov', 'Federal-gov'], ROWS),
+    'education': rng.choice(['Bachelors', 'HS-grad', 'Masters', 'Some-college', 'Doctorate'], ROWS),
+    'marital-status': rng.choice(['Married-civ-spouse', 'Never-married', 'Divorced', 'Widowed'], ROWS),
+    'occupation': rng.choice(['Tech-support', 'Craft-repair', 'Sales', 'Exec-managerial'], ROWS),
+    'sex': rng.choice(['Male', 'Female'], ROWS),
+    'hours-per-week': rng.integers(1, 99, ROWS),
+    'native-country': rng.choice(['United-States', 'Mexico', 'India'], ROWS, p=[0.8, 0.15, 0.05]),
+    'income': rng.choice(['<=50K', '>50K'], ROWS, p=[0.76, 0.24]),
+})
+
+# The adult acceptance questions (tests/test_adult_questions.py), plus programs that
+# would change on narrow integers or categoricals
+PROGRAMS = [
+    "result = int((dataframe['native-country'] == 'United-States').sum())",
+    "result = dataframe[dataframe['income'] == '>50K']['occupation'].value_counts().idxmax()",
+    "result = int(((dataframe['sex'] == 'Female') & (dataframe['marital-status'] == 'Divorced')).sum())",
+    "subset = dataframe[dataframe['education'] == 'Bachelors']\n"
+    "result = round(100 * (subset['income'] == '>50K').mean(), 2)",
+    "result = dataframe.groupby('workclass')['hours-per-week'].mean().max()",
+    # Unobserved categories would show up with observed=False
+    "result = dataframe[dataframe['education'] == 'Bachelors'].groupby('education', observed=False).size().to_dict()",
+    "result = dataframe[dataframe['workclass'] != 'Private']['workclass'].value_counts().to_dict()",
+    # int16 wraps around
+    "result = int(dataframe['hours-per-week'].cumsum().iloc[-1])",
+    "result = int((dataframe['age'] * dataframe['hours-per-week'] * dataframe['age']).max())",
+    "result = (dataframe['workclass'] + '/' + dataframe['sex']).value_counts().to_dict()",
+]
+
+
+def run(code, df):
+    namespace = {'dataframe': df, 'pd': pd, 'pl': pl, 'np': np}
+    exec(code, namespace, namespace)
+    return namespace['result']
+
+
+def test_storage_is_narrowed():
+    optimized, report = optimize_dtypes(ADULT, 'pandas')
+    assert optimized['age'].dtype == np.int16
+    assert isinstance(optimized['workclass'].dtype, pd.CategoricalDtype)
+    assert report['bytes_after'] < report['bytes_before']
+
+
+def test_generated_code_answers_do_not_change():
+    optimized, _ = optimize_dtypes(ADULT, 'pandas')
+    widened = widen_dtypes(optimized)
+    assert dict(widened.dtypes) == dict(ADULT.dtypes)
+    for code in PROGRAMS:
+        assert run(code, widened) == run(code, ADULT), code
+
+
+def test_generated_code_sees_widened_frame():
+    # Imported here: importing app.memory creates its data directory under the current one
+    from app.utils.llm_agent import exec_pruned
+
+    optimized, _ = optimize_dtypes(ADULT, 'pandas')
+    for code in PROGRAMS:
+        namespace, _, _ = exec_pruned(code, optimized, 'pandas')
+        assert namespace['result'] == run(code, ADULT), code
+
+
+def test_polars_widened():
+    df = pl.from_pandas(ADULT)
+    optimized, report = optimize_dtypes(df, 'polars')
+    assert optimized['age'].dtype == pl.Int16 and optimized['sex'].dtype == pl.Categorical
+    widened = widen_dtypes(optimized)
+    assert widened.schema == df.schema
+    assert widened['hours-per-week'].cum_sum()[-1] == df['hours-per-week'].cum_sum()[-1]
+
+
+def test_polars_failing_column_is_skipped():
+    df = pl.DataFrame({'when': ['boom'] * 10, 'sex': ['Male', 'Female'] * 5, 'age': list(range(10))})
+    looks_like_dates = dtype_optimizer._looks_like_dates
+
+    def failing(sample):
+        if 'boom' in sample:
+            raise pl.exceptions.ComputeError("cannot parse")
+        return looks_like_dates(sample)
+
+    dtype_optimizer._looks_like_dates = failing
+    try:
+        optimized, report = optimize_dtypes(df, 'polars')
+    finally:
+        dtype_optimizer._looks_like_dates = looks_like_dates
+    assert 'error' not in report
+    assert optimized['when'].dtype == pl.String
+    assert optimized['sex'].dtype == pl.Categorical and optimized['age'].dtype == pl.Int16
+
+
+def main():
+    for test in (test_storage_is_narrowed, test_generated_code_answers_do_not_change,
+                 test_generated_code_sees_widened_frame, test_polars_widened, test_polars_failing_column_is_skipped):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
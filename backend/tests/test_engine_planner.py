@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory-aware engine planner (offline, no server needed).
+Run with pytest, or directly: python tests/test_engine_planner.py
+"""
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from app.utils import engine_planner  # noqa: E402
+from app.utils.engine_planner import decide, estimate_source, plan_engine  # noqa: E402
+
+rng = np.random.default_rng(0)
+DF = pd.DataFrame({
+    'age': rng.integers(17, 90, 40_000),
+    'workclass': rng.choice(['Private', 'State-gov', 'Self-emp'], 40_000),
+    'notes': [f"note {i} " + 'x' * int(n) for i, n in enumerate(rng.integers(10, 200, 40_000))],
+    'hours-per-week': rng.normal(40, 10, 40_000).round(1),
+})
+MB = 1024 * 1024
+
+
+def test_estimate_from_sample_matches_full_parse():
+    content = DF.to_csv(index=False).encode()
+    assert len(content) > engine_planner.SAMPLE_BYTES
+    estimate, sample = estimate_source(content, 'csv', len(content))
+    actual = pd.read_csv(io.BytesIO(content)).memory_usage(deep=True).sum()
+    assert sample is None and estimate['sampled']
+    assert abs(estimate['estimated_rows'] - len(DF)) / len(DF) < 0.05
+    assert abs(estimate['pandas_bytes'] - actual) / actual < 0.1
+
+
+def test_small_file_is_parsed_once():
+    content = DF.head(500).to_csv(index=False).encode()
+    plan, df = plan_engine(content, 'csv', len(content))
+    assert plan['strategy'] == 'pandas'
+    pd.testing.assert_frame_equal(df, pd.read_csv(io.BytesIO(content)))
+
+
+def test_strategy_follows_free_memory():
+    estimate = {'file_bytes': 40 * MB, 'sampled': True, 'sample_rows': 1000, 'estimated_rows': 100_000,
+                'pandas_bytes': 60 * MB, 'arrow_bytes': 30 * MB}
+    # available memory -> strategy, with half of it usable
+    expected = [(1024 * MB, 'pandas'), (200 * MB, 'polars'), (80 * MB, 'polars_lazy'), (40 * MB, 'duckdb')]
+    for available, strategy in expected:
+        plan = decide(estimate, 'csv', available=available)
+        assert plan['strategy'] == strategy, (available, plan)
+        assert plan['engine'] == ('pandas' if strategy == 'pandas' else 'polars')
+    assert decide(estimate, 'json', available=80 * MB)['strategy'] == 'duckdb'  # no streaming JSON reader
+    # Strings that blow up in pandas go to Polars however small the file is
+    assert decide(dict(estimate, pandas_bytes=500 * MB), 'csv', available=4096 * MB)['strategy'] == 'polars'
+
+
+def test_over_budget_is_rejected():
+    estimate = {'file_bytes': MB, 'sampled': True, 'sample_rows': 10, 'estimated_rows': 10,
+                'pandas_bytes': 20 * MB, 'arrow_bytes': 10 * MB}
+    budget = engine_planner.DATASET_MEMORY_BUDGET_MB
+    engine_planner.DATASET_MEMORY_BUDGET_MB = 5
+    try:
+        plan = decide(estimate, 'csv', available=4096 * MB)
+    finally:
+        engine_planner.DATASET_MEMORY_BUDGET_MB = budget
+    assert plan['strategy'] is None and plan['engine'] is None
+    assert plan['inputs']['budget_mb'] == 5
+
+
+def test_pandas_reads_csv_in_chunks():
+    # Imported here: importing app.memory creates its data directory under the current one
+    from app.utils import data_handler
+
+    content = DF.to_csv(index=False).encode()
+    chunk_rows = data_handler.PANDAS_CHUNK_ROWS
+    data_handler.PANDAS_CHUNK_ROWS = 7_000
+    try:
+        df = data_handler.read_data_file(content, 'csv', {'strategy': 'pandas'})
+    finally:
+        data_handler.PANDAS_CHUNK_ROWS = chunk_rows
+    pd.testing.assert_frame_equal(df, pd.read_csv(io.BytesIO(content)))
+    header_only = data_handler.read_data_file(b'age,workclass\n', 'csv', {'strategy': 'pandas'})
+    assert list(header_only.columns) == ['age', 'workclass'] and header_only.empty
+
+
+def main():
+    for test in (test_estimate_from_sample_matches_full_parse, test_small_file_is_parsed_once,
+                 test_strategy_follows_free_memory, test_over_budget_is_rejected, test_pandas_reads_csv_in_chunks):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
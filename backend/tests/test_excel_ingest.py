@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for Excel workbook ingestion (offline, no server needed).
+Run with pytest, or directly: python tests/test_excel_ingest.py
+"""
+import io
+import os
+import sys
+import tempfile
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import pandas as pd  # noqa: E402
+
+from app.utils import excel_ingest  # noqa: E402
+from app.utils.excel_ingest import excel_engine, open_workbook, select_sheets  # noqa: E402
+
+SHEETS = {
+    'people': pd.DataFrame({'name': ['Ann', 'Bob', 'Cid'], 'age': [31, 42, 27]}),
+    'sales': pd.DataFrame({'region': ['north', 'south'] * 5, 'amount': [float(i) for i in range(10)]}),
+    'empty': pd.DataFrame({'note': []}),
+}
+
+
+def workbook_bytes() -> bytes:
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        for name, df in SHEETS.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    return buffer.getvalue()
+
+
+def check_sheets(workbook):
+    assert [sheet['name'] for sheet in workbook.sheets] == list(SHEETS)
+    for sheet in workbook.sheets:
+        assert sheet['parsed'] and sheet['rows'] == len(SHEETS[sheet['name']])
+        df = workbook.load(sheet, 'pandas')
+        assert list(df.columns) == list(SHEETS[sheet['name']].columns)
+        if len(df):
+            pd.testing.assert_frame_equal(df, SHEETS[sheet['name']], check_dtype=False)
+
+
+def test_all_sheets_in_process():
+    # Built once: the workbook's timestamps would change the bytes, and the cache key, a second later
+    content = workbook_bytes()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        workbook = open_workbook(content, 'xlsx', cache_dir)
+        workbook.parse(select_sheets(workbook, 'all'))
+        assert excel_ingest._pool is None
+        check_sheets(workbook)
+        # Cached: a second upload finds every sheet parsed
+        check_sheets(open_workbook(content, 'xlsx', cache_dir))
+
+
+def test_all_sheets_in_worker_processes():
+    min_mb = excel_ingest.EXCEL_POOL_MIN_MB
+    excel_ingest.EXCEL_POOL_MIN_MB = 0
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            workbook = open_workbook(workbook_bytes(), 'xlsx', cache_dir)
+            workbook.parse(select_sheets(workbook, 'people,sales'))
+            assert excel_ingest._pool is not None
+            assert [sheet['parsed'] for sheet in workbook.sheets] == [True, True, False]
+            # The last sheet is parsed on demand
+            workbook.parse(select_sheets(workbook, '2'))
+            check_sheets(workbook)
+    finally:
+        excel_ingest.EXCEL_POOL_MIN_MB = min_mb
+        excel_ingest._reset_pool()
+
+
+def test_calamine_needs_pandas_2_2():
+    installed = 'python_calamine' in sys.modules
+    sys.modules.setdefault('python_calamine', types.ModuleType('python_calamine'))
+    version = pd.__version__
+    try:
+        pd.__version__ = '2.2.0'
+        assert excel_engine('xlsx') == 'calamine'
+        pd.__version__ = '2.1.4'
+        assert excel_engine('xlsx') == 'openpyxl' and excel_engine('xls') == 'xlrd'
+    finally:
+        pd.__version__ = version
+        if not installed:
+            del sys.modules['python_calamine']
+
+
+def main():
+    for test in (test_all_sheets_in_process, test_all_sheets_in_worker_processes, test_calamine_needs_pandas_2_2):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Tests for answering simple questions without the LLM (in-process, no server needed).
+Run with pytest, or directly: python tests/test_fast_path.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app_client import adult, fake_llm, query, upload  # noqa: E402
+
+
+def test_simple_questions_skip_the_llm():
+    df = adult(1500, tag='fast_path')
+    upload(df, 'fast_path.csv')
+    calls = fake_llm.calls
+    rows = query("How many rows are there?")
+    assert rows["fast_path"] == 'row_count' and rows["lane"] == 'fast'
+    assert rows["result"] == len(df)
+    columns = query("What are the columns?")
+    assert columns["fast_path"] == 'columns' and columns["result"] == list(df.columns)
+    counts = query("value counts of workclass")
+    assert counts["fast_path"] == 'value_counts'
+    assert counts["result"] == df['workclass'].value_counts().to_dict()
+    assert fake_llm.calls == calls
+
+
+def test_other_questions_reach_the_llm():
+    upload(adult(1500, tag='fast_path'), 'fast_path.csv')
+    calls = fake_llm.calls
+    response = query("How many rows are there?", context={"disable_fast_path": True})
+    assert "fast_path" not in response and fake_llm.calls == calls + 1
+
+
+def main():
+    for test in (test_simple_questions_skip_the_llm, test_other_questions_reach_the_llm):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
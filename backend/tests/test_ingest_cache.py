@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for serving re-uploads from the ingest cache (in-process, no server needed).
+Run with pytest, or directly: python tests/test_ingest_cache.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app_client import adult, client, query, upload  # noqa: E402
+
+
+def parses() -> float:
+    """Uploads parsed so far, from /metrics"""
+    return sum(float(line.rpartition(' ')[2]) for line in client().get("/metrics").text.splitlines()
+               if line.startswith('upload_parse_seconds_count'))
+
+
+def test_reupload_hits_cache():
+    df = adult(1500, seed=39, tag='ingest')
+    first = upload(df, 'ingest.csv')
+    assert first["ingest_cache"] == 'miss'
+    parsed = parses()
+    # Same bytes under another name: nothing is parsed or optimized again
+    second = upload(df, 'renamed.csv')
+    assert second["ingest_cache"] == 'hit' and parses() == parsed
+    assert second["filename"] == 'renamed.csv' and second["rows"] == len(df)
+    assert second["dtype_optimization"] == first["dtype_optimization"]
+    assert query("How many rows are there?")["result"] == len(df)
+    assert query("value counts of occupation")["result"] == df['occupation'].value_counts().to_dict()
+
+    changed = upload(df.head(1000), 'ingest.csv')
+    assert changed["ingest_cache"] == 'miss' and parses() == parsed + 1
+    assert query("How many rows are there?")["result"] == 1000
+
+
+def main():
+    for test in (test_reupload_hits_cache,):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
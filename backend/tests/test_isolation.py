@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests that generated code can't modify the stored dataset (in-process, no server needed).
+Run with pytest, or directly: python tests/test_isolation.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from app_client import adult, fake_llm, query, upload  # noqa: E402
+from fake_llm import FakeLLM  # noqa: E402
+from app.memory import memory_store  # noqa: E402
+from app.utils.dtype_optimizer import widen_dtypes  # noqa: E402
+from app.utils.llm_client import set_llm_backend  # noqa: E402
+
+VANDAL_CODE = """dataframe['age'] = 0
+dataframe.iloc[0, dataframe.columns.get_loc('hours-per-week')] = -1
+dataframe.drop(columns=['sex'], inplace=True)
+dataframe.sort_values('fnlwgt', inplace=True)
+dataframe.drop(dataframe.index[:100], inplace=True)
+dataframe['workclass'] = dataframe['workclass'].astype(str).str.upper()
+result = int(dataframe['age'].sum())
+explanation = 'Rewrote the data.'"""
+
+
+def stored_frame() -> pd.DataFrame:
+    return widen_dtypes(memory_store.get('dataframe')).copy(deep=True)
+
+
+def test_generated_code_cannot_modify_stored_frame():
+    df = adult(1500, tag='isolation')
+    upload(df, 'isolation.csv')
+    before = stored_frame()
+    try:
+        set_llm_backend(FakeLLM(rules=[("rewrite", VANDAL_CODE)]))
+        response = query("Please rewrite the data", context={"source": "isolation test"})
+    finally:
+        set_llm_backend(fake_llm)
+    # The query saw its own changes...
+    assert response["result"] == 0
+    # ...and nobody else did
+    pd.testing.assert_frame_equal(stored_frame(), before)
+    assert query("How many rows are there?")["result"] == len(df)
+    average = query("What is the average hours per week by workclass?")["result"]
+    assert average == df.groupby('workclass')['hours-per-week'].mean().to_dict()
+
+
+def test_frame_without_narrowed_columns_is_isolated():
+    # Nothing to widen, so the query would get the stored frame itself but for its isolated view
+    rng = np.random.default_rng(40)
+    df = pd.DataFrame({'score': rng.normal(50, 10, 800), 'weight': rng.random(800)})
+    upload(df, 'scores.csv')
+    before = memory_store.get('dataframe').copy(deep=True)
+    code = """dataframe['score'] = 0.0
+dataframe.drop(columns=['weight'], inplace=True)
+dataframe.sort_values('score', inplace=True)
+result = float(dataframe['score'].sum())
+explanation = 'Rewrote the data.'"""
+    try:
+        set_llm_backend(FakeLLM(rules=[("rewrite", code)]))
+        assert query("Please rewrite the scores", context={"source": "isolation test"})["result"] == 0.0
+    finally:
+        set_llm_backend(fake_llm)
+    pd.testing.assert_frame_equal(memory_store.get('dataframe'), before)
+
+
+def main():
+    for test in (test_generated_code_cannot_modify_stored_frame, test_frame_without_narrowed_columns_is_isolated):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
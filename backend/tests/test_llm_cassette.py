@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for recording and replaying LLM calls through the API (in-process, no server needed).
+Run with pytest, or directly: python tests/test_llm_cassette.py
+"""
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app_client import adult, fake_llm, query, upload  # noqa: E402
+from app.utils.llm_cassette import Cassette  # noqa: E402
+from app.utils.llm_client import set_llm_backend  # noqa: E402
+
+QUESTION = "What is the average hours per week by workclass?"
+# A context keeps the question cache out of the way, so each query reaches the LLM backend
+CONTEXT = {"source": "cassette test"}
+
+
+def test_replay_without_llm():
+    upload(adult(1200, tag='cassette'), 'cassette.csv')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cassette.json')
+        try:
+            recorder = Cassette(path, 'record', fake_llm)
+            set_llm_backend(recorder)
+            recorded = query(QUESTION, context=CONTEXT, session_id='cassette-record')
+            assert recorder.stats()["recorded"] == 1
+            with open(path) as f:
+                interactions = json.load(f)["interactions"]
+            assert [entry["response"] for entry in interactions.values()] == \
+                ["```python\n" + recorded["code_executed"] + "\n```"]
+
+            # Replay has no backend to fall back on: every answer comes from the file
+            calls = fake_llm.calls
+            player = Cassette(path, 'replay')
+            set_llm_backend(player)
+            replayed = query(QUESTION, context=CONTEXT, session_id='cassette-replay')
+            assert replayed["result"] == recorded["result"]
+            assert replayed["code_executed"] == recorded["code_executed"]
+            assert player.stats()["hits"] == 1 and fake_llm.calls == calls
+
+            query("Which occupation has the highest count?", context=CONTEXT, session_id='cassette-replay')
+            assert player.stats()["misses"] == 1 and fake_llm.calls == calls
+        finally:
+            set_llm_backend(fake_llm)
+
+
+def main():
+    for test in (test_replay_without_llm,):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
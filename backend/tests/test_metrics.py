@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for the /metrics endpoint (in-process, no server needed).
+Run with pytest, or directly: python tests/test_metrics.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app_client import adult, client, query, upload  # noqa: E402
+
+
+def scrape() -> dict:
+    """{sample name with labels: value} from /metrics"""
+    response = client().get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    samples = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith('#'):
+            name, _, value = line.rpartition(' ')
+            samples[name] = float(value)
+    return samples
+
+
+def test_query_counters():
+    upload(adult(1200, tag='metrics'), 'metrics.csv')
+    before = scrape()
+    query("What is the average hours per week by workclass?")
+    query("How many rows are there?")
+    after = scrape()
+
+    def delta(name):
+        return after.get(name, 0) - before.get(name, 0)
+
+    assert delta('http_request_duration_seconds_count{method="POST",route="/query",status="200"}') == 2
+    assert delta('http_response_bytes_count{route="/query"}') == 2
+    assert delta('cache_requests_total{cache="fast_path",result="hit"}') == 1
+    assert delta('cache_requests_total{cache="fast_path",result="miss"}') == 1
+    assert delta('llm_request_seconds_count{caller="llm_agent"}') == 1
+    assert delta('exec_seconds_count{kind="query"}') == 1
+    assert delta('query_queue_wait_seconds_count{lane="fast"}') == 1
+    assert delta('query_queue_wait_seconds_count{lane="normal"}') == 1
+    # Histograms are cumulative: the +Inf bucket counts every observation
+    assert after['query_attempts_bucket{le="+Inf"}'] == after['query_attempts_count']
+    hits = after['cache_requests_total{cache="fast_path",result="hit"}']
+    misses = after['cache_requests_total{cache="fast_path",result="miss"}']
+    assert after['cache_hit_ratio{cache="fast_path"}'] == hits / (hits + misses)
+
+
+def test_upload_counters():
+    before = scrape()
+    upload(adult(1300, tag='metrics'), 'metrics.csv')
+    after = scrape()
+    assert after['upload_parse_seconds_count{format="csv",engine="pandas"}'] == \
+        before.get('upload_parse_seconds_count{format="csv",engine="pandas"}', 0) + 1
+    assert after['engine_plans_total{strategy="pandas"}'] == before.get('engine_plans_total{strategy="pandas"}', 0) + 1
+
+
+def main():
+    for test in (test_query_counters, test_upload_counters):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for response formats and compression chosen by Accept headers (in-process, no server needed).
+Run with pytest, or directly: python tests/test_negotiation.py
+"""
+import gzip
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import msgpack  # noqa: E402
+import pandas as pd  # noqa: E402
+import pyarrow as pa  # noqa: E402
+
+from app_client import adult, client, upload  # noqa: E402
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+
+def post_query(question: str, accept: str = 'application/json', encoding: str = 'identity'):
+    response = client().post("/api/query", json={"question": question},
+                             headers={"Accept": accept, "Accept-Encoding": encoding})
+    assert response.status_code == 200, response.text
+    return response
+
+
+def test_msgpack():
+    upload(adult(1200, tag='negotiation'), 'negotiation.csv')
+    question = "What is the average hours per week by workclass?"
+    as_json = post_query(question).json()
+    response = post_query(question, accept='application/msgpack')
+    assert response.headers["content-type"] == 'application/msgpack' and 'Accept' in response.headers["vary"]
+    payload = msgpack.unpackb(response.content)
+    assert payload["result"] == as_json["result"] and payload["explanation"] == as_json["explanation"]
+    # Images travel as raw PNG bytes instead of base64
+    plot = msgpack.unpackb(post_query("Plot the age histogram", accept='application/msgpack').content)
+    assert isinstance(plot["image"], bytes) and plot["image"].startswith(b'\x89PNG')
+
+
+def test_arrow():
+    df = adult(1200, tag='negotiation')
+    upload(df, 'negotiation.csv')
+    response = post_query("Show the table", accept=ARROW_STREAM)
+    assert response.headers["content-type"] == ARROW_STREAM
+    table = pa.ipc.open_stream(pa.BufferReader(response.content)).read_all()
+    pd.testing.assert_frame_equal(table.to_pandas(), df.head(500), check_dtype=False)
+    rest = json.loads(table.schema.metadata[b'response'])
+    assert rest["explanation"] == 'First 500 rows.' and 'result' not in rest
+    # A scalar isn't a table: JSON instead
+    response = post_query("How many rows are there?", accept=f"{ARROW_STREAM}, application/json;q=0.5")
+    assert response.headers["content-type"] == 'application/json' and response.json()["result"] == len(df)
+
+
+def test_gzip():
+    upload(adult(1200, tag='negotiation'), 'negotiation.csv')
+    with client().stream("POST", "/api/query", json={"question": "Show the table"},
+                         headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == 'gzip' and 'Accept-Encoding' in response.headers["vary"]
+        raw = b''.join(response.iter_raw())
+    body = gzip.decompress(raw)
+    assert len(raw) < len(body) / 2
+    assert len(json.loads(body)["result"]["age"]) == 500
+    # Small responses and clients that don't ask are left alone
+    assert "content-encoding" not in post_query("How many rows are there?", encoding='gzip').headers
+    assert "content-encoding" not in post_query("Show the table").headers
+
+
+def main():
+    for test in (test_msgpack, test_arrow, test_gzip):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for opt-in profiling of generated code (in-process, no server needed).
+Run with pytest, or directly: python tests/test_profiling.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app_client import adult, query, upload  # noqa: E402
+
+QUESTION = "What is the average hours per week by workclass?"
+
+
+def test_profile_fields():
+    upload(adult(1200, tag='profiling'), 'profiling.csv')
+    response = query(QUESTION, profile=True)
+    profile = response["profile"]
+    assert set(profile) == {"wall_time_ms", "top_functions", "lines", "peak_memory_bytes",
+                            "retained_memory_bytes", "concurrent_profiles"}
+    assert profile["wall_time_ms"] > 0 and profile["concurrent_profiles"] == 0
+    assert profile["peak_memory_bytes"] >= profile["retained_memory_bytes"] >= 0
+    functions = profile["top_functions"]
+    assert functions and set(functions[0]) == {"function", "location", "calls", "total_ms", "cumulative_ms"}
+    # One entry per executed line of the generated program, which calls the pandas groupby
+    program = response["code_executed"].splitlines()
+    lines = profile["lines"]
+    assert [line["code"] for line in lines] == [program[line["line"] - 1] for line in lines]
+    assert any("groupby" in line["code"] and line["hits"] == 1 for line in lines)
+    assert all(0 <= line["percent"] <= 100 for line in lines)
+
+
+def test_profile_is_opt_in():
+    upload(adult(1200, tag='profiling'), 'profiling.csv')
+    assert "profile" not in query(QUESTION)
+    # Reused code from the question cache is profiled too
+    reused = query(QUESTION, profile=True)
+    assert reused["question_cache"] is not None and reused["profile"]["lines"]
+
+
+def main():
+    for test in (test_profile_fields, test_profile_is_opt_in):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for background query jobs shared between workers (offline, no server needed).
+Run with pytest, or directly: python tests/test_query_jobs.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from app.utils.query_jobs import QueryJobStore  # noqa: E402
+
+
+def test_job_polled_through_another_worker():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'query_jobs.db')
+        runner = QueryJobStore(path)
+        job_id = runner.create("average hours?", "s1")
+        # A fresh store stands in for the worker that didn't run the job
+        poller = QueryJobStore(path)
+        assert poller.get(job_id)['status'] == 'running'
+        runner.finish(job_id, result={"result": {"Private": 40.5}, "explanation": "Average hours."})
+        job = poller.get(job_id)
+        assert job['status'] == 'done' and job['result']['result'] == {"Private": 40.5}
+        assert job['duration_ms'] >= 0
+        failed = runner.create("median?", "s1")
+        runner.finish(failed, error="Full run failed: boom")
+        assert poller.get(failed) == {**poller.get(failed), "status": "failed", "error": "Full run failed: boom"}
+        assert 'result' not in poller.get(failed)
+        assert poller.get('0' * 32) is None
+
+
+def test_jobs_expire_and_are_bounded():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'query_jobs.db')
+        store = QueryJobStore(path, maxlen=3, ttl_seconds=0.2)
+        job_ids = [store.create(f"q{i}", "s1") for i in range(5)]
+        assert [store.get(job_id) is not None for job_id in job_ids] == [False, False, True, True, True]
+        time.sleep(0.3)
+        assert QueryJobStore(path, ttl_seconds=0.2).get(job_ids[-1]) is None
+
+
+def main():
+    for test in (test_job_polled_through_another_worker, test_jobs_expire_and_are_bounded):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for the paraphrase-tolerant question cache and the code library behind it (offline, no server needed).
+Run with pytest, or directly: python tests/test_question_cache.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import pandas as pd  # noqa: E402
+
+from app.utils.dataset_profile import build_profile  # noqa: E402
+from app.utils.code_library import CodeLibrary, schema_key  # noqa: E402
+from app.utils.question_cache import QuestionCache  # noqa: E402
+
+DF = pd.DataFrame({
+    'age': [25, 38, 52, 41],
+    'workclass': ['Private', 'State-gov', 'Private', 'Self-emp'],
+    'hours-per-week': [40, 50, 45, 60],
+    'native-country': ['United-States', 'Mexico', 'United-States', 'India'],
+    'income': ['<=50K', '>50K', '>50K', '<=50K'],
+})
+PROFILE = build_profile(DF, 'pandas')
+SCHEMA = schema_key(DF, 'pandas')
+
+
+def make_cache(*questions, library=None):
+    cache = QuestionCache(threshold=0.85, size=10, enabled=True, library=library)
+    for question in questions:
+        cache.add(question, f"# code for: {question}", SCHEMA, DF.columns, PROFILE)
+    return cache
+
+
+def lookup(cache, question, schema=SCHEMA):
+    return cache.lookup(question, schema, DF.columns, PROFILE)
+
+
+def test_paraphrases_hit():
+    cache = make_cache("avg hours per week by workclass", "How many individuals are from the United-States?")
+    hit = lookup(cache, "What's the mean hours-per-week for each work class?")
+    assert hit and hit["question"] == "avg hours per week by workclass"
+    assert hit["similarity"] >= 0.85
+    hit = lookup(cache, "number of people from United States")
+    assert hit and hit["question"] == "How many individuals are from the United-States?"
+
+
+def test_different_literals_miss():
+    """Same wording with another column, category value, number or operation never reuses code"""
+    cache = make_cache("avg hours per week by workclass", "How many individuals are from the United-States?",
+                       "top 5 workclasses by age", "share of records with income >50K")
+    assert lookup(cache, "avg age by workclass") is None
+    assert lookup(cache, "max hours per week by workclass") is None
+    assert lookup(cache, "How many individuals are from Mexico?") is None
+    assert lookup(cache, "How many individuals are not from the United-States?") is None
+    assert lookup(cache, "top 10 workclasses by age") is None
+    assert lookup(cache, "share of records with income <=50K") is None
+
+
+def test_schema_and_capacity():
+    cache = make_cache("avg hours per week by workclass")
+    assert lookup(cache, "avg hours per week by workclass", schema="other") is None
+    for i in range(20):
+        cache.add(f"sum of age for row {i}", "", SCHEMA, DF.columns, PROFILE)
+    assert lookup(cache, "avg hours per week by workclass") is None  # evicted, least recently used
+
+
+def test_schema_key_ignores_dtype_width():
+    """Another day's export may come out as int16 instead of int32, or object instead of category"""
+    narrowed = DF.astype({'age': 'int16', 'workclass': 'category'})
+    assert schema_key(narrowed, 'pandas') == SCHEMA
+    assert schema_key(DF.rename(columns={'age': 'years'}), 'pandas') != SCHEMA
+    assert schema_key(DF, 'polars') != SCHEMA
+
+
+def test_library_persists_programs(tmp_path):
+    library = CodeLibrary(str(tmp_path / 'library.db'))
+    make_cache("avg hours per week by workclass", "How many individuals are from the United-States?",
+               library=library)
+    cache = make_cache("How many individuals are from the United-States?", library=library)  # used twice
+
+    # A fresh process finds the programs in the library
+    restarted = make_cache(library=CodeLibrary(str(tmp_path / 'library.db')))
+    hit = lookup(restarted, "mean hours-per-week for each work class")
+    assert hit and hit["code"] == "# code for: avg hours per week by workclass"
+    top = restarted.top(SCHEMA, 1)
+    assert [entry["question"] for entry in top] == ["How many individuals are from the United-States?"]
+    assert top[0]["key"] == lookup(cache, "number of people from United States")["key"]
+
+
+def test_precomputed_answers_shared(tmp_path):
+    library = CodeLibrary(str(tmp_path / 'library.db'))
+    worker = make_cache("How many individuals are from the United-States?", library=library)
+    key = lookup(worker, "number of people from United States")["key"]
+    worker.save_answer(7, key, {"result": 2, "explanation": "Two."})
+
+    # Another worker serves the answer for the same dataset version only
+    other = make_cache(library=CodeLibrary(str(tmp_path / 'library.db')))
+    assert other.answer(7, key) == {"result": 2, "explanation": "Two."}
+    assert other.answer(8, key) is None
+    worker.drop_answers(8)
+    assert other.answer(7, key) is None
+
+
+def main():
+    import tempfile
+    from pathlib import Path
+
+    for test in (test_paraphrases_hit, test_different_literals_miss, test_schema_and_capacity,
+                 test_schema_key_ignores_dtype_width):
+        test()
+        print(f"   ✅ {test.__name__}")
+    for test in (test_library_persists_programs, test_precomputed_answers_shared):
+        test(Path(tempfile.mkdtemp()))
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for paging and downloading large results by handle (in-process, no server needed).
+Run with pytest, or directly: python tests/test_result_handles.py
+"""
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd  # noqa: E402
+import pyarrow as pa  # noqa: E402
+
+from app_client import adult, client, fake_llm, query, upload  # noqa: E402
+from fake_llm import FakeLLM  # noqa: E402
+from app.utils.llm_client import set_llm_backend  # noqa: E402
+
+COLUMNS = ['age', 'occupation', 'hours-per-week']
+ALL_ROWS_CODE = f"""result = dataframe[{COLUMNS!r}]
+explanation = 'Every row.'"""
+
+
+def large_result(rows: int = 2500):
+    """(expected frame, result_handle) of a query answered with a table too large to send whole"""
+    df = adult(rows, tag='results')
+    upload(df, 'results.csv')
+    try:
+        set_llm_backend(FakeLLM(rules=[("every row", ALL_ROWS_CODE)]))
+        response = query("Show every row", context={"source": "result handle test"})
+    finally:
+        set_llm_backend(fake_llm)
+    return df[COLUMNS], response["result_handle"]
+
+
+def test_paging():
+    expected, handle = large_result()
+    assert handle["rows"] == len(expected) and handle["columns"] == COLUMNS
+    url = f"/api/results/{handle['handle']}"
+    page = client().get(url, params={"offset": 200, "limit": 50}).json()
+    assert page["total_rows"] == len(expected) and page["limit"] == 50
+    assert page["rows"] == expected.iloc[200:250].to_dict('records')
+
+    page = client().get(url, params={"sort_by": "age", "descending": True, "limit": 20}).json()
+    ages = [row["age"] for row in page["rows"]]
+    assert ages == sorted(expected['age'], reverse=True)[:20]
+    # The last page is short
+    page = client().get(url, params={"offset": len(expected) - 10, "limit": 100}).json()
+    assert page["limit"] == 10 and page["rows"] == expected.tail(10).to_dict('records')
+
+    assert client().get(url, params={"sort_by": "nope"}).status_code == 400
+    assert client().get(f"/api/results/{'0' * 32}").status_code == 404
+    assert client().get("/api/results/..%2Fmeta").status_code == 404
+
+
+def test_download():
+    expected, handle = large_result()
+    url = f"/api/results/{handle['handle']}/download"
+    response = client().get(url, params={"format": "csv"})
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'attachment' in response.headers["content-disposition"]
+    pd.testing.assert_frame_equal(pd.read_csv(io.BytesIO(response.content)), expected)
+    response = client().get(url, params={"format": "parquet"})
+    pd.testing.assert_frame_equal(pd.read_parquet(io.BytesIO(response.content)), expected, check_dtype=False)
+    response = client().get(url, params={"format": "arrow"})
+    table = pa.ipc.open_file(pa.BufferReader(response.content)).read_all()
+    assert table.num_rows == len(expected) and table.column_names == COLUMNS
+    assert client().get(url, params={"format": "xml"}).status_code == 400
+
+
+def main():
+    for test in (test_paging, test_download):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests for the fair query scheduler (offline, no server needed).
+Run with pytest, or directly: python tests/test_scheduler.py
+"""
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from app.utils.scheduler import FairScheduler, QueueFull, to_thread  # noqa: E402
+
+
+async def _run_jobs(scheduler, jobs, gate):
+    """Queue (session, lane, cost) jobs in order; returns the order they started in"""
+    started = []
+
+    def job(name):
+        async def run():
+            started.append(name)
+            await gate.wait()
+        return run
+
+    tasks = []
+    for name, session, lane, cost in jobs:
+        tasks.append(asyncio.ensure_future(scheduler.run(session, job(name), lane=lane, cost=cost)))
+        await asyncio.sleep(0)
+    return started, tasks
+
+
+def test_weighted_fair_order():
+    async def scenario():
+        scheduler = FairScheduler(slots=1, fast_slots=1, session_running=1, max_queued=20, session_queued=10,
+                                  weights={'vip': 2})
+        gate = asyncio.Event()
+        jobs = [('hog1', 'hog', 'normal', 1)]  # takes the only slot
+        jobs += [(f'hog{i}', 'hog', 'normal', 1) for i in range(2, 5)]
+        jobs += [('alice1', 'alice', 'normal', 1), ('alice2', 'alice', 'normal', 1)]
+        jobs += [('vip1', 'vip', 'normal', 1), ('vip2', 'vip', 'normal', 1)]
+        started, tasks = await _run_jobs(scheduler, jobs, gate)
+        assert started == ['hog1']
+        for _ in range(len(jobs)):
+            gate.set()
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+        return started
+
+    order = asyncio.run(scenario())
+    # The hog's queued queries don't hold the others back; vip (weight 2) gets both turns early
+    assert order.index('alice1') < order.index('hog3')
+    assert order.index('vip2') < order.index('alice2')
+    assert order[-1] == 'hog4'
+
+
+def test_fast_lane_and_session_quota():
+    async def scenario():
+        scheduler = FairScheduler(slots=2, fast_slots=1, session_running=1, max_queued=10, session_queued=10)
+        gate = asyncio.Event()
+        started, tasks = await _run_jobs(scheduler, [('a1', 'a', 'normal', 1), ('a2', 'a', 'normal', 1),
+                                                     ('b1', 'b', 'normal', 1), ('a-fast', 'a', 'fast', 1)], gate)
+        # a is held to one running query, which leaves the second slot to b; fast queries don't wait
+        assert started == ['a1', 'b1', 'a-fast']
+        gate.set()
+        results = await asyncio.gather(*tasks)
+        assert all(wait >= 0 for _, wait in results)
+
+    asyncio.run(scenario())
+
+
+def test_backpressure():
+    async def scenario():
+        scheduler = FairScheduler(slots=1, fast_slots=1, session_running=1, max_queued=3, session_queued=2)
+        gate = asyncio.Event()
+        _, tasks = await _run_jobs(scheduler, [('a1', 'a', 'normal', 1), ('a2', 'a', 'normal', 1),
+                                               ('a3', 'a', 'normal', 1)], gate)
+        try:
+            await scheduler.run('a', gate.wait)
+            raise AssertionError("session queue limit not enforced")
+        except QueueFull as e:
+            assert e.retry_after >= 1
+        _, more = await _run_jobs(scheduler, [('b1', 'b', 'normal', 1)], gate)
+        try:
+            await scheduler.run('c', gate.wait)
+            raise AssertionError("global queue limit not enforced")
+        except QueueFull:
+            pass
+        gate.set()
+        await asyncio.gather(*tasks, *more)
+        assert scheduler.status()['normal'] == {"running": 0, "slots": 1, "queued": 0, "sessions_waiting": 0}
+
+    asyncio.run(scenario())
+
+
+def test_timed_out_query_keeps_slot_until_thread_returns():
+    async def scenario():
+        scheduler = FairScheduler(slots=1, fast_slots=1, session_running=1, max_queued=10, session_queued=10)
+        release = threading.Event()
+        try:
+            await scheduler.run('a', lambda: asyncio.wait_for(to_thread(release.wait), timeout=0.05))
+            raise AssertionError("query did not time out")
+        except asyncio.TimeoutError:
+            pass
+        # The thread still runs, so the next query waits for the slot
+        assert scheduler.status()['normal']['running'] == 1
+        started, tasks = await _run_jobs(scheduler, [('b1', 'b', 'normal', 1)], asyncio.Event())
+        assert started == []
+        release.set()
+        for _ in range(100):
+            if started:
+                break
+            await asyncio.sleep(0.01)
+        assert started == ['b1']
+        tasks[0].cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        assert scheduler.status()['normal']['running'] == 0
+        # Outside a slot it is plain asyncio.to_thread
+        assert await to_thread(sum, [1, 2]) == 3
+
+    asyncio.run(scenario())
+
+
+def main():
+    for test in (test_weighted_fair_order, test_fast_lane_and_session_quota, test_backpressure,
+                 test_timed_out_query_keeps_slot_until_thread_returns):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for request tracing (offline, no server needed).
+Run with pytest, or directly: python tests/test_tracing.py
+"""
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import app_client  # noqa: E402
+from app.utils.tracing import TracingMiddleware, span, trace_buffer  # noqa: E402
+
+
+def make_client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware)
+
+    @app.get("/work")
+    def work():
+        with span('step', kind='test'):
+            pass
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_client_trace_id_is_kept_once():
+    client = make_client()
+    trace_id = uuid.uuid4().hex
+    response = client.get("/work", headers={"x-trace-id": trace_id})
+    assert response.headers["x-trace-id"] == trace_id
+    first = trace_buffer.get(trace_id)
+    assert [s.name for s in first.spans] == ["GET /work", "step"]
+
+    # Reusing the id must not replace the stored trace
+    response = client.get("/work", headers={"x-trace-id": trace_id})
+    assert response.headers["x-trace-id"] != trace_id
+    assert trace_buffer.get(trace_id) is first
+
+
+def test_malformed_trace_id_is_replaced():
+    client = make_client()
+    for bad in ("not a trace id", "abc", "x" * 40, "0" * 65):
+        response = client.get("/work", headers={"x-trace-id": bad})
+        returned = response.headers["x-trace-id"]
+        assert returned != bad and trace_buffer.get(returned) is not None
+        assert trace_buffer.get(bad) is None
+
+
+def test_query_spans():
+    app_client.upload(app_client.adult(1200, tag='tracing'), 'tracing.csv')
+    client = app_client.client()
+    response = client.post("/api/query", json={"question": "What is the average hours per week by workclass?"})
+    trace_id = response.headers["x-trace-id"]
+    trace = client.get(f"/api/traces/{trace_id}").json()
+    spans = {s["name"]: s for s in trace["spans"]}
+    assert trace["tree"]["name"] == "POST /api/query" and trace["tree"]["attributes"]["http.status"] == 200
+    router_span = spans["router.query"]
+    assert router_span["parent_id"] == trace["tree"]["span_id"] and router_span["attributes"]["lane"] == 'normal'
+    for name in ("fast_path", "llm.call", "exec", "serialize"):
+        assert spans[name]["parent_id"] == router_span["span_id"] and spans[name]["finished"], name
+    assert spans["fast_path"]["attributes"]["hit"] is False
+    assert spans["llm.call"]["start_ms"] < spans["exec"]["start_ms"] < spans["serialize"]["start_ms"]
+
+    assert client.get("/api/traces", params={"limit": 1}).json()["traces"][0]["trace_id"] == trace_id
+    chrome = client.get(f"/api/traces/{trace_id}", params={"format": "chrome"}).json()
+    assert {event["name"] for event in chrome["traceEvents"]} == set(spans)
+    assert client.get(f"/api/traces/{'0' * 32}").status_code == 404
+
+
+def main():
+    for test in (test_client_trace_id_is_kept_once, test_malformed_trace_id_is_replaced, test_query_spans):
+        test()
+        print(f"   ✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()